@@ -0,0 +1,128 @@
+import cv2 as cv
+import numpy as np
+import pytest
+
+from vkit.image.type import VImage
+from vkit.augmentation.photometric_distortion import (
+    GaussianBlurConfig,
+    gaussian_blur,
+    MotionBlurConfig,
+    motion_blur,
+)
+from vkit.augmentation.photometric_distortion.blur import (
+    _GAUSSIAN_BLUR_BOX_CASCADE_MIN_KERNEL_SIZE,
+    generate_line_kernel,
+    filter_mat,
+)
+
+SHAPE = (300, 400)
+
+
+def create_noise_image():
+    mat = np.random.default_rng(0).integers(0, 256, (*SHAPE, 3)).astype(np.uint8)
+    return VImage(mat=mat)
+
+
+def create_edge_image():
+    mat = np.zeros((*SHAPE, 3), dtype=np.uint8)
+    mat[:, SHAPE[1] // 2:] = 255
+    mat[SHAPE[0] // 3:SHAPE[0] // 2] = 255
+    cv.circle(mat, (100, 200), 60, (128, 128, 128), -1)
+    return VImage(mat=mat)
+
+
+def create_symmetric_image():
+    # Symmetric under transposing and flipping.
+    size = 201
+    mat = np.random.default_rng(0).integers(0, 256, (size, size)).astype(np.uint8)
+    mat = cv.GaussianBlur(mat, (0, 0), 1.5)
+    mat = np.maximum(mat, mat.T)
+    mat = np.maximum(mat, np.fliplr(mat))
+    mat = np.maximum(mat, np.flipud(mat))
+    return VImage(mat=mat)
+
+
+def expected_gaussian_blur(image, sigma):
+    return cv.GaussianBlur(image.mat, (0, 0), sigmaX=sigma, borderType=cv.BORDER_REFLECT_101)
+
+
+@pytest.mark.parametrize('sigma', [0.5, 1.5, 2.0, 3.0])
+def test_gaussian_blur_separable(sigma):
+    image = create_noise_image()
+    result = gaussian_blur.distort_image(GaussianBlurConfig(sigma=sigma), image)
+    assert np.array_equal(result.mat, expected_gaussian_blur(image, sigma))
+
+
+@pytest.mark.parametrize('create_image', [create_noise_image, create_edge_image])
+@pytest.mark.parametrize(
+    'sigma',
+    [
+        # The switch-over.
+        (_GAUSSIAN_BLUR_BOX_CASCADE_MIN_KERNEL_SIZE - 1) / 6,
+        5.0,
+        8.0,
+        20.0,
+    ],
+)
+def test_gaussian_blur_box_cascade(create_image, sigma):
+    image = create_image()
+    result = gaussian_blur.distort_image(GaussianBlurConfig(sigma=sigma), image)
+    diff = np.abs(result.mat.astype(np.int32) - expected_gaussian_blur(image, sigma))
+    assert diff.max() <= 4
+    assert diff.mean() < 1
+
+
+@pytest.mark.parametrize('length', [5, 8, 25])
+def test_motion_blur_axis_aligned(length):
+    image = create_symmetric_image()
+    result_0 = motion_blur.distort_image(MotionBlurConfig(length=length, angle=0), image)
+    result_90 = motion_blur.distort_image(MotionBlurConfig(length=length, angle=90), image)
+    assert np.array_equal(result_0.mat.T, result_90.mat)
+
+    result_180 = motion_blur.distort_image(MotionBlurConfig(length=length, angle=180), image)
+    assert np.array_equal(result_0.mat, result_180.mat)
+
+    # The line kernel path, close to the 1D box.
+    for angle, result in ((0, result_0), (90, result_90)):
+        mat = filter_mat(image.mat, generate_line_kernel(length, angle))
+        diff = np.abs(mat.astype(np.int32) - result.mat)
+        assert diff.max() <= 5
+        assert diff.mean() < 1
+
+
+@pytest.mark.parametrize('length', [5, 8, 25])
+def test_motion_blur_oblique(length):
+    image = create_symmetric_image()
+
+    def distort(angle):
+        return motion_blur.distort_image(MotionBlurConfig(length=length, angle=angle), image).mat
+
+    # Transposing maps angle to 90 - angle, flipping maps angle to 180 - angle. Up to the rounding
+    # of the DFT based correlation.
+    diff = np.abs(distort(30).T.astype(np.int32) - distort(60))
+    assert diff.max() <= 1
+    diff = np.abs(np.fliplr(distort(45)).astype(np.int32) - distort(135))
+    assert diff.max() <= 1
+
+    # Close to the axis aligned paths.
+    for angle, axis_aligned_angle in ((1, 0), (89, 90)):
+        diff = np.abs(distort(angle).astype(np.int32) - distort(axis_aligned_angle))
+        assert diff.mean() < 1
+
+
+@pytest.mark.parametrize('angle', [0, 30, 90])
+def test_motion_blur_preserves_mean(angle):
+    image = create_noise_image()
+    result = motion_blur.distort_image(MotionBlurConfig(length=15, angle=angle), image)
+    assert abs(result.mat.mean() - image.mat.mean()) < 0.5
+
+
+@pytest.mark.parametrize('length', [1, 2, 5, 8, 25])
+@pytest.mark.parametrize('angle', [0, 30, 45, 90, 120])
+def test_line_kernel(length, angle):
+    kernel = generate_line_kernel(length, angle)
+    assert kernel.shape[0] == kernel.shape[1]
+    assert kernel.shape[0] % 2 == 1
+    assert abs(kernel.sum() - 1) < 1e-5
+    # Centered.
+    assert np.allclose(kernel, kernel[::-1, ::-1], atol=1e-6)
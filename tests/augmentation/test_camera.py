@@ -0,0 +1,151 @@
+import attr
+import cv2 as cv
+import numpy as np
+import pytest
+
+from vkit.image.type import VImage
+from vkit.label.type import VPoint, VPointList, VPolygon, VImageMask, VImageScoreMap
+from vkit.augmentation.geometric_distortion import (
+    CameraModelConfig,
+    CameraCubicCurveConfig,
+    camera_cubic_curve,
+    CameraPlaneLineFoldConfig,
+    camera_plane_line_fold,
+    CameraPlaneLineCurveConfig,
+    camera_plane_line_curve,
+)
+
+SHAPE = (300, 400)
+
+DISTORTIONS_AND_CONFIGS = [
+    (
+        camera_cubic_curve,
+        CameraCubicCurveConfig(
+            curve_alpha=60,
+            curve_beta=-60,
+            curve_direction=45,
+            curve_scale=1.0,
+            camera_model_config=CameraModelConfig(
+                rotation_unit_vec=[1.0, 0, 0],
+                rotation_theta=20,
+            ),
+            grid_size=10,
+        ),
+    ),
+    (
+        camera_plane_line_fold,
+        CameraPlaneLineFoldConfig(
+            fold_point=(200, 150),
+            fold_direction=30,
+            fold_perturb_vec=(50, 0, 200),
+            fold_alpha=0.5,
+            camera_model_config=CameraModelConfig(
+                rotation_unit_vec=[1.0, 0, 0],
+                rotation_theta=30,
+            ),
+            grid_size=10,
+        ),
+    ),
+    (
+        camera_plane_line_curve,
+        CameraPlaneLineCurveConfig(
+            curve_point=(200, 150),
+            curve_direction=0,
+            curve_perturb_vec=(0, 0, 300),
+            curve_alpha=2,
+            camera_model_config=CameraModelConfig(
+                rotation_unit_vec=[0.0, 1.0, 0],
+                rotation_theta=30,
+            ),
+            grid_size=10,
+        ),
+    ),
+]
+
+
+def sample_np_src_points(num_points=500):
+    rnd = np.random.RandomState(0)
+    height, width = SHAPE
+    return np.stack(
+        [rnd.uniform(10, width - 10, num_points),
+         rnd.uniform(10, height - 10, num_points)],
+        axis=1,
+    )
+
+
+@pytest.mark.parametrize('distortion,config', DISTORTIONS_AND_CONFIGS)
+def test_unproject_np_2d_points_round_trip(distortion, config):
+    state = distortion.generate_state(config, SHAPE)
+    point_projector = state.point_projector
+
+    np_src_points = sample_np_src_points()
+    np_dst_points = point_projector.project_np_2d_points(np_src_points)
+    np_unprojected_points, residuals = point_projector.unproject_np_2d_points(np_dst_points)
+
+    assert (residuals <= 0.05).all()
+    assert np.abs(np_unprojected_points - np_src_points).max() < 0.1
+
+
+@pytest.mark.parametrize('enable_dense_map', [False, True])
+@pytest.mark.parametrize('distortion,config', DISTORTIONS_AND_CONFIGS)
+def test_inverse_distort_points_round_trip(distortion, config, enable_dense_map):
+    config = attr.evolve(config, enable_dense_map=enable_dense_map)
+    state = distortion.generate_state(config, SHAPE)
+
+    points = VPointList(VPoint(y=y, x=x) for x, y in sample_np_src_points())
+    dst_points = distortion.distort_points(config, SHAPE, points, state=state)
+    src_points = distortion.inverse_distort_points(config, SHAPE, dst_points, state=state)
+
+    errors = np.abs(src_points.to_np_array() - points.to_np_array())
+    # The points are rounded in both directions.
+    assert errors.max() <= 2
+
+
+@pytest.mark.parametrize('distortion,config', DISTORTIONS_AND_CONFIGS)
+def test_enable_dense_map_same_as_grid(distortion, config):
+    mat = np.random.RandomState(0).randint(0, 256, (*SHAPE, 3)).astype(np.uint8)
+    image = VImage(mat=cv.GaussianBlur(mat, (0, 0), 2))
+    polygon = VPolygon(
+        VPointList([
+            VPoint(y=50, x=50),
+            VPoint(y=50, x=300),
+            VPoint(y=250, x=300),
+            VPoint(y=250, x=50),
+        ])
+    )
+    image_mask = VImageMask.from_image_and_polygons(image, [polygon])
+    image_score_map = VImageScoreMap.from_image_and_polygon_value_pairs(image, [(polygon, 1.0)])
+
+    grid_result, dense_result = [
+        distortion.distort(
+            attr.evolve(config, enable_dense_map=enable_dense_map),
+            image,
+            image_mask=image_mask,
+            image_score_map=image_score_map,
+            polygon=polygon,
+            get_active_image_mask=True,
+        ) for enable_dense_map in (False, True)
+    ]
+
+    assert grid_result.active_image_mask and dense_result.active_image_mask
+    assert grid_result.active_image_mask.shape == dense_result.active_image_mask.shape
+    # Only the border pixels.
+    assert (grid_result.active_image_mask.mat != dense_result.active_image_mask.mat).mean() < 0.01
+
+    assert grid_result.image and dense_result.image
+    active_mat = grid_result.active_image_mask.mat.astype(np.uint8)
+    active_mat = cv.erode(active_mat, np.ones((5, 5), dtype=np.uint8)) > 0
+    diff = np.abs(grid_result.image.mat.astype(np.int32) - dense_result.image.mat)[active_mat]
+    assert diff.mean() < 2
+    # The grid polygons are only approximated by perspective transforms, e.g., around a fold.
+    assert np.percentile(diff, 99) < 10
+
+    assert grid_result.image_mask and dense_result.image_mask
+    assert (grid_result.image_mask.mat != dense_result.image_mask.mat).mean() < 0.01
+
+    assert grid_result.image_score_map and dense_result.image_score_map
+    assert np.abs(grid_result.image_score_map.mat - dense_result.image_score_map.mat).mean() < 0.01
+
+    assert grid_result.polygon and dense_result.polygon
+    diff = np.abs(grid_result.polygon.to_np_array() - dense_result.polygon.to_np_array())
+    assert diff.max() <= 1
@@ -0,0 +1,68 @@
+import numpy as np
+import cv2 as cv
+import pytest
+
+from vkit.image.type import VImage
+from vkit.augmentation.photometric_distortion import (
+    HueShiftConfig,
+    hue_shift,
+    SaturationShiftConfig,
+    saturation_shift,
+)
+
+
+def create_rgb_images():
+    rnd = np.random.RandomState(0)
+    return [
+        VImage(mat=rnd.randint(0, 256, (100, 100, 3)).astype(np.uint8)),
+        # Smooth colors.
+        VImage(
+            mat=cv.resize(
+                rnd.randint(0, 256, (8, 8, 3)).astype(np.uint8),
+                (100, 100),
+                interpolation=cv.INTER_CUBIC,
+            )
+        ),
+    ]
+
+
+@pytest.mark.parametrize('delta', [-100, -40, 40, 100])
+def test_rgb_saturation_shift_close_to_hsv(delta):
+    config = SaturationShiftConfig(delta)
+    for image in create_rgb_images():
+        hsv_image = image.to_hsv_image()
+        hsv_result = saturation_shift.distort_image(config, hsv_image)
+        rgb_result = saturation_shift.distort_image(config, image)
+        assert rgb_result.kind == image.kind
+
+        hsv_mean_delta = hsv_result.mat[:, :, 1].mean() - hsv_image.mat[:, :, 1].mean()
+        rgb_mean_delta = rgb_result.to_hsv_image().mat[:, :, 1].mean() - hsv_image.mat[:, :,
+                                                                                       1].mean()
+        assert abs(rgb_mean_delta - hsv_mean_delta) < 15
+
+
+def test_rgb_saturation_shift_to_grayscale():
+    for image in create_rgb_images():
+        mat = saturation_shift.distort_image(SaturationShiftConfig(-255),
+                                             image).mat.astype(np.int32)
+        assert (mat.max(axis=2) - mat.min(axis=2)).max() <= 1
+
+
+@pytest.mark.parametrize('delta', [10, 30, 64, -64, 128])
+def test_rgb_hue_shift_close_to_hsv(delta):
+    config = HueShiftConfig(delta)
+    for image in create_rgb_images():
+        hsv_image = image.to_hsv_image()
+        rgb_result = hue_shift.distort_image(config, image)
+        assert rgb_result.kind == image.kind
+
+        # The hue is undefined for the gray pixels.
+        saturated_mask = hsv_image.mat[:, :, 1] > 64
+        hue_deviations = (
+            rgb_result.to_hsv_image().mat[:, :, 0].astype(np.int32) - hsv_image.mat[:, :, 0] - delta
+            + 128
+        ) % 256 - 128
+        hue_deviations = hue_deviations[saturated_mask]
+        # In the unit of 256 for 360 degrees.
+        assert abs(np.median(hue_deviations)) <= 5
+        assert np.abs(hue_deviations).mean() <= 12
@@ -0,0 +1,90 @@
+import cv2 as cv
+import numpy as np
+
+from vkit.image.type import VImage
+from vkit.label.type import VPoint, VPointList
+from vkit.augmentation.geometric_distortion import ElasticConfig, elastic
+
+SHAPE = (300, 400)
+
+CONFIG = ElasticConfig(alpha=8, sigma=40, grid_size=10)
+
+
+def create_points():
+    ys, xs = np.mgrid[30:280:40, 30:380:40]
+    return VPointList(VPoint(y=int(y), x=int(x)) for y, x in zip(ys.ravel(), xs.ravel()))
+
+
+def create_image():
+    mat = np.random.RandomState(0).randint(0, 256, (*SHAPE, 3)).astype(np.uint8)
+    return VImage(mat=cv.GaussianBlur(mat, (0, 0), 2))
+
+
+def test_elastic_deterministic():
+    image = create_image()
+    points = create_points()
+
+    result = elastic.distort(
+        CONFIG,
+        image,
+        points=points,
+        rnd=np.random.RandomState(0),
+        get_config=True,
+    )
+    same_seed_result = elastic.distort(CONFIG, image, points=points, rnd=np.random.RandomState(0))
+    assert result.image and same_seed_result.image
+    assert np.array_equal(result.image.mat, same_seed_result.image.mat)
+    assert result.points and same_seed_result.points
+    assert np.array_equal(result.points.to_np_array(), same_seed_result.points.to_np_array())
+
+    # Replayed by config.rnd_state, without rnd.
+    assert result.config and result.config.rnd_state
+    replayed_result = elastic.distort(result.config, image, points=points)
+    assert replayed_result.image
+    assert np.array_equal(result.image.mat, replayed_result.image.mat)
+
+    other_seed_result = elastic.distort(CONFIG, image, points=points, rnd=np.random.RandomState(1))
+    assert other_seed_result.image
+    assert other_seed_result.image.shape != result.image.shape \
+        or not np.array_equal(other_seed_result.image.mat, result.image.mat)
+
+
+def test_elastic_displacement_bounded():
+    for seed in range(5):
+        state = elastic.generate_state(CONFIG, SHAPE, np.random.RandomState(seed))
+        np_src_points = create_points().to_np_array().astype(np.float64)
+        np_dst_points = state.point_projector.project_np_points(np_src_points)
+        displacements = np.abs(np_dst_points - np_src_points)
+        assert displacements.max() <= CONFIG.alpha + 1e-3
+        # Not degenerated to the identity.
+        assert displacements.max() > CONFIG.alpha / 4
+
+
+def test_elastic_point_same_as_image():
+    # Draw a dot for each point, the dot should be warped to the distorted point.
+    points = create_points()
+    mat = np.zeros(SHAPE, dtype=np.uint8)
+    for point in points:
+        cv.circle(mat, (point.x, point.y), 3, 255, -1)
+
+    radius = 8
+    for seed in range(3):
+        result = elastic.distort(
+            CONFIG,
+            VImage(mat=mat),
+            points=points,
+            rnd=np.random.RandomState(seed),
+        )
+        assert result.image and result.points
+
+        offset_ys, offset_xs = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+        for point in result.points:
+            up = point.y - radius
+            left = point.x - radius
+            window_mat = result.image.mat[up:up + 2 * radius + 1, left:left + 2 * radius + 1]
+            window_mat = window_mat.astype(np.float64)
+            total = window_mat.sum()
+            assert total > 0
+            # The centroid of the dot, the point is rounded.
+            assert abs((window_mat * offset_ys).sum() / total) <= 1
+            assert abs((window_mat * offset_xs).sum() / total) <= 1
@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+
+from vkit.image.type import VImage
+from vkit.label.type import VPoint, VPointList, VPolygon, VImageMask, VImageScoreMap
+from vkit.augmentation.geometric_distortion import (
+    RotateConfig,
+    rotate,
+    ShearHoriConfig,
+    shear_hori,
+    SkewVertConfig,
+    skew_vert,
+    SimilarityMlsConfig,
+    similarity_mls,
+    CameraModelConfig,
+    CameraCubicCurveConfig,
+    camera_cubic_curve,
+    ElasticConfig,
+    elastic,
+)
+
+DISTORTIONS_AND_CONFIGS = [
+    (rotate, RotateConfig(30)),
+    (shear_hori, ShearHoriConfig(20)),
+    (skew_vert, SkewVertConfig(0.2)),
+    (
+        similarity_mls,
+        SimilarityMlsConfig(
+            src_handle_points=[
+                VPoint(y=10, x=10),
+                VPoint(y=10, x=200),
+                VPoint(y=200, x=200),
+                VPoint(y=200, x=10),
+            ],
+            dst_handle_points=[
+                VPoint(y=10, x=10),
+                VPoint(y=10, x=350),
+                VPoint(y=200, x=150),
+                VPoint(y=200, x=10),
+            ],
+            grid_size=20,
+        ),
+    ),
+    (
+        camera_cubic_curve,
+        CameraCubicCurveConfig(
+            curve_alpha=60,
+            curve_beta=-60,
+            curve_direction=45,
+            curve_scale=1.0,
+            camera_model_config=CameraModelConfig(
+                rotation_unit_vec=[1.0, 0, 0],
+                rotation_theta=20,
+            ),
+            grid_size=10,
+        ),
+    ),
+    (elastic, ElasticConfig(alpha=10, sigma=30, grid_size=10)),
+]
+
+
+def create_image_and_labels():
+    mat = np.random.RandomState(0).randint(0, 256, (300, 400, 3)).astype(np.uint8)
+    image = VImage(mat=mat)
+    polygon = VPolygon(
+        VPointList([
+            VPoint(y=50, x=50),
+            VPoint(y=50, x=200),
+            VPoint(y=200, x=200),
+            VPoint(y=200, x=50),
+        ])
+    )
+    image_mask = VImageMask.from_image_and_polygons(image, [polygon])
+    image_score_map = VImageScoreMap.from_image_and_polygon_value_pairs(image, [(polygon, 1.0)])
+    return image, image_mask, image_score_map
+
+
+@pytest.mark.parametrize('distortion,config', DISTORTIONS_AND_CONFIGS)
+def test_multi_target_same_as_separate(distortion, config):
+    image, image_mask, image_score_map = create_image_and_labels()
+    rnd = np.random.RandomState(0)
+    state = distortion.distort(config, image, get_state=True, rnd=rnd).state
+
+    result = distortion.distort(
+        config,
+        image,
+        image_mask=image_mask,
+        image_score_map=image_score_map,
+        get_active_image_mask=True,
+        state=state,
+        rnd=rnd,
+    )
+    assert result.image and result.image_mask and result.image_score_map
+    assert result.active_image_mask
+
+    image_expected = distortion.distort_image(config, image, state=state, rnd=rnd)
+    assert (result.image.mat == image_expected.mat).all()
+
+    image_mask_expected = distortion.distort_image_mask(config, image_mask, state=state, rnd=rnd)
+    assert (result.image_mask.mat == image_mask_expected.mat).all()
+
+    image_score_map_expected = distortion.distort_image_score_map(
+        config,
+        image_score_map,
+        state=state,
+        rnd=rnd,
+    )
+    assert result.image_score_map.mat.dtype == image_score_map_expected.mat.dtype
+    assert (result.image_score_map.mat == image_score_map_expected.mat).all()
+
+    active_image_mask_expected = distortion.get_active_image_mask(
+        config, image, state=state, rnd=rnd
+    )
+    assert (result.active_image_mask.mat == active_image_mask_expected.mat).all()
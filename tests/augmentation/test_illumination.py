@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from vkit.image.type import VImage, VImageKind
+from vkit.augmentation.photometric_distortion import (
+    IlluminationConfig,
+    illumination,
+)
+from vkit.augmentation.photometric_distortion.illumination import (
+    get_field_shape,
+    generate_illumination_field,
+)
+
+SHAPE = (300, 400)
+
+CONFIGS = [
+    IlluminationConfig(polynomial_strength=0.4),
+    IlluminationConfig(vignette_strength=0.6),
+    IlluminationConfig(num_shadows=3, shadow_strength=0.5),
+    IlluminationConfig(
+        polynomial_strength=0.3,
+        vignette_strength=0.5,
+        num_shadows=2,
+        shadow_strength=0.7,
+    ),
+]
+
+
+def get_gain_bounds(config: IlluminationConfig):
+    lower_bound = (1 - config.polynomial_strength) * (1 - config.vignette_strength)
+    if config.num_shadows > 0:
+        lower_bound *= 1 - config.shadow_strength
+    upper_bound = 1 + config.polynomial_strength
+    return lower_bound, upper_bound
+
+
+@pytest.mark.parametrize('config', CONFIGS)
+@pytest.mark.parametrize('kind', [VImageKind.GRAYSCALE, VImageKind.RGB])
+def test_illumination_shape_and_kind(config, kind):
+    shape = SHAPE if kind == VImageKind.GRAYSCALE else (*SHAPE, 3)
+    mat = np.random.default_rng(0).integers(0, 256, shape).astype(np.uint8)
+    image = VImage(mat=mat, kind=kind)
+
+    result = illumination.distort_image(config, image, np.random.RandomState(0))
+    assert result.kind == kind
+    assert result.mat.shape == mat.shape
+    assert result.mat.dtype == np.uint8
+
+    # Deterministic under rnd.
+    other_result = illumination.distort_image(config, image, np.random.RandomState(0))
+    assert np.array_equal(result.mat, other_result.mat)
+
+
+@pytest.mark.parametrize('config', CONFIGS)
+def test_illumination_field_within_gain_bounds(config):
+    lower_bound, upper_bound = get_gain_bounds(config)
+    for seed in range(10):
+        field = generate_illumination_field(config, SHAPE, np.random.RandomState(seed))
+        assert field.shape == get_field_shape(config, SHAPE)
+        assert field.dtype == np.float32
+        assert field.min() >= lower_bound - 1e-5
+        assert field.max() <= upper_bound + 1e-5
+        # Not flat.
+        assert field.max() - field.min() > 0.05
+
+
+@pytest.mark.parametrize('config', CONFIGS)
+@pytest.mark.parametrize('kind', [VImageKind.GRAYSCALE, VImageKind.RGB])
+def test_illumination_gain_within_bounds(config, kind):
+    shape = SHAPE if kind == VImageKind.GRAYSCALE else (*SHAPE, 3)
+    image = VImage(mat=np.full(shape, 100, dtype=np.uint8), kind=kind)
+    result = illumination.distort_image(config, image, np.random.RandomState(0))
+
+    lower_bound, upper_bound = get_gain_bounds(config)
+    gain = result.mat.astype(np.float32) / 100
+    # Up to the rounding.
+    assert gain.min() >= lower_bound - 0.01
+    assert gain.max() <= upper_bound + 0.01
+    if kind == VImageKind.RGB:
+        # The same gain for all channels.
+        assert (result.mat == result.mat[:, :, :1]).all()
+
+
+def test_illumination_saturated():
+    image = VImage(mat=np.full((*SHAPE, 3), 250, dtype=np.uint8))
+    config = IlluminationConfig(polynomial_strength=0.4)
+    result = illumination.distort_image(config, image, np.random.RandomState(0))
+    # Saturated instead of wrapping around.
+    assert result.mat.max() == 255
+    assert result.mat.min() >= 250 * 0.6 - 1
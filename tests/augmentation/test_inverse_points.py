@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from vkit.label.type import VPoint, VPointList
+from vkit.augmentation.geometric_distortion import (
+    RotateConfig,
+    rotate,
+    ShearHoriConfig,
+    shear_hori,
+    SkewVertConfig,
+    skew_vert,
+    SimilarityMlsConfig,
+    similarity_mls,
+    ElasticConfig,
+    elastic,
+)
+
+SHAPE = (300, 400)
+
+DISTORTIONS_AND_CONFIGS = [
+    (rotate, RotateConfig(30)),
+    (shear_hori, ShearHoriConfig(20)),
+    (skew_vert, SkewVertConfig(0.2)),
+    (
+        similarity_mls,
+        SimilarityMlsConfig(
+            src_handle_points=[
+                VPoint(y=10, x=10),
+                VPoint(y=10, x=200),
+                VPoint(y=200, x=200),
+                VPoint(y=200, x=10),
+            ],
+            dst_handle_points=[
+                VPoint(y=10, x=10),
+                VPoint(y=10, x=350),
+                VPoint(y=200, x=150),
+                VPoint(y=200, x=10),
+            ],
+            grid_size=20,
+        ),
+    ),
+    (elastic, ElasticConfig(alpha=10, sigma=30, grid_size=10)),
+]
+
+
+def sample_points(num_points=1000):
+    rnd = np.random.RandomState(0)
+    height, width = SHAPE
+    return VPointList(
+        VPoint(y=y, x=x) for y, x in zip(
+            rnd.randint(5, height - 5, num_points),
+            rnd.randint(5, width - 5, num_points),
+        )
+    )
+
+
+@pytest.mark.parametrize('distortion,config', DISTORTIONS_AND_CONFIGS)
+def test_inverse_distort_points_round_trip(distortion, config):
+    rnd = np.random.RandomState(0)
+    state = distortion.generate_state(config, SHAPE, rnd=rnd)
+
+    points = sample_points()
+    dst_points = distortion.distort_points(config, SHAPE, points, state=state, rnd=rnd)
+    src_points = distortion.inverse_distort_points(config, SHAPE, dst_points, state=state, rnd=rnd)
+
+    errors = np.abs(src_points.to_np_array() - points.to_np_array())
+    # The points are rounded in both directions.
+    assert errors.max() <= 2
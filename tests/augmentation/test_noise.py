@@ -0,0 +1,126 @@
+import numpy as np
+import pytest
+
+from vkit.image.type import VImage
+from vkit.augmentation.photometric_distortion import (
+    NoiseBank,
+    GaussionNoiseConfig,
+    gaussion_noise,
+    PoissonNoiseConfig,
+    poisson_noise,
+    ImpulseNoiseConfig,
+    impulse_noise,
+)
+from vkit.augmentation.photometric_distortion.noise import (
+    _use_dense_impulse_noise,
+    _sample_distinct_indices,
+)
+
+SHAPE = (500, 600)
+
+
+@pytest.mark.parametrize('std', [1.0, 5.0, 20.0])
+@pytest.mark.parametrize('use_noise_bank', [False, True])
+def test_gaussion_noise_std(std, use_noise_bank):
+    image = VImage(mat=np.full(SHAPE, 128, dtype=np.uint8))
+    noise_bank = NoiseBank(texture_height=512, texture_width=640) if use_noise_bank else None
+    config = GaussionNoiseConfig(std=std, noise_bank=noise_bank)
+    mat = gaussion_noise.distort_image(config, image, rnd=np.random.RandomState(0)).mat
+    noise = mat.astype(np.float64) - 128
+
+    assert abs(noise.mean()) < 0.05 * std
+    # The noise is rounded, which adds 1/12 to the variance.
+    assert abs(noise.var() / (std**2 + 1 / 12) - 1) < 0.03
+
+
+@pytest.mark.parametrize('offset', [-10, -1, 0, 1, 10])
+def test_poisson_noise_around_gaussian_approximation_threshold(offset):
+    config = PoissonNoiseConfig()
+    lam = config.gaussian_approximation_threshold + offset
+    image = VImage(mat=np.full(SHAPE, lam, dtype=np.uint8))
+    mat = poisson_noise.distort_image(config, image, rnd=np.random.RandomState(0)).mat
+    samples = mat.astype(np.float64)
+
+    # Both the exact sampling and the gaussian approximation keep mean = variance = lambda.
+    assert abs(samples.mean() - lam) < 0.05
+    assert abs(samples.var() / lam - 1) < 0.03
+
+
+@pytest.mark.parametrize('lam', [2, 5, 100])
+def test_poisson_noise_mean_and_variance(lam):
+    image = VImage(mat=np.full((*SHAPE, 3), lam, dtype=np.uint8))
+    mat = poisson_noise.distort_image(
+        PoissonNoiseConfig(),
+        image,
+        rnd=np.random.RandomState(0),
+    ).mat
+    samples = mat.astype(np.float64)
+    assert abs(samples.mean() - lam) < 0.05
+    assert abs(samples.var() / lam - 1) < 0.03
+
+
+@pytest.mark.parametrize(
+    'prob_salt,prob_pepper',
+    [
+        # Sparse.
+        (0.01, 0.005),
+        (0.002, 0.02),
+        # Dense.
+        (0.1, 0.05),
+        (0.02, 0.2),
+    ],
+)
+def test_impulse_noise_counts(prob_salt, prob_pepper):
+    image = VImage(mat=np.full((*SHAPE, 3), 128, dtype=np.uint8))
+    config = ImpulseNoiseConfig(prob_salt=prob_salt, prob_pepper=prob_pepper)
+    num_pixels = SHAPE[0] * SHAPE[1]
+
+    num_salts = []
+    num_peppers = []
+    for seed in range(5):
+        mat = impulse_noise.distort_image(config, image, rnd=np.random.RandomState(seed)).mat
+        # All channels of a pixel are corrupted together.
+        assert (mat == mat[:, :, :1]).all()
+        mat = mat[:, :, 0]
+        assert ((mat == 0) | (mat == 128) | (mat == 255)).all()
+        num_salts.append(int((mat == 255).sum()))
+        num_peppers.append(int((mat == 0).sum()))
+
+        # Spread over the whole image.
+        corrupted_mat = (mat != 128)
+        half_height = SHAPE[0] // 2
+        half_width = SHAPE[1] // 2
+        for quarter_mat in (
+            corrupted_mat[:half_height, :half_width],
+            corrupted_mat[:half_height, half_width:],
+            corrupted_mat[half_height:, :half_width],
+            corrupted_mat[half_height:, half_width:],
+        ):
+            assert abs(quarter_mat.mean() - (prob_salt + prob_pepper)) \
+                < 0.2 * (prob_salt + prob_pepper)
+
+    # Within 5 standard deviations of the multinomial distribution.
+    for num, prob in ((num_salts, prob_salt), (num_peppers, prob_pepper)):
+        std = np.sqrt(num_pixels * prob * (1 - prob))
+        for num_corrupted in num:
+            assert abs(num_corrupted - num_pixels * prob) < 5 * std
+
+    ratio = sum(num_salts) / sum(num_peppers)
+    assert abs(ratio / (prob_salt / prob_pepper) - 1) < 0.1
+
+
+def test_impulse_noise_dense_switch():
+    assert not _use_dense_impulse_noise(ImpulseNoiseConfig(prob_salt=0.01, prob_pepper=0.02))
+    assert _use_dense_impulse_noise(ImpulseNoiseConfig(prob_salt=0.05, prob_pepper=0.05))
+
+
+@pytest.mark.parametrize('num_indices,size', [(1, 1), (10, 10), (100, 37), (300000, 15000)])
+def test_sample_distinct_indices(num_indices, size):
+    generator = np.random.default_rng(0)
+    indices = _sample_distinct_indices(num_indices, size, generator)
+    assert indices.shape == (size,)
+    assert np.unique(indices).size == size
+    assert indices.min() >= 0 and indices.max() < num_indices
+    # Shuffled, not sorted.
+    if size > 10:
+        assert (np.diff(indices) < 0).any()
@@ -0,0 +1,96 @@
+import numpy as np
+
+from vkit.image.type import VImage
+from vkit.augmentation.photometric_distortion import (
+    NoiseBank,
+    GaussionNoiseConfig,
+    gaussion_noise,
+    SpeckleNoiseConfig,
+    speckle_noise,
+    BlotchNoiseConfig,
+    blotch_noise,
+)
+
+
+def create_image():
+    mat = np.random.default_rng(0).integers(0, 256, (64, 96, 3), dtype=np.uint8)
+    return VImage(mat=mat)
+
+
+def test_noise_bank_shared_by_std():
+    noise_bank = NoiseBank(texture_height=128, texture_width=512, num_textures=2)
+    image = create_image()
+    rnd = np.random.RandomState(0)
+    for std in rnd.uniform(1, 50, 20):
+        gaussion_noise.distort_image(
+            GaussionNoiseConfig(std=std, noise_bank=noise_bank),
+            image,
+            rnd,
+        )
+        speckle_noise.distort_image(
+            SpeckleNoiseConfig(std=std / 100, noise_bank=noise_bank),
+            image,
+            rnd,
+        )
+    assert len(noise_bank.key_to_textures) == 1
+
+
+def test_noise_bank_lru():
+    noise_bank = NoiseBank(texture_height=64, texture_width=256, num_textures=1, max_num_keys=2)
+    image = create_image()
+    for blotch_size in (4, 8, 16, 8):
+        blotch_noise.distort_image(
+            BlotchNoiseConfig(std=10, blotch_size=blotch_size, noise_bank=noise_bank),
+            image,
+            np.random.RandomState(0),
+        )
+    assert list(noise_bank.key_to_textures) == [('blotch', 16), ('blotch', 8)]
+
+
+def test_noise_bank_scaled_by_std():
+    noise_bank = NoiseBank(texture_height=128, texture_width=512, num_textures=2)
+    image = VImage(mat=np.full((64, 96), 128, dtype=np.uint8))
+
+    stds = []
+    for std in (2.0, 20.0):
+        result = gaussion_noise.distort_image(
+            GaussionNoiseConfig(std=std, noise_bank=noise_bank),
+            image,
+            np.random.RandomState(0),
+        )
+        stds.append(result.mat.astype(np.float32).std())
+    assert 5 < stds[1] / stds[0] < 15
+
+
+def get_max_periodic_step(mat):
+    # Including the steps across the borders, as if tiled.
+    return max(
+        np.abs(np.diff(mat, axis=0, append=mat[:1])).max(),
+        np.abs(np.diff(mat, axis=1, append=mat[:, :1])).max(),
+    )
+
+
+def test_noise_bank_tiled_without_seam():
+    noise_bank = NoiseBank(texture_height=100, texture_width=150, num_textures=1)
+    textures = noise_bank.get_blotch_textures(16)
+    texture = textures[0].astype(np.float32)
+    # Rounded up to the multiple of blotch_size.
+    assert texture.shape == (112, 160)
+
+    # The steps across the texture borders are as small as the inner ones.
+    inner_max_step = max(
+        np.abs(np.diff(texture, axis=0)).max(),
+        np.abs(np.diff(texture, axis=1)).max(),
+    )
+    assert get_max_periodic_step(texture) <= inner_max_step * 1.5
+
+    # Tiled several times.
+    rnd = np.random.RandomState(0)
+    for _ in range(8):
+        noise = NoiseBank.sample_noise(textures, (500, 300), rnd).astype(np.float32)
+        assert noise.shape == (500, 300)
+        max_step = max(
+            np.abs(np.diff(noise, axis=0)).max(),
+            np.abs(np.diff(noise, axis=1)).max(),
+        )
+        assert max_step <= get_max_periodic_step(texture)
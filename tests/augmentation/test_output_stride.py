@@ -0,0 +1,156 @@
+import math
+
+import numpy as np
+import pytest
+
+from vkit.image.type import VImage
+from vkit.label.type import VPoint, VPointList, VPolygon, VImageMask, VImageScoreMap
+from vkit.augmentation.geometric_distortion import (
+    RotateConfig,
+    rotate,
+    SimilarityMlsConfig,
+    similarity_mls,
+    CameraModelConfig,
+    CameraCubicCurveConfig,
+    camera_cubic_curve,
+    DistortionTemplate,
+    DistortionTemplateConfig,
+    distortion_template,
+)
+
+SHAPE = (300, 400)
+
+DISTORTIONS_AND_CONFIGS = [
+    (rotate, RotateConfig(30)),
+    (
+        similarity_mls,
+        SimilarityMlsConfig(
+            src_handle_points=[
+                VPoint(y=10, x=10),
+                VPoint(y=10, x=200),
+                VPoint(y=200, x=200),
+                VPoint(y=200, x=10),
+            ],
+            dst_handle_points=[
+                VPoint(y=10, x=10),
+                VPoint(y=10, x=350),
+                VPoint(y=200, x=150),
+                VPoint(y=200, x=10),
+            ],
+            grid_size=20,
+        ),
+    ),
+    (
+        camera_cubic_curve,
+        CameraCubicCurveConfig(
+            curve_alpha=60,
+            curve_beta=-60,
+            curve_direction=45,
+            curve_scale=1.0,
+            camera_model_config=CameraModelConfig(
+                rotation_unit_vec=[1.0, 0, 0],
+                rotation_theta=20,
+            ),
+            grid_size=10,
+        ),
+    ),
+]
+
+
+def create_image_and_labels():
+    mat = np.random.RandomState(0).randint(0, 256, (*SHAPE, 3)).astype(np.uint8)
+    image = VImage(mat=mat)
+    polygon = VPolygon(
+        VPointList([
+            VPoint(y=50, x=50),
+            VPoint(y=50, x=250),
+            VPoint(y=250, x=250),
+            VPoint(y=250, x=50),
+        ])
+    )
+    image_mask = VImageMask.from_image_and_polygons(image, [polygon])
+    image_score_map = VImageScoreMap.from_image_and_polygon_value_pairs(image, [(polygon, 1.0)])
+    return image, image_mask, image_score_map
+
+
+def check_strided_result(result, expected, image_mask_output_stride, image_score_map_output_stride):
+    assert result.image and expected.image
+    assert np.array_equal(result.image.mat, expected.image.mat)
+
+    height, width = expected.image.shape
+    assert result.image_mask and expected.image_mask
+    assert result.image_mask.shape == (
+        math.ceil(height / image_mask_output_stride),
+        math.ceil(width / image_mask_output_stride),
+    )
+    expected_image_mask = expected.image_mask.to_rescaled_image_mask(*result.image_mask.shape)
+    # Only the border pixels.
+    assert (result.image_mask.mat != expected_image_mask.mat).mean() < 0.02
+
+    assert result.image_score_map and expected.image_score_map
+    assert result.image_score_map.shape == (
+        math.ceil(height / image_score_map_output_stride),
+        math.ceil(width / image_score_map_output_stride),
+    )
+    expected_image_score_map = expected.image_score_map.to_rescaled_image_score_map(
+        *result.image_score_map.shape
+    )
+    assert np.abs(result.image_score_map.mat - expected_image_score_map.mat).mean() < 0.02
+
+
+@pytest.mark.parametrize('distortion,config', DISTORTIONS_AND_CONFIGS)
+def test_output_stride(distortion, config):
+    image, image_mask, image_score_map = create_image_and_labels()
+    state = distortion.generate_state(config, SHAPE)
+    expected = distortion.distort(
+        config,
+        image,
+        image_mask=image_mask,
+        image_score_map=image_score_map,
+        state=state,
+    )
+    for image_mask_output_stride, image_score_map_output_stride in ((2, 4), (4, 1), (1, 3)):
+        result = distortion.distort(
+            config,
+            image,
+            image_mask=image_mask,
+            image_score_map=image_score_map,
+            image_mask_output_stride=image_mask_output_stride,
+            image_score_map_output_stride=image_score_map_output_stride,
+            state=state,
+        )
+        check_strided_result(
+            result,
+            expected,
+            image_mask_output_stride,
+            image_score_map_output_stride,
+        )
+
+
+def test_output_stride_without_output_window():
+    # Rendered in full resolution and then downscaled.
+    image, image_mask, image_score_map = create_image_and_labels()
+    _, config = DISTORTIONS_AND_CONFIGS[-1]
+    state = camera_cubic_curve.generate_state(config, SHAPE)
+    template_config = DistortionTemplateConfig(template=DistortionTemplate.from_state(state))
+    assert distortion_template.func_apply_output_window is None
+
+    expected = distortion_template.distort(
+        template_config,
+        image,
+        image_mask=image_mask,
+        image_score_map=image_score_map,
+    )
+    result = distortion_template.distort(
+        template_config,
+        image,
+        image_mask=image_mask,
+        image_score_map=image_score_map,
+        image_mask_output_stride=2,
+        image_score_map_output_stride=4,
+    )
+    check_strided_result(result, expected, 2, 4)
+
+    assert result.image_mask and expected.image_mask
+    expected_image_mask = expected.image_mask.to_rescaled_image_mask(*result.image_mask.shape)
+    assert np.array_equal(result.image_mask.mat, expected_image_mask.mat)
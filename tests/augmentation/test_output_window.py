@@ -0,0 +1,167 @@
+import cv2 as cv
+import numpy as np
+import pytest
+
+from vkit.image.type import VImage
+from vkit.image.rescale import rescale_mat
+from vkit.label.type import VPoint, VBox, VImageScoreMap
+from vkit.augmentation.geometric_distortion import (
+    RotateConfig,
+    rotate,
+    SimilarityMlsConfig,
+    similarity_mls,
+    CameraModelConfig,
+    CameraCubicCurveConfig,
+    camera_cubic_curve,
+)
+
+SHAPE = (300, 400)
+
+OUTPUT_BOX = VBox(up=20, down=259, left=30, right=329)
+
+DISTORTIONS_AND_CONFIGS = [
+    (rotate, RotateConfig(30)),
+    (
+        similarity_mls,
+        SimilarityMlsConfig(
+            src_handle_points=[
+                VPoint(y=10, x=10),
+                VPoint(y=10, x=390),
+                VPoint(y=290, x=390),
+                VPoint(y=290, x=10),
+            ],
+            dst_handle_points=[
+                VPoint(y=10, x=10),
+                VPoint(y=30, x=380),
+                VPoint(y=290, x=350),
+                VPoint(y=280, x=20),
+            ],
+            grid_size=10,
+        ),
+    ),
+    (
+        camera_cubic_curve,
+        CameraCubicCurveConfig(
+            curve_alpha=60,
+            curve_beta=-60,
+            curve_direction=45,
+            curve_scale=1.0,
+            camera_model_config=CameraModelConfig(
+                rotation_unit_vec=[1.0, 0, 0],
+                rotation_theta=20,
+            ),
+            grid_size=10,
+            enable_dense_map=True,
+        ),
+    ),
+]
+
+
+def create_smooth_image():
+    mat = np.random.RandomState(0).randint(0, 256, (*SHAPE, 3)).astype(np.uint8)
+    return VImage(mat=cv.GaussianBlur(mat, (0, 0), 2))
+
+
+def crop_output_box(mat):
+    return mat[OUTPUT_BOX.up:OUTPUT_BOX.down + 1, OUTPUT_BOX.left:OUTPUT_BOX.right + 1]
+
+
+def render_full_and_window(distortion, config, factor, **kwargs):
+    state = distortion.generate_state(config, SHAPE)
+    full = distortion.distort(config, state=state, get_active_image_mask=True, **kwargs)
+    output_shape = (OUTPUT_BOX.height // factor, OUTPUT_BOX.width // factor)
+    window = distortion.distort(
+        config,
+        state=state,
+        output_box=OUTPUT_BOX,
+        output_shape=output_shape,
+        **kwargs,
+    )
+
+    # Compare only where the full resolution output is valid and away from its border.
+    assert full.active_image_mask
+    active_mat = full.active_image_mask.mat.astype(np.uint8)
+    active_mat = cv.erode(active_mat, np.ones((2 * factor + 5, 2 * factor + 5), dtype=np.uint8))
+    active_mat = crop_output_box(active_mat)
+    active_mat = cv.resize(active_mat, output_shape[::-1], interpolation=cv.INTER_NEAREST) > 0
+    assert active_mat.mean() > 0.5
+
+    return full, window, active_mat
+
+
+def get_crop_and_resize_diff(full_mat, window_mat):
+    expected_mat = rescale_mat(crop_output_box(full_mat), *window_mat.shape[:2])
+    return np.abs(window_mat.astype(np.float32) - expected_mat.astype(np.float32))
+
+
+@pytest.mark.parametrize('distortion,config', DISTORTIONS_AND_CONFIGS)
+@pytest.mark.parametrize('factor', [1, 2, 3, 4])
+def test_output_window_image(distortion, config, factor):
+    full, window, active_mat = render_full_and_window(
+        distortion,
+        config,
+        factor,
+        image=create_smooth_image(),
+    )
+    assert full.image and window.image
+    diff = get_crop_and_resize_diff(full.image.mat, window.image.mat)[active_mat]
+    if factor == 1:
+        # Crop only. The grid based full resolution output is blended from the grid polygons,
+        # hence not exactly the same as the dense map of the output window.
+        assert diff.mean() < 1
+    else:
+        assert diff.mean() < 5
+
+
+@pytest.mark.parametrize('distortion,config', DISTORTIONS_AND_CONFIGS)
+@pytest.mark.parametrize('factor', [1, 2, 3, 4])
+def test_output_window_pixel_center_aligned(distortion, config, factor):
+    # Resampling a linear ramp is (almost) exact, hence any misalignment of the sampling grid
+    # shows up as an offset.
+    ys, xs = np.mgrid[0:SHAPE[0], 0:SHAPE[1]]
+    image_score_map = VImageScoreMap(mat=(0.3 * xs + 0.2 * ys).astype(np.float32))
+    full, window, active_mat = render_full_and_window(
+        distortion,
+        config,
+        factor,
+        image=create_smooth_image(),
+        image_score_map=image_score_map,
+    )
+    assert full.image_score_map and window.image_score_map
+    diff = get_crop_and_resize_diff(full.image_score_map.mat, window.image_score_map.mat)
+    assert diff[active_mat].mean() < 0.1
+
+
+@pytest.mark.parametrize('factor', [2, 4, 6])
+def test_output_window_anti_aliasing(factor):
+    # Vertical stripes at the nyquist frequency, should be averaged out instead of aliased.
+    mat = np.zeros((*SHAPE, 3), dtype=np.uint8)
+    mat[:, ::2] = 255
+    full, window, active_mat = render_full_and_window(
+        rotate,
+        RotateConfig(30),
+        factor,
+        image=VImage(mat=mat),
+    )
+    assert full.image and window.image
+    window_values = window.image.mat[active_mat]
+    assert abs(window_values.mean() - 127.5) < 5
+    assert window_values.std() < 10
+
+
+@pytest.mark.parametrize('distortion,config', DISTORTIONS_AND_CONFIGS)
+def test_output_window_point(distortion, config):
+    point = VPoint(y=150, x=200)
+    full, window, _ = render_full_and_window(
+        distortion,
+        config,
+        4,
+        image=create_smooth_image(),
+        point=point,
+    )
+    assert full.point and window.point
+    # Pixel centers are aligned.
+    y = (full.point.y - OUTPUT_BOX.up + 0.5) * (OUTPUT_BOX.height // 4) / OUTPUT_BOX.height - 0.5
+    x = (full.point.x - OUTPUT_BOX.left + 0.5) * (OUTPUT_BOX.width // 4) / OUTPUT_BOX.width - 0.5
+    assert abs(window.point.y - y) <= 1
+    assert abs(window.point.x - x) <= 1
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from vkit.image.type import VImage
+from vkit.augmentation.photometric_distortion import (
+    NoiseBank,
+    MeanShiftConfig,
+    mean_shift,
+    StdShiftConfig,
+    std_shift,
+    ChannelPermutateConfig,
+    channel_permutate,
+    HueShiftConfig,
+    hue_shift,
+    ColorJitterConfig,
+    color_jitter,
+    GaussionNoiseConfig,
+    gaussion_noise,
+    SpeckleNoiseConfig,
+    speckle_noise,
+    PoissonNoiseConfig,
+    poisson_noise,
+    ImpulseNoiseConfig,
+    impulse_noise,
+    BlotchNoiseConfig,
+    blotch_noise,
+)
+
+
+def create_image(image_name):
+    rnd = np.random.RandomState(0)
+    if image_name == 'gray':
+        return VImage(mat=rnd.randint(0, 256, (133, 57)).astype(np.uint8))
+    image = VImage(mat=rnd.randint(0, 256, (133, 57, 3)).astype(np.uint8))
+    if image_name == 'hsv':
+        image = image.to_hsv_image()
+    return image
+
+
+NOISE_BANK = NoiseBank(texture_height=150, texture_width=200, num_textures=2)
+
+
+@pytest.mark.parametrize(
+    'photometric_distortion,config,image_name',
+    [
+        (mean_shift, MeanShiftConfig(30), 'rgb'),
+        (std_shift, StdShiftConfig(1.4), 'rgb'),
+        (channel_permutate, ChannelPermutateConfig(), 'rgb'),
+        (hue_shift, HueShiftConfig(40), 'hsv'),
+        (color_jitter, ColorJitterConfig(10, 20, 1.1), 'rgb'),
+        (gaussion_noise, GaussionNoiseConfig(10), 'rgb'),
+        (gaussion_noise, GaussionNoiseConfig(10), 'gray'),
+        (gaussion_noise, GaussionNoiseConfig(10, noise_bank=NOISE_BANK), 'rgb'),
+        (speckle_noise, SpeckleNoiseConfig(0.2), 'rgb'),
+        (speckle_noise, SpeckleNoiseConfig(0.2, noise_bank=NOISE_BANK), 'gray'),
+        (poisson_noise, PoissonNoiseConfig(), 'rgb'),
+        (poisson_noise, PoissonNoiseConfig(100), 'gray'),
+        (impulse_noise, ImpulseNoiseConfig(0.01, 0.02), 'rgb'),
+        (impulse_noise, ImpulseNoiseConfig(0.1, 0.2), 'rgb'),
+        (impulse_noise, ImpulseNoiseConfig(0.01, 0.0), 'gray'),
+        (blotch_noise, BlotchNoiseConfig(20, 16), 'rgb'),
+        (blotch_noise, BlotchNoiseConfig(20, 16, noise_bank=NOISE_BANK), 'gray'),
+    ],
+)
+def test_distort_image_in_bands_same_as_full(photometric_distortion, config, image_name):
+    image = create_image(image_name)
+    expected = photometric_distortion.distort_image(config, image, np.random.RandomState(9))
+
+    row_num_bytes = image.mat.strides[0] * 4
+    # Single row bands, multi-row bands with a short last band, and a single band.
+    for max_band_num_bytes in (1, row_num_bytes * 10, 2**30):
+        result = photometric_distortion.distort_image_in_bands(
+            config,
+            image,
+            np.random.RandomState(9),
+            max_band_num_bytes=max_band_num_bytes,
+        )
+        assert result.kind == expected.kind
+        assert (result.mat == expected.mat).all()
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from vkit.image.type import VImage, VImageKind
+from vkit.augmentation.photometric_distortion import (
+    NoiseBank,
+    MeanShiftConfig,
+    mean_shift,
+    StdShiftConfig,
+    std_shift,
+    ChannelPermutateConfig,
+    channel_permutate,
+    HueShiftConfig,
+    hue_shift,
+    SaturationShiftConfig,
+    saturation_shift,
+    ColorJitterConfig,
+    color_jitter,
+    GaussionNoiseConfig,
+    gaussion_noise,
+    SpeckleNoiseConfig,
+    speckle_noise,
+    PoissonNoiseConfig,
+    poisson_noise,
+    ImpulseNoiseConfig,
+    impulse_noise,
+    BlotchNoiseConfig,
+    blotch_noise,
+)
+
+NUM_SAMPLES = 16
+
+
+def create_batch_mat(kind):
+    batch_mat = np.random.RandomState(0).randint(0, 256, (NUM_SAMPLES, 32, 48, 3)).astype(np.uint8)
+    if kind == VImageKind.HSV:
+        batch_mat = np.stack([VImage(mat=mat).to_hsv_image().mat for mat in batch_mat])
+    return batch_mat
+
+
+NOISE_BANK = NoiseBank(texture_height=64, texture_width=256, num_textures=2)
+
+
+@pytest.mark.parametrize(
+    'photometric_distortion,create_config,kind',
+    [
+        (mean_shift, lambda idx: MeanShiftConfig(idx * 8 - 60), None),
+        (std_shift, lambda idx: StdShiftConfig(0.5 + idx / NUM_SAMPLES), None),
+        (channel_permutate, lambda idx: ChannelPermutateConfig(), None),
+        (hue_shift, lambda idx: HueShiftConfig(idx * 16 - 128), VImageKind.HSV),
+        (saturation_shift, lambda idx: SaturationShiftConfig(idx * 16 - 128), VImageKind.HSV),
+        (hue_shift, lambda idx: HueShiftConfig(idx * 16 - 128), None),
+        (saturation_shift, lambda idx: SaturationShiftConfig(idx * 16 - 128), None),
+        (color_jitter, lambda idx: ColorJitterConfig(idx * 16 - 128, 128 - idx * 16, 1.2), None),
+        (
+            color_jitter,
+            lambda idx: ColorJitterConfig(idx * 16 - 128, 128 - idx * 16, 0.8),
+            VImageKind.HSV,
+        ),
+        (gaussion_noise, lambda idx: GaussionNoiseConfig(idx * 2), None),
+        (
+            gaussion_noise,
+            lambda idx: GaussionNoiseConfig(idx // 4 * 5, noise_bank=NOISE_BANK),
+            None,
+        ),
+        (speckle_noise, lambda idx: SpeckleNoiseConfig(idx / 100), None),
+        (poisson_noise, lambda idx: PoissonNoiseConfig(), None),
+        (impulse_noise, lambda idx: ImpulseNoiseConfig(0.01, 0.01), None),
+        (blotch_noise, lambda idx: BlotchNoiseConfig(10, 8), None),
+    ],
+)
+def test_distort_images_same_as_distort_image(photometric_distortion, create_config, kind):
+    batch_mat = create_batch_mat(kind)
+    configs = [create_config(idx) for idx in range(NUM_SAMPLES)]
+
+    rnd = np.random.RandomState(5)
+    images = [VImage(mat=mat) if kind is None else VImage(mat=mat, kind=kind) for mat in batch_mat]
+    expected = np.stack([
+        photometric_distortion.distort_image(config, image, rnd).mat
+        for config, image in zip(configs, images)
+    ])
+
+    result = photometric_distortion.distort_images(
+        configs,
+        batch_mat,
+        np.random.RandomState(5),
+        kind=kind,
+    )
+    assert result.shape == expected.shape
+    assert result.dtype == np.uint8
+    assert (result == expected).all()
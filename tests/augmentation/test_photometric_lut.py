@@ -0,0 +1,151 @@
+import numpy as np
+import pytest
+
+from vkit.image.type import VImage
+from vkit.augmentation.photometric_distortion import (
+    MeanShiftConfig,
+    mean_shift,
+    StdShiftConfig,
+    std_shift,
+    ChannelPermutateConfig,
+    channel_permutate,
+    HueShiftConfig,
+    hue_shift,
+    SaturationShiftConfig,
+    saturation_shift,
+    GaussionNoiseConfig,
+    gaussion_noise,
+    SpeckleNoiseConfig,
+    speckle_noise,
+)
+from vkit.augmentation.photometric_distortion.interface import PhotometricPipeline
+
+
+def create_image(image_name):
+    rnd = np.random.RandomState(0)
+    if image_name == 'gray':
+        return VImage(mat=rnd.randint(0, 256, (60, 80)).astype(np.uint8))
+    image = VImage(mat=rnd.randint(0, 256, (60, 80, 3)).astype(np.uint8))
+    if image_name == 'hsv':
+        image = image.to_hsv_image()
+    return image
+
+
+# The implementations before the LUT path.
+def baseline_mean_shift(mat, delta):
+    return np.clip(mat.astype(np.int16) + delta, 0, 255).astype(np.uint8)
+
+
+def baseline_std_shift(mat, scale):
+    mat = mat.astype(np.float32)
+    if mat.ndim == 2:
+        mean = mat.mean()
+    else:
+        mean = mat.mean(axis=(0, 1))
+    mat = mat * scale - mean * (scale - 1)
+    return np.clip(mat, 0, 255).astype(np.uint8)
+
+
+def baseline_hue_shift(mat, delta):
+    mat = mat.astype(np.int16)
+    mat[:, :, 0] += delta
+    mat[:, :, 0] %= 256
+    return mat.astype(np.uint8)
+
+
+def baseline_saturation_shift(mat, delta):
+    mat = mat.astype(np.int16)
+    mat[:, :, 1] += delta
+    return np.clip(mat, 0, 255).astype(np.uint8)
+
+
+@pytest.mark.parametrize(
+    'image_name,photometric_distortion,config,baseline_func',
+    [
+        ('rgb', mean_shift, MeanShiftConfig(40), lambda mat: baseline_mean_shift(mat, 40)),
+        ('rgb', mean_shift, MeanShiftConfig(-70), lambda mat: baseline_mean_shift(mat, -70)),
+        ('gray', mean_shift, MeanShiftConfig(15), lambda mat: baseline_mean_shift(mat, 15)),
+        ('rgb', std_shift, StdShiftConfig(1.3), lambda mat: baseline_std_shift(mat, 1.3)),
+        ('rgb', std_shift, StdShiftConfig(0.6), lambda mat: baseline_std_shift(mat, 0.6)),
+        ('gray', std_shift, StdShiftConfig(1.7), lambda mat: baseline_std_shift(mat, 1.7)),
+        ('hsv', hue_shift, HueShiftConfig(80), lambda mat: baseline_hue_shift(mat, 80)),
+        ('hsv', hue_shift, HueShiftConfig(-200), lambda mat: baseline_hue_shift(mat, -200)),
+        (
+            'hsv',
+            saturation_shift,
+            SaturationShiftConfig(60),
+            lambda mat: baseline_saturation_shift(mat, 60),
+        ),
+        (
+            'hsv',
+            saturation_shift,
+            SaturationShiftConfig(-90),
+            lambda mat: baseline_saturation_shift(mat, -90),
+        ),
+    ],
+)
+def test_lut_same_as_baseline(image_name, photometric_distortion, config, baseline_func):
+    image = create_image(image_name)
+    result = photometric_distortion.distort_image(config, image, np.random.RandomState(0))
+    assert result.kind == image.kind
+    assert (result.mat == baseline_func(image.mat)).all()
+
+
+CHAINS = [
+    (
+        'rgb',
+        [
+            (mean_shift, MeanShiftConfig(30)),
+            (mean_shift, MeanShiftConfig(-60)),
+            (std_shift, StdShiftConfig(1.3)),
+            (mean_shift, MeanShiftConfig(20)),
+        ],
+    ),
+    (
+        'gray',
+        [
+            (mean_shift, MeanShiftConfig(30)),
+            (gaussion_noise, GaussionNoiseConfig(10)),
+            (mean_shift, MeanShiftConfig(-60)),
+            (std_shift, StdShiftConfig(0.8)),
+        ],
+    ),
+    (
+        'hsv',
+        [
+            (hue_shift, HueShiftConfig(80)),
+            (saturation_shift, SaturationShiftConfig(-40)),
+            (mean_shift, MeanShiftConfig(25)),
+            (hue_shift, HueShiftConfig(-200)),
+            (saturation_shift, SaturationShiftConfig(90)),
+        ],
+    ),
+    (
+        'rgb',
+        [
+            (speckle_noise, SpeckleNoiseConfig(0.1)),
+            (mean_shift, MeanShiftConfig(10)),
+            (channel_permutate, ChannelPermutateConfig()),
+            (mean_shift, MeanShiftConfig(10)),
+        ],
+    ),
+]
+
+
+@pytest.mark.parametrize('image_name,chain', CHAINS)
+def test_lut_folding_same_as_sequential(image_name, chain):
+    image = create_image(image_name)
+
+    rnd = np.random.RandomState(3)
+    expected = image
+    for photometric_distortion, config in chain:
+        expected = photometric_distortion.distort_image(config, expected, rnd)
+
+    pipeline = PhotometricPipeline([photometric_distortion for photometric_distortion, _ in chain])
+    result = pipeline.distort_image(
+        [config for _, config in chain],
+        image,
+        np.random.RandomState(3),
+    )
+    assert result.kind == expected.kind
+    assert (result.mat == expected.mat).all()
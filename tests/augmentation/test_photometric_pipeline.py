@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from vkit.image.type import VImage
+from vkit.augmentation.photometric_distortion import (
+    MeanShiftConfig,
+    mean_shift,
+    StdShiftConfig,
+    std_shift,
+    ChannelPermutateConfig,
+    channel_permutate,
+    HueShiftConfig,
+    hue_shift,
+    SaturationShiftConfig,
+    saturation_shift,
+    GaussionNoiseConfig,
+    gaussion_noise,
+    SpeckleNoiseConfig,
+    speckle_noise,
+    PoissonNoiseConfig,
+    poisson_noise,
+    ImpulseNoiseConfig,
+    impulse_noise,
+)
+from vkit.augmentation.photometric_distortion.interface import PhotometricPipeline
+
+
+def create_rgb_image():
+    mat = np.random.RandomState(0).randint(0, 256, (60, 80, 3)).astype(np.uint8)
+    return VImage(mat=mat)
+
+
+CHAINS = [
+    (
+        'rgb',
+        [
+            (mean_shift, MeanShiftConfig(30)),
+            (std_shift, StdShiftConfig(1.3)),
+            (gaussion_noise, GaussionNoiseConfig(10)),
+            (speckle_noise, SpeckleNoiseConfig(0.1)),
+            (impulse_noise, ImpulseNoiseConfig(0.01, 0.01)),
+        ],
+    ),
+    (
+        'rgb',
+        [
+            (channel_permutate, ChannelPermutateConfig()),
+            (poisson_noise, PoissonNoiseConfig()),
+            (std_shift, StdShiftConfig(0.7)),
+            (mean_shift, MeanShiftConfig(-50)),
+        ],
+    ),
+    (
+        'hsv',
+        [
+            (hue_shift, HueShiftConfig(80)),
+            (saturation_shift, SaturationShiftConfig(-40)),
+            (std_shift, StdShiftConfig(1.5)),
+            (hue_shift, HueShiftConfig(-200)),
+        ],
+    ),
+]
+
+
+@pytest.mark.parametrize('image_name,chain', CHAINS)
+def test_pipeline_same_as_sequential(image_name, chain):
+    image = create_rgb_image()
+    if image_name == 'hsv':
+        image = image.to_hsv_image()
+
+    rnd = np.random.RandomState(3)
+    expected = image
+    for photometric_distortion, config in chain:
+        expected = photometric_distortion.distort_image(config, expected, rnd)
+
+    pipeline = PhotometricPipeline([photometric_distortion for photometric_distortion, _ in chain])
+    result = pipeline.distort_image(
+        [config for _, config in chain],
+        image,
+        np.random.RandomState(3),
+    )
+    assert result.kind == expected.kind
+    assert (result.mat == expected.mat).all()
@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+
+from vkit.image.type import VImage
+from vkit.label.type import VBox, VImageMask
+from vkit.augmentation.photometric_distortion import (
+    MeanShiftConfig,
+    mean_shift,
+    GaussionNoiseConfig,
+    gaussion_noise,
+)
+
+SHAPE = (120, 160)
+
+
+def create_image(kind_channels=3):
+    shape = SHAPE if kind_channels == 0 else (*SHAPE, kind_channels)
+    return VImage(mat=np.full(shape, 100, dtype=np.uint8))
+
+
+def get_changed_mat(image, result):
+    changed_mat = (image.mat != result.mat)
+    if changed_mat.ndim == 3:
+        changed_mat = changed_mat.any(axis=2)
+    return changed_mat
+
+
+def create_boxes_mat(boxes):
+    boxes_mat = np.zeros(SHAPE, dtype=bool)
+    for box in boxes:
+        up = max(0, box.up)
+        down = max(0, box.down + 1)
+        left = max(0, box.left)
+        right = max(0, box.right + 1)
+        boxes_mat[up:down, left:right] = True
+    return boxes_mat
+
+
+def create_image_mask():
+    # Overlapped text lines, a thin stroke, a small blob and a noisy area.
+    mat = np.zeros(SHAPE, dtype=np.uint8)
+    mat[10:20, 5:60] = 1
+    mat[15:25, 80:150] = 1
+    mat[60:62, 30:31] = 1
+    mat[90:110, 100:105] = 1
+    rng = np.random.default_rng(0)
+    mat[90:110, 10:70] = rng.integers(0, 2, (20, 60))
+    return VImageMask(mat=mat)
+
+
+@pytest.mark.parametrize('kind_channels', [0, 3])
+def test_distort_image_mask_only(kind_channels):
+    image = create_image(kind_channels)
+    image_mask = create_image_mask()
+    result = mean_shift.distort_image(MeanShiftConfig(delta=50), image, image_mask=image_mask)
+
+    # Exactly the masked pixels are distorted, and distorted once.
+    assert np.array_equal(get_changed_mat(image, result), image_mask.mat > 0)
+    assert (result.mat[image_mask.mat > 0] == 150).all()
+
+
+def test_distort_image_boxes():
+    image = create_image()
+    boxes = [
+        VBox(up=10, down=29, left=10, right=49),
+        # Overlapped with the first box.
+        VBox(up=20, down=39, left=30, right=79),
+        # Clipped.
+        VBox(up=-10, down=9, left=140, right=200),
+        VBox(up=100, down=150, left=-20, right=9),
+        # Outside of the image.
+        VBox(up=-30, down=-10, left=10, right=20),
+        VBox(up=10, down=20, left=170, right=180),
+    ]
+    result = mean_shift.distort_image(MeanShiftConfig(delta=50), image, boxes=boxes)
+
+    boxes_mat = create_boxes_mat(boxes)
+    assert np.array_equal(get_changed_mat(image, result), boxes_mat)
+    # The overlapped area is not distorted twice.
+    assert (result.mat[boxes_mat] == 150).all()
+
+
+def test_distort_image_boxes_and_mask():
+    image = create_image()
+    image_mask = create_image_mask()
+    boxes = [
+        VBox(up=0, down=19, left=0, right=99),
+        VBox(up=85, down=130, left=50, right=170),
+    ]
+    result = gaussion_noise.distort_image(
+        GaussionNoiseConfig(std=20),
+        image,
+        rnd=np.random.RandomState(0),
+        image_mask=image_mask,
+        boxes=boxes,
+    )
+
+    # Only the masked pixels inside the boxes could be changed.
+    allowed_mat = create_boxes_mat(boxes) & (image_mask.mat > 0)
+    changed_mat = get_changed_mat(image, result)
+    assert not changed_mat[~allowed_mat].any()
+    assert changed_mat[allowed_mat].mean() > 0.9
+
+
+def test_distort_image_mask_shape_mismatched():
+    image = create_image()
+    image_mask = VImageMask(mat=np.ones((SHAPE[0], SHAPE[1] + 1), dtype=np.uint8))
+    with pytest.raises(AssertionError):
+        mean_shift.distort_image(MeanShiftConfig(delta=50), image, image_mask=image_mask)
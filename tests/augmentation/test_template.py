@@ -0,0 +1,193 @@
+import attr
+import numpy as np
+import cv2 as cv
+import pytest
+
+from vkit.image.type import VImage
+from vkit.label.type import VPoint, VPointList, VPolygon, VBox, VImageMask, VImageScoreMap
+from vkit.augmentation.geometric_distortion import (
+    CameraModelConfig,
+    CameraCubicCurveConfig,
+    camera_cubic_curve,
+    DistortionTemplateDenseMapFormat,
+    DistortionTemplate,
+    DistortionTemplateConfig,
+    distortion_template,
+)
+
+SHAPE = (300, 400)
+
+CONFIG = CameraCubicCurveConfig(
+    curve_alpha=60,
+    curve_beta=-60,
+    curve_direction=45,
+    curve_scale=1.0,
+    camera_model_config=CameraModelConfig(
+        rotation_unit_vec=[1.0, 0, 0],
+        rotation_theta=20,
+    ),
+    grid_size=10,
+    enable_dense_map=True,
+)
+
+
+def create_image_and_labels(shape):
+    mat = np.random.RandomState(0).randint(0, 256, (*shape, 3)).astype(np.uint8)
+    # Smooth, hence the interpolation error is bounded.
+    mat = cv.GaussianBlur(mat, (0, 0), 3)
+    image = VImage(mat=mat)
+    polygon = VPolygon(
+        VPointList([
+            VPoint(y=50, x=50),
+            VPoint(y=50, x=200),
+            VPoint(y=200, x=200),
+            VPoint(y=200, x=50),
+        ])
+    )
+    image_mask = VImageMask.from_image_and_polygons(image, [polygon])
+    image_score_map = VImageScoreMap.from_image_and_polygon_value_pairs(image, [(polygon, 0.5)])
+    return image, image_mask, image_score_map
+
+
+def generate_states():
+    state = camera_cubic_curve.generate_state(CONFIG, SHAPE)
+    output_window_state = state.to_output_window_state(
+        VBox(up=10, down=209, left=20, right=219),
+        (100, 100),
+    )
+    return [state, output_window_state]
+
+
+@pytest.mark.parametrize('mmap', [True, False])
+@pytest.mark.parametrize('dense_map_format', list(DistortionTemplateDenseMapFormat))
+def test_template_file_round_trip(tmp_path, dense_map_format, mmap):
+    for idx, state in enumerate(generate_states()):
+        template = DistortionTemplate.from_state(state, dense_map_format)
+        path = tmp_path / f'template-{idx}.bin'
+        template.to_file(path)
+
+        loaded_template = DistortionTemplate.from_file(path, mmap=mmap)
+        assert loaded_template.dense_map_format == dense_map_format
+        assert loaded_template.src_shape == template.src_shape
+        assert loaded_template.shape == template.shape
+        assert loaded_template.output_box == template.output_box
+        assert loaded_template.output_shape == template.output_shape
+        for name in ('np_map', 'np_map_table', 'np_nearest_map'):
+            np_array = getattr(template, name)
+            loaded_np_array = getattr(loaded_template, name)
+            if np_array is None:
+                assert loaded_np_array is None
+            else:
+                assert loaded_np_array.dtype == np_array.dtype
+                assert np.array_equal(loaded_np_array, np_array, equal_nan=True)
+        assert loaded_template.src_image_grid.points_2d == template.src_image_grid.points_2d
+        assert loaded_template.dst_image_grid.points_2d == template.dst_image_grid.points_2d
+
+
+def test_template_invalid_file(tmp_path):
+    path = tmp_path / 'template.bin'
+    path.write_bytes(b'0' * 128)
+    with pytest.raises(RuntimeError):
+        DistortionTemplate.from_file(path)
+
+
+def distort_by_template(template, image, image_mask, image_score_map):
+    config = DistortionTemplateConfig(template=template)
+    return distortion_template.distort(
+        config,
+        image,
+        image_mask=image_mask,
+        image_score_map=image_score_map,
+        get_active_image_mask=True,
+    )
+
+
+def test_fixed_point_same_as_live():
+    image, image_mask, image_score_map = create_image_and_labels(SHAPE)
+    for state in generate_states():
+        expected = camera_cubic_curve.distort(
+            CONFIG,
+            image,
+            image_mask=image_mask,
+            image_score_map=image_score_map,
+            get_active_image_mask=True,
+            state=state,
+        )
+        template = DistortionTemplate.from_state(state)
+        result = distort_by_template(template, image, image_mask, image_score_map)
+
+        assert result.image and expected.image
+        assert np.array_equal(result.image.mat, expected.image.mat)
+        assert result.image_mask and expected.image_mask
+        assert np.array_equal(result.image_mask.mat, expected.image_mask.mat)
+        assert result.image_score_map and expected.image_score_map
+        assert np.array_equal(result.image_score_map.mat, expected.image_score_map.mat)
+        assert result.active_image_mask and expected.active_image_mask
+        assert np.array_equal(result.active_image_mask.mat, expected.active_image_mask.mat)
+
+
+def test_float16_within_tolerance():
+    # The coordinates exceed 1024.
+    shape = (1100, 1400)
+    config = attr.evolve(CONFIG, grid_size=50)
+    state = camera_cubic_curve.generate_state(config, shape)
+    dense_map = state.dense_map
+    assert dense_map.map_x.max() > 1024
+
+    template = DistortionTemplate.from_state(state, DistortionTemplateDenseMapFormat.FLOAT16)
+    np_active_mask = template.generate_active_mat().astype(bool)
+    assert np.array_equal(np_active_mask, dense_map.map_x >= 0)
+
+    # The displacement is within 512 pixels in this case.
+    np_map = template.np_map.astype(np.float32)
+    height, width = template.shape
+    map_x = np_map[:, :, 0] + np.arange(width)
+    map_y = np_map[:, :, 1] + np.arange(height)[:, None]
+    assert np.abs(map_x - dense_map.map_x)[np_active_mask].max() <= 0.125
+    assert np.abs(map_y - dense_map.map_y)[np_active_mask].max() <= 0.125
+
+    image, image_mask, image_score_map = create_image_and_labels(shape)
+    expected = camera_cubic_curve.distort(
+        config,
+        image,
+        image_mask=image_mask,
+        image_score_map=image_score_map,
+        state=state,
+    )
+    result = distort_by_template(template, image, image_mask, image_score_map)
+    assert result.image and expected.image
+    assert np.abs(result.image.mat.astype(np.int32) - expected.image.mat).max() <= 2
+    assert result.image_mask and expected.image_mask
+    # Only the border pixels of the mask.
+    assert (result.image_mask.mat != expected.image_mask.mat).mean() < 0.001
+    assert result.image_score_map and expected.image_score_map
+    assert np.abs(result.image_score_map.mat - expected.image_score_map.mat).max() <= 0.5
+
+
+@pytest.mark.parametrize('dense_map_format', list(DistortionTemplateDenseMapFormat))
+def test_template_points_same_as_live(dense_map_format):
+    rnd = np.random.RandomState(0)
+    height, width = SHAPE
+    points = VPointList(
+        VPoint(y=y, x=x) for y, x in zip(rnd.randint(0, height, 500), rnd.randint(0, width, 500))
+    )
+
+    # The template maps points by the grid cells, as the live op without dense map.
+    grid_config = attr.evolve(CONFIG, enable_dense_map=False)
+    grid_state = camera_cubic_curve.generate_state(grid_config, SHAPE)
+    grid_states = [
+        grid_state,
+        grid_state.to_output_window_state(VBox(up=10, down=209, left=20, right=219), (100, 100)),
+    ]
+
+    for state, grid_state in zip(generate_states(), grid_states):
+        template = DistortionTemplate.from_state(state, dense_map_format)
+        config = DistortionTemplateConfig(template=template)
+        result = distortion_template.distort_points(config, SHAPE, points)
+
+        expected = camera_cubic_curve.distort_points(grid_config, SHAPE, points, state=grid_state)
+        assert result.to_xy_pairs() == expected.to_xy_pairs()
+
+        # The exact mapping.
+        expected = camera_cubic_curve.distort_points(CONFIG, SHAPE, points, state=state)
+        assert np.abs(result.to_np_array() - expected.to_np_array()).max() <= 1
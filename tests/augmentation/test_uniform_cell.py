@@ -0,0 +1,81 @@
+import numpy as np
+import cv2 as cv
+
+from vkit.image.type import VImage
+from vkit.label.type import VImageMask, VImageScoreMap, VPolygon, VPoint, VPointList
+from vkit.augmentation.geometric_distortion import (
+    CameraModelConfig,
+    CameraCubicCurveConfig,
+    camera_cubic_curve,
+)
+from vkit.augmentation.geometric_distortion.grid_rendering.grid_blender import (
+    generate_src_content_mask,
+)
+
+
+def create_sparse_document():
+    mat = np.full((240, 180, 3), 240, dtype=np.uint8)
+    mat += np.random.default_rng(0).integers(0, 3, mat.shape, dtype=np.uint8)
+    for idx in range(4):
+        cv.putText(mat, f'Line {idx}', (20, 40 + 40 * idx), cv.FONT_HERSHEY_SIMPLEX, 0.6, (20,) * 3)
+    return VImage(mat=mat)
+
+
+def create_config(uniform_cell_max_delta=None):
+    return CameraCubicCurveConfig(
+        curve_alpha=30,
+        curve_beta=-30,
+        curve_direction=45,
+        curve_scale=1.0,
+        camera_model_config=CameraModelConfig(rotation_unit_vec=[1.0, 0, 0], rotation_theta=20),
+        grid_size=10,
+        uniform_cell_max_delta=uniform_cell_max_delta,
+    )
+
+
+def test_generate_src_content_mask():
+    image = create_sparse_document()
+    src_content_mask = generate_src_content_mask(image.mat, 4)
+    assert src_content_mask is not None
+    assert np.array_equal(src_content_mask.mat, (image.mat.min(axis=2) < 200).astype(np.uint8))
+
+
+def test_uniform_cell_by_config():
+    image = create_sparse_document()
+    polygon = VPolygon(
+        VPointList([
+            VPoint(y=20, x=10),
+            VPoint(y=20, x=150),
+            VPoint(y=200, x=150),
+            VPoint(y=200, x=10)
+        ])
+    )
+    image_mask = VImageMask.from_image_and_polygons(image, [polygon])
+    image_score_map = VImageScoreMap.from_image_and_polygon_value_pairs(image, [(polygon, 1.0)])
+
+    results = [
+        camera_cubic_curve.distort(
+            create_config(uniform_cell_max_delta),
+            image,
+            image_mask=image_mask,
+            image_score_map=image_score_map,
+        ) for uniform_cell_max_delta in (None, 0, 4)
+    ]
+    for result in results[1:]:
+        assert np.array_equal(result.image_mask.mat, results[0].image_mask.mat)
+        assert np.array_equal(result.image_score_map.mat, results[0].image_score_map.mat)
+
+    # Exact.
+    assert np.array_equal(results[1].image.mat, results[0].image.mat)
+    # Within the noise level of the background.
+    delta = np.abs(results[2].image.mat.astype(np.int32) - results[0].image.mat)
+    assert delta.max() <= 4
+
+    # Given mask.
+    src_content_mask = VImageMask(mat=(image.mat.min(axis=2) < 200).astype(np.uint8))
+    result = camera_cubic_curve.distort(
+        create_config(4),
+        image,
+        src_content_mask=src_content_mask,
+    )
+    assert np.array_equal(result.image.mat, results[2].image.mat)
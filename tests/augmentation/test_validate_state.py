@@ -0,0 +1,132 @@
+import numpy as np
+import pytest
+
+from vkit.image.type import VImage
+from vkit.label.type import VPoint
+from vkit.augmentation.geometric_distortion import (
+    StateValidationConfig,
+    ShearHoriConfig,
+    shear_hori,
+    RotateConfig,
+    rotate,
+    SimilarityMlsConfig,
+    similarity_mls,
+    CameraModelConfig,
+    CameraCubicCurveConfig,
+    camera_cubic_curve,
+)
+
+SHAPE = (300, 400)
+
+# Accept all, except for the checked one.
+LOOSE_VALIDATION_CONFIG = StateValidationConfig(
+    max_area_ratio=float('inf'),
+    min_cell_area_ratio=0.0,
+    min_cell_side_ratio=0.0,
+    allow_folded_cells=True,
+)
+
+
+def create_similarity_mls_config(center_dst_handle_point: VPoint):
+    # The corners are fixed, only the center handle is moved.
+    corner_handle_points = [
+        VPoint(y=10, x=10),
+        VPoint(y=10, x=390),
+        VPoint(y=290, x=390),
+        VPoint(y=290, x=10),
+    ]
+    return SimilarityMlsConfig(
+        src_handle_points=[*corner_handle_points, VPoint(y=150, x=200)],
+        dst_handle_points=[*corner_handle_points, center_dst_handle_point],
+        grid_size=10,
+    )
+
+
+def create_camera_cubic_curve_config(rotation_theta: float):
+    return CameraCubicCurveConfig(
+        curve_alpha=60,
+        curve_beta=-60,
+        curve_direction=45,
+        curve_scale=1.0,
+        camera_model_config=CameraModelConfig(
+            rotation_unit_vec=[1.0, 0, 0],
+            rotation_theta=rotation_theta,
+        ),
+        grid_size=10,
+    )
+
+
+@pytest.mark.parametrize(
+    'distortion,config',
+    [
+        (shear_hori, ShearHoriConfig(20)),
+        (rotate, RotateConfig(0)),
+        (rotate, RotateConfig(30)),
+        (similarity_mls, create_similarity_mls_config(VPoint(y=160, x=220))),
+        (camera_cubic_curve, create_camera_cubic_curve_config(20)),
+    ],
+)
+def test_validate_state_accepted(distortion, config):
+    state = distortion.generate_state(config, SHAPE)
+    assert distortion.validate_state(config, state, SHAPE)
+
+    # The image could be passed instead of the shape.
+    image = VImage(mat=np.zeros((*SHAPE, 3), dtype=np.uint8))
+    assert distortion.validate_state(config, state, image)
+
+    # The validated state is rendered as is.
+    result = distortion.distort(config, image, state=state, get_state=True)
+    assert result.state is state
+
+
+@pytest.mark.parametrize(
+    'distortion,config,validation_config',
+    [
+        # The canvas area explodes.
+        (shear_hori, ShearHoriConfig(89), StateValidationConfig()),
+        (rotate, RotateConfig(45), StateValidationConfig(max_area_ratio=1.0)),
+        # Folded, the center handle is dragged across the right side.
+        (
+            similarity_mls,
+            create_similarity_mls_config(VPoint(y=150, x=420)),
+            StateValidationConfig(
+                max_area_ratio=float('inf'),
+                min_cell_area_ratio=0.0,
+                min_cell_side_ratio=0.0,
+            ),
+        ),
+        # Collapsed cells, the center handle is dragged to the left side.
+        (
+            similarity_mls,
+            create_similarity_mls_config(VPoint(y=150, x=20)),
+            StateValidationConfig(allow_folded_cells=True),
+        ),
+        # Extreme perspective.
+        (camera_cubic_curve, create_camera_cubic_curve_config(80), StateValidationConfig()),
+    ],
+)
+def test_validate_state_rejected(distortion, config, validation_config):
+    state = distortion.generate_state(config, SHAPE)
+    assert not distortion.validate_state(config, state, SHAPE, validation_config)
+    # Not rejected by the other checks.
+    if distortion is not shear_hori:
+        assert distortion.validate_state(config, state, SHAPE, LOOSE_VALIDATION_CONFIG)
+
+
+def test_validate_state_cell_ratios():
+    config = create_camera_cubic_curve_config(20)
+    state = camera_cubic_curve.generate_state(config, SHAPE)
+    assert camera_cubic_curve.validate_state(config, state, SHAPE)
+    # Some cells shrink under the perspective.
+    assert not camera_cubic_curve.validate_state(
+        config,
+        state,
+        SHAPE,
+        StateValidationConfig(min_cell_side_ratio=1.0),
+    )
+    assert not camera_cubic_curve.validate_state(
+        config,
+        state,
+        SHAPE,
+        StateValidationConfig(min_cell_area_ratio=1.0),
+    )
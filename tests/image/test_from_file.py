@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from PIL import Image, ImageOps
+
+from vkit.image.type import VImage, VImageDecodeBackend
+
+EXIF_ORIENTATION_TAG = 0x0112
+
+
+def save_image_with_exif_orientation(path, exif_orientation):
+    mat = np.random.default_rng(0).integers(0, 256, (30, 50, 3), dtype=np.uint8)
+    pil_img = Image.fromarray(mat)
+    exif = pil_img.getexif()
+    exif[EXIF_ORIENTATION_TAG] = exif_orientation
+    pil_img.save(path, exif=exif)
+
+
+@pytest.mark.parametrize('backend', [VImageDecodeBackend.PIL, VImageDecodeBackend.OPENCV])
+@pytest.mark.parametrize('exif_orientation', range(1, 9))
+def test_exif_orientation_same_as_pil(tmp_path, exif_orientation, backend):
+    # Lossless, hence the decoded pixels of both backends are identical.
+    path = tmp_path / 'image.png'
+    save_image_with_exif_orientation(path, exif_orientation)
+
+    expected_mat = np.asarray(ImageOps.exif_transpose(Image.open(path)))
+    image = VImage.from_file(path, backend=backend)
+    assert image.mat.shape == expected_mat.shape
+    assert np.array_equal(image.mat, expected_mat)
+
+    image = VImage.from_file(path, disable_exif_orientation=True, backend=backend)
+    assert np.array_equal(image.mat, np.asarray(Image.open(path)))
+
+
+@pytest.mark.parametrize('backend', [VImageDecodeBackend.PIL, VImageDecodeBackend.OPENCV])
+@pytest.mark.parametrize('exif_orientation', [1, 6])
+def test_max_long_side(tmp_path, exif_orientation, backend):
+    path = tmp_path / 'image.jpg'
+    save_image_with_exif_orientation(path, exif_orientation)
+
+    image = VImage.from_file(path, max_long_side=10, backend=backend)
+    if exif_orientation == 1:
+        assert image.mat.shape == (6, 10, 3)
+    else:
+        assert image.mat.shape == (10, 6, 3)
+
+    image = VImage.from_file(path, max_long_side=100, backend=backend)
+    assert max(image.mat.shape[:2]) == 50
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from vkit.image.type import VImage, VImageKind
+
+
+def create_images():
+    mat = np.random.default_rng(0).integers(0, 256, (33, 47, 3), dtype=np.uint8)
+    image = VImage(mat=mat)
+    return [
+        image,
+        image.to_grayscale_image(),
+        image.to_hsv_image(),
+        image.to_gcn_image(),
+        # Not C-contiguous.
+        VImage(mat=mat[::2, ::-1]),
+    ]
+
+
+@pytest.mark.parametrize('mmap', [True, False])
+@pytest.mark.parametrize('image_idx', range(5))
+def test_raw_file_round_trip(tmp_path, image_idx, mmap):
+    image = create_images()[image_idx]
+    path = tmp_path / 'image.raw'
+    image.to_raw_file(path)
+
+    loaded_image = VImage.from_raw_file(path, mmap=mmap)
+    assert loaded_image.kind == image.kind
+    assert loaded_image.mat.dtype == image.mat.dtype
+    assert loaded_image.mat.shape == image.mat.shape
+    assert np.array_equal(loaded_image.mat, image.mat)
+    assert isinstance(loaded_image.mat, np.memmap) == mmap
+
+
+def test_raw_file_copy_on_write(tmp_path):
+    image = create_images()[0]
+    path = tmp_path / 'image.raw'
+    image.to_raw_file(path)
+    num_bytes = path.stat().st_size
+
+    loaded_image = VImage.from_raw_file(path)
+    assert loaded_image.kind == VImageKind.RGB
+    loaded_image.mat[:] = 0
+    loaded_image.mat += 1
+    del loaded_image
+
+    assert path.stat().st_size == num_bytes
+    assert np.array_equal(VImage.from_raw_file(path).mat, image.mat)
+
+
+def test_raw_file_invalid(tmp_path):
+    path = tmp_path / 'image.png'
+    create_images()[0].to_file(path)
+    with pytest.raises(RuntimeError):
+        VImage.from_raw_file(path)
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from vkit.image.rescale import rescale_mat
+from vkit.image.type import VImage
+from vkit.label.type import VImageMask, VImageScoreMap
+
+
+@pytest.mark.parametrize(
+    'src_shape,dst_shape',
+    [
+        ((8, 8), (1, 1)),
+        ((1, 1), (1, 1)),
+        ((1, 64), (1, 1)),
+        ((64, 1), (1, 1)),
+        ((1, 64), (1, 7)),
+        ((64, 1), (7, 1)),
+        ((300, 400), (1, 400)),
+        ((300, 400), (300, 1)),
+        ((300, 400), (1, 13)),
+        ((300, 400), (37, 1)),
+        ((3, 5), (600, 1000)),
+        ((300, 400), (600, 100)),
+    ],
+)
+@pytest.mark.parametrize('dtype', [np.uint8, np.float32])
+@pytest.mark.parametrize('num_channels', [0, 3])
+def test_rescale_mat_edge_sizes(src_shape, dst_shape, dtype, num_channels):
+    shape = src_shape if num_channels == 0 else (*src_shape, num_channels)
+    mat = np.random.default_rng(0).integers(0, 256, shape).astype(dtype)
+
+    rescaled_mat = rescale_mat(mat, *dst_shape)
+    assert rescaled_mat.shape[:2] == dst_shape
+    assert rescaled_mat.ndim == mat.ndim
+    assert rescaled_mat.dtype == mat.dtype
+
+
+def test_rescale_mat_constant():
+    mat = np.full((1000, 700, 3), 77, dtype=np.uint8)
+    assert (rescale_mat(mat, 1, 1) == 77).all()
+    assert (rescale_mat(mat, 90, 70) == 77).all()
+
+
+@pytest.mark.parametrize('dst_shape', [(150, 200), (100, 133), (37, 50)])
+def test_rescale_mat_pixel_center_aligned(dst_shape):
+    # The area average of a linear ramp is the value at the center of the area.
+    ys, xs = np.mgrid[0:300, 0:400]
+    mat = (0.3 * xs + 0.2 * ys).astype(np.float32)
+    rescaled_mat = rescale_mat(mat, *dst_shape)
+
+    height, width = dst_shape
+    ys, xs = np.mgrid[0:height, 0:width]
+    expected_mat = 0.3 * ((xs + 0.5) * 400 / width - 0.5) + 0.2 * ((ys + 0.5) * 300 / height - 0.5)
+    assert np.abs(rescaled_mat - expected_mat)[1:-1, 1:-1].max() < 0.1
+
+
+def test_rescale_mat_same_shape_copy():
+    mat = np.zeros((10, 10), dtype=np.uint8)
+    rescaled_mat = rescale_mat(mat, 10, 10)
+    assert not np.shares_memory(mat, rescaled_mat)
+
+
+def test_rescale_labels_to_one_pixel():
+    image = VImage(mat=np.zeros((64, 48, 3), dtype=np.uint8))
+    assert image.to_rescaled_image(1, 1).shape == (1, 1)
+    assert image.to_rescaled_image(1, 48).shape == (1, 48)
+
+    image_mask = VImageMask(mat=np.ones((64, 48), dtype=np.uint8))
+    rescaled_image_mask = image_mask.to_rescaled_image_mask(1, 5)
+    assert rescaled_image_mask.shape == (1, 5)
+    assert (rescaled_image_mask.mat == 1).all()
+
+    image_score_map = VImageScoreMap(mat=np.ones((64, 48), dtype=np.float32))
+    assert image_score_map.to_rescaled_image_score_map(3, 1).shape == (3, 1)
+
+
+def test_from_file_max_long_side_one(tmp_path):
+    path = tmp_path / 'image.png'
+    VImage(mat=np.zeros((30, 40, 3), dtype=np.uint8)).to_file(path)
+    assert max(VImage.from_file(path, max_long_side=1).shape) == 1
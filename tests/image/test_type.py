@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from vkit.image.type import VImage, VImageKind
+
+
+def create_image():
+    mat = np.random.default_rng(0).integers(0, 256, (32, 48, 3), dtype=np.uint8)
+    return VImage(mat=mat)
+
+
+def test_conversion_cache_copy():
+    image = create_image().enable_conversion_cache()
+
+    for _ in range(2):
+        for converted_image in (image.to_rgb_image(), image.to_hsv_image()):
+            assert converted_image.mat.flags.writeable
+            assert not np.shares_memory(converted_image.mat, image.mat)
+            converted_image.mat[0, 0] = 0
+
+    # Not polluted by the mutation above.
+    assert np.array_equal(image.to_hsv_image().mat, create_image().to_hsv_image().mat)
+
+
+def test_conversion_cache_no_copy():
+    image = create_image().enable_conversion_cache()
+
+    rgb_image = image.to_rgb_image(copy=False)
+    assert not rgb_image.mat.flags.writeable
+    assert np.shares_memory(rgb_image.mat, image.mat)
+
+    hsv_image = image.to_hsv_image(copy=False)
+    assert not hsv_image.mat.flags.writeable
+    assert image.to_hsv_image(copy=False).mat is hsv_image.mat
+
+
+def test_conversion_cache_invalidation():
+    image = create_image().enable_conversion_cache()
+    assert not image.mat.flags.writeable
+    with pytest.raises(ValueError):
+        image.mat[0, 0] = 0
+
+    gray_image = image.to_grayscale_image()
+    image.mat = image.mat[::-1]
+    assert not image.mat.flags.writeable
+    assert np.array_equal(image.to_grayscale_image().mat, gray_image.mat[::-1])
+
+
+def test_disable_conversion_cache():
+    image = create_image().enable_conversion_cache()
+    image.to_hsv_image()
+    image.disable_conversion_cache()
+    assert image.mat.flags.writeable
+    image.mat[0, 0] = 0
+    assert image.to_rgb_image().kind == VImageKind.RGB
+
+
+def test_same_kind_conversion_without_cache():
+    image = create_image()
+    assert not np.shares_memory(image.to_rgb_image().mat, image.mat)
+
+    view_image = image.to_rgb_image(copy=False)
+    assert np.shares_memory(view_image.mat, image.mat)
+    assert not view_image.mat.flags.writeable
+    assert image.mat.flags.writeable
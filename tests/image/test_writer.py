@@ -0,0 +1,40 @@
+import logging
+
+import numpy as np
+import pytest
+
+from vkit.image.type import VImage
+from vkit.image.writer import ImageWriter, ImageWriterConfig, ImageEncodeBackend
+
+
+def create_image():
+    mat = np.random.default_rng(0).integers(0, 256, (32, 48, 3), dtype=np.uint8)
+    return VImage(mat=mat)
+
+
+@pytest.mark.parametrize('backend', list(ImageEncodeBackend))
+def test_image_writer(tmp_path, backend):
+    image = create_image()
+    with ImageWriter(ImageWriterConfig(backend=backend, max_num_pending_images=2)) as writer:
+        for idx in range(5):
+            writer.write(image, tmp_path / f'{idx}.png')
+        writer.write(image.to_grayscale_image(), tmp_path / 'gray.jpg')
+
+    for idx in range(5):
+        assert np.array_equal(VImage.from_file(tmp_path / f'{idx}.png').mat, image.mat)
+    assert VImage.from_file(tmp_path / 'gray.jpg').shape == image.shape
+
+
+def test_image_writer_raises_write_error(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        with ImageWriter() as writer:
+            writer.write(create_image(), tmp_path / 'not_exists' / 'image.png')
+
+
+def test_image_writer_keeps_body_error(tmp_path, caplog):
+    with caplog.at_level(logging.ERROR):
+        with pytest.raises(KeyError):
+            with ImageWriter() as writer:
+                writer.write(create_image(), tmp_path / 'not_exists' / 'image.png')
+                raise KeyError()
+    assert 'Failed to write image.' in caplog.text
@@ -1,4 +1,4 @@
-from .interface import GeometricDistortion, GeometricDistortionResult
+from .interface import GeometricDistortion, GeometricDistortionResult, StateValidationConfig
 
 from .affine import (
     ShearHoriConfig,
@@ -25,3 +25,13 @@ from .camera import (
     CameraPlaneLineCurveConfig,
     camera_plane_line_curve,
 )
+from .template import (
+    DistortionTemplateDenseMapFormat,
+    DistortionTemplate,
+    DistortionTemplateConfig,
+    distortion_template,
+)
+from .elastic import (
+    ElasticConfig,
+    elastic,
+)
@@ -1,4 +1,5 @@
-from typing import Sequence
+from typing import Optional, Sequence, Tuple
+import copy
 import math
 
 import attr
@@ -8,10 +9,31 @@ import cv2 as cv
 
 from vkit.image.type import VImage
 from vkit.label.type import VImageScoreMap, VImageMask, VPointList, VPolygon
-from .interface import GeometricDistortion
+from .interface import (
+    GeometricDistortion,
+    GeometricDistortionResult,
+    get_output_window_box_and_shape,
+    prefilter_mat_for_output_window,
+    distort_mats_by_stacking_planes,
+)
+
+
+class AffineState:
+    # Set by affine_apply_output_window, the number of dst pixels per output pixel.
+    output_window_ratios: Optional[Tuple[float, float]] = None
+
+
+def prefilter_affine_mat(state, mat):
+    # Anti-aliasing for the output window with large reduction, not for the labels.
+    if state.output_window_ratios is None:
+        return mat
+    return prefilter_mat_for_output_window(mat, *state.output_window_ratios)
 
 
-def affine_mat(state, mat):
+def affine_mat(state, mat, prefilter: bool = False):
+    if prefilter:
+        mat = prefilter_affine_mat(state, mat)
+
     if state.trans_mat.shape[0] == 2:
         return cv.warpAffine(mat, state.trans_mat, state.dsize)
     else:
@@ -40,11 +62,116 @@ def affine_np_points(state, np_points: npt.NDArray):
     return new_np_points.transpose()
 
 
+def affine_validate_state(config, state, shape, validation_config):
+    if state.dsize is None:
+        # No need to transform.
+        return True
+
+    height, width = shape
+    dst_width, dst_height = state.dsize
+    if dst_height <= 0 or dst_width <= 0:
+        return False
+    return dst_height * dst_width <= validation_config.max_area_ratio * height * width
+
+
+def affine_apply_output_window(config, state, shape, output_box, output_shape):
+    trans_mat = state.trans_mat
+    dsize = state.dsize
+    if trans_mat is None:
+        height, width = shape
+        trans_mat = np.array([
+            (1, 0, 0),
+            (0, 1, 0),
+        ], dtype=np.float32)
+        dsize = (width, height)
+
+    dst_width, dst_height = dsize
+    output_box, output_shape = get_output_window_box_and_shape(
+        dst_height,
+        dst_width,
+        output_box,
+        output_shape,
+    )
+    output_height, output_width = output_shape
+    scale_y = output_height / output_box.height
+    scale_x = output_width / output_box.width
+
+    # Crop & resize (pixel centers aligned as cv.resize), composed with the original
+    # transformation.
+    window_mat = np.array(
+        [
+            (scale_x, 0, (0.5 - output_box.left) * scale_x - 0.5),
+            (0, scale_y, (0.5 - output_box.up) * scale_y - 0.5),
+            (0, 0, 1),
+        ],
+        dtype=np.float32,
+    )
+    if trans_mat.shape[0] == 2:
+        trans_mat = np.matmul(window_mat[:2, :2], trans_mat)
+        trans_mat[:, 2] += window_mat[:2, 2]
+    else:
+        trans_mat = np.matmul(window_mat, trans_mat)
+
+    state = copy.copy(state)
+    state.trans_mat = trans_mat.astype(np.float32)
+    state.dsize = (output_width, output_height)
+    state.output_window_ratios = (1 / scale_y, 1 / scale_x)
+    return state
+
+
+def affine_multi_targets(
+    config,
+    state,
+    image: VImage,
+    image_mask: Optional[VImageMask],
+    image_score_map: Optional[VImageScoreMap],
+    get_active_image_mask: bool,
+):
+    mats = [prefilter_affine_mat(state, image.mat)]
+    if image_mask:
+        mats.append(image_mask.mat)
+    if image_score_map:
+        mats.append(prefilter_affine_mat(state, image_score_map.mat))
+    if get_active_image_mask:
+        mats.append(np.ones(image.shape, dtype=np.uint8))
+
+    if state.trans_mat is not None:
+        # Targets of the same dtype are warped in one pass.
+        mats = distort_mats_by_stacking_planes(
+            mats,
+            lambda stacked_mats: [affine_mat(state, mat) for mat in stacked_mats],
+        )
+
+    result = GeometricDistortionResult(image=VImage(mat=mats.pop(0)))
+    if image_mask:
+        result.image_mask = VImageMask(mat=mats.pop(0))
+    if image_score_map:
+        result.image_score_map = VImageScoreMap(mat=mats.pop(0))
+    if get_active_image_mask:
+        result.active_image_mask = VImageMask(mat=mats.pop(0))
+    return result
+
+
 def affine_points(state, points: VPointList):
     new_np_points = affine_np_points(state, points.to_np_array())
     return VPointList.from_np_array(new_np_points)
 
 
+def affine_inverse_points(config, state, shape, points: VPointList):
+    if state.trans_mat is None or not points:
+        return points
+
+    if state.trans_mat.shape[0] == 2:
+        inv_trans_mat = cv.invertAffineTransform(state.trans_mat)
+    else:
+        assert state.trans_mat.shape[0] == 3
+        inv_trans_mat = np.linalg.inv(state.trans_mat)
+
+    inv_state = copy.copy(state)
+    inv_state.trans_mat = inv_trans_mat
+    return affine_points(inv_state, points)
+
+
 def affine_polygons(state, polygons: Sequence[VPolygon]):
     points_ranges = []
     points = VPointList()
@@ -66,7 +193,7 @@ class ShearHoriConfig:
     angle: int
 
 
-class ShearHoriState:
+class ShearHoriState(AffineState):
 
     def __init__(self, config, shape):
         tan_phi = math.tan(math.radians(config.angle))
@@ -93,28 +220,28 @@ class ShearHoriState:
             self.dsize = None
 
 
-def shear_hori_mat(config, state, mat):
-    return mat if config.angle == 0 else affine_mat(state, mat)
+def shear_hori_mat(config, state, mat, prefilter: bool = False):
+    return mat if state.trans_mat is None else affine_mat(state, mat, prefilter)
 
 
 def shear_hori_image(image, config, state):
-    return VImage(mat=shear_hori_mat(config, state, image.mat))
+    return VImage(mat=shear_hori_mat(config, state, image.mat, prefilter=True))
 
 
 def shear_hori_image_score_map(config, state, image_score_map):
-    return VImageScoreMap(mat=shear_hori_mat(config, state, image_score_map.mat))
+    return VImageScoreMap(mat=shear_hori_mat(config, state, image_score_map.mat, prefilter=True))
 
 
 def shear_hori_image_mask(config, state, image_mask):
     return VImageMask(mat=shear_hori_mat(config, state, image_mask.mat))
 
 
-def shear_hori_points(config, state, shape, point):
-    return point if config.angle == 0 else affine_points(state, point)
+def shear_hori_points(config, state, shape, points):
+    return points if state.trans_mat is None else affine_points(state, points)
 
 
 def shear_hori_polygons(config, state, shape, polygons):
-    return polygons if config.angle == 0 else affine_polygons(state, polygons)
+    return polygons if state.trans_mat is None else affine_polygons(state, polygons)
 
 
 shear_hori = GeometricDistortion(
@@ -128,6 +255,10 @@ shear_hori = GeometricDistortion(
     func_points=shear_hori_points,
     func_polygon=None,
     func_polygons=shear_hori_polygons,
+    func_validate_state=affine_validate_state,
+    func_apply_output_window=affine_apply_output_window,
+    func_multi_targets=affine_multi_targets,
+    func_inverse_points=affine_inverse_points,
 )
 
 
@@ -137,7 +268,7 @@ class ShearVertConfig:
     angle: int
 
 
-class ShearVertState:
+class ShearVertState(AffineState):
 
     def __init__(self, config, shape):
         tan_abs_phi = math.tan(math.radians(abs(config.angle)))
@@ -170,28 +301,28 @@ class ShearVertState:
             self.dsize = None
 
 
-def shear_vert_mat(config, state, mat):
-    return mat if config.angle == 0 else affine_mat(state, mat)
+def shear_vert_mat(config, state, mat, prefilter: bool = False):
+    return mat if state.trans_mat is None else affine_mat(state, mat, prefilter)
 
 
 def shear_vert_image(config, state, image):
-    return VImage(mat=shear_vert_mat(config, state, image.mat))
+    return VImage(mat=shear_vert_mat(config, state, image.mat, prefilter=True))
 
 
 def shear_vert_image_score_map(config, state, image_score_map):
-    return VImageScoreMap(mat=shear_vert_mat(config, state, image_score_map.mat))
+    return VImageScoreMap(mat=shear_vert_mat(config, state, image_score_map.mat, prefilter=True))
 
 
 def shear_vert_image_mask(config, state, image_mask):
     return VImageMask(mat=shear_vert_mat(config, state, image_mask.mat))
 
 
-def shear_vert_points(config, state, shape, point):
-    return point if config.angle == 0 else affine_points(state, point)
+def shear_vert_points(config, state, shape, points):
+    return points if state.trans_mat is None else affine_points(state, points)
 
 
 def shear_vert_polygons(config, state, shape, polygons):
-    return polygons if config.angle == 0 else affine_polygons(state, polygons)
+    return polygons if state.trans_mat is None else affine_polygons(state, polygons)
 
 
 shear_vert = GeometricDistortion(
@@ -205,6 +336,10 @@ shear_vert = GeometricDistortion(
     func_points=shear_vert_points,
     func_polygon=None,
     func_polygons=shear_vert_polygons,
+    func_validate_state=affine_validate_state,
+    func_apply_output_window=affine_apply_output_window,
+    func_multi_targets=affine_multi_targets,
+    func_inverse_points=affine_inverse_points,
 )
 
 
@@ -214,12 +349,18 @@ class RotateConfig:
     angle: int
 
 
-class RotateState:
+class RotateState(AffineState):
 
     def __init__(self, config, shape):
         height, width = shape
 
         angle = config.angle % 360
+        if angle == 0:
+            # No need to transform.
+            self.trans_mat = None
+            self.dsize = None
+            return
+
         rad = math.radians(angle)
 
         shift_x = 0
@@ -275,28 +416,28 @@ class RotateState:
         self.dsize = (math.ceil(dst_width), math.ceil(dst_height))
 
 
-def rotate_mat(config, state, mat):
-    return mat if config.angle == 0 else affine_mat(state, mat)
+def rotate_mat(config, state, mat, prefilter: bool = False):
+    return mat if state.trans_mat is None else affine_mat(state, mat, prefilter)
 
 
 def rotate_image(config, state, image):
-    return VImage(mat=rotate_mat(config, state, image.mat))
+    return VImage(mat=rotate_mat(config, state, image.mat, prefilter=True))
 
 
 def rotate_image_score_map(config, state, image_score_map):
-    return VImageScoreMap(mat=rotate_mat(config, state, image_score_map.mat))
+    return VImageScoreMap(mat=rotate_mat(config, state, image_score_map.mat, prefilter=True))
 
 
 def rotate_image_mask(config, state, image_mask):
     return VImageMask(mat=rotate_mat(config, state, image_mask.mat))
 
 
-def rotate_points(config, state, shape, point):
-    return point if config.angle == 0 else affine_points(state, point)
+def rotate_points(config, state, shape, points):
+    return points if state.trans_mat is None else affine_points(state, points)
 
 
 def rotate_polygons(config, state, shape, polygons):
-    return polygons if config.angle == 0 else affine_polygons(state, polygons)
+    return polygons if state.trans_mat is None else affine_polygons(state, polygons)
 
 
 rotate = GeometricDistortion(
@@ -310,6 +451,10 @@ rotate = GeometricDistortion(
     func_points=rotate_points,
     func_polygon=None,
     func_polygons=rotate_polygons,
+    func_validate_state=affine_validate_state,
+    func_apply_output_window=affine_apply_output_window,
+    func_multi_targets=affine_multi_targets,
+    func_inverse_points=affine_inverse_points,
 )
 
 
@@ -321,9 +466,15 @@ class SkewHoriConfig:
     ratio: float
 
 
-class SkewHoriState:
+class SkewHoriState(AffineState):
 
     def __init__(self, config, shape):
+        if config.ratio == 0:
+            # No need to transform.
+            self.trans_mat = None
+            self.dsize = None
+            return
+
         height, width = shape
 
         src_xy_pairs = [
@@ -360,28 +511,28 @@ class SkewHoriState:
         self.dsize = (width, height)
 
 
-def skew_hori_mat(config, state, mat):
-    return mat if config.ratio == 0 else affine_mat(state, mat)
+def skew_hori_mat(config, state, mat, prefilter: bool = False):
+    return mat if state.trans_mat is None else affine_mat(state, mat, prefilter)
 
 
 def skew_hori_image(config, state, image):
-    return VImage(mat=skew_hori_mat(config, state, image.mat))
+    return VImage(mat=skew_hori_mat(config, state, image.mat, prefilter=True))
 
 
 def skew_hori_image_score_map(config, state, image_score_map):
-    return VImageScoreMap(mat=skew_hori_mat(config, state, image_score_map.mat))
+    return VImageScoreMap(mat=skew_hori_mat(config, state, image_score_map.mat, prefilter=True))
 
 
 def skew_hori_image_mask(config, state, image_mask):
     return VImageMask(mat=skew_hori_mat(config, state, image_mask.mat))
 
 
-def skew_hori_points(config, state, shape, point):
-    return point if config.angle == 0 else affine_points(state, point)
+def skew_hori_points(config, state, shape, points):
+    return points if state.trans_mat is None else affine_points(state, points)
 
 
 def skew_hori_polygons(config, state, shape, polygons):
-    return polygons if config.ratio == 0 else affine_polygons(state, polygons)
+    return polygons if state.trans_mat is None else affine_polygons(state, polygons)
 
 
 skew_hori = GeometricDistortion(
@@ -395,6 +546,10 @@ skew_hori = GeometricDistortion(
     func_points=skew_hori_points,
     func_polygon=None,
     func_polygons=skew_hori_polygons,
+    func_validate_state=affine_validate_state,
+    func_apply_output_window=affine_apply_output_window,
+    func_multi_targets=affine_multi_targets,
+    func_inverse_points=affine_inverse_points,
 )
 
 
@@ -406,9 +561,15 @@ class SkewVertConfig:
     ratio: float
 
 
-class SkewVertState:
+class SkewVertState(AffineState):
 
     def __init__(self, config, shape):
+        if config.ratio == 0:
+            # No need to transform.
+            self.trans_mat = None
+            self.dsize = None
+            return
+
         height, width = shape
 
         src_xy_pairs = [
@@ -445,28 +606,28 @@ class SkewVertState:
         self.dsize = (width, height)
 
 
-def skew_vert_mat(config, state, mat):
-    return mat if config.ratio == 0 else affine_mat(state, mat)
+def skew_vert_mat(config, state, mat, prefilter: bool = False):
+    return mat if state.trans_mat is None else affine_mat(state, mat, prefilter)
 
 
 def skew_vert_image(config, state, image):
-    return VImage(mat=skew_vert_mat(config, state, image.mat))
+    return VImage(mat=skew_vert_mat(config, state, image.mat, prefilter=True))
 
 
 def skew_vert_image_score_map(config, state, image_score_map):
-    return VImageScoreMap(mat=skew_vert_mat(config, state, image_score_map.mat))
+    return VImageScoreMap(mat=skew_vert_mat(config, state, image_score_map.mat, prefilter=True))
 
 
 def skew_vert_image_mask(config, state, image_mask):
     return VImageMask(mat=skew_vert_mat(config, state, image_mask.mat))
 
 
-def skew_vert_points(config, state, shape, point):
-    return point if config.angle == 0 else affine_points(state, point)
+def skew_vert_points(config, state, shape, points):
+    return points if state.trans_mat is None else affine_points(state, points)
 
 
 def skew_vert_polygons(config, state, shape, polygons):
-    return polygons if config.ratio == 0 else affine_polygons(state, polygons)
+    return polygons if state.trans_mat is None else affine_polygons(state, polygons)
 
 
 skew_vert = GeometricDistortion(
@@ -480,6 +641,10 @@ skew_vert = GeometricDistortion(
     func_points=skew_vert_points,
     func_polygon=None,
     func_polygons=skew_vert_polygons,
+    func_validate_state=affine_validate_state,
+    func_apply_output_window=affine_apply_output_window,
+    func_multi_targets=affine_multi_targets,
+    func_inverse_points=affine_inverse_points,
 )
 
 
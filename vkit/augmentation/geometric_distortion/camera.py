@@ -7,7 +7,7 @@ import numpy as np
 import numpy.typing as npt
 
 from vkit.label.type import VPoint, VPointList
-from .grid_rendering.type import VImageGrid
+from .grid_rendering.type import VImageGrid, VImageDenseMap
 from .grid_rendering.grid_creator import create_src_image_grid
 from .grid_rendering.interface import PointProjector
 from .interface import GeometricDistortionImageGridBased, StateImageGridBased
@@ -16,6 +16,10 @@ from .interface import GeometricDistortionImageGridBased, StateImageGridBased
 class Point2dTo3dStrategy:
 
     def generate_np_3d_points(self, points: VPointList) -> npt.NDArray:
+        return self.generate_np_3d_points_from_np_2d_points(points.to_np_array().astype(np.float32))
+
+    def generate_np_3d_points_from_np_2d_points(self, np_2d_points: npt.NDArray) -> npt.NDArray:
+        # np_2d_points: (*, 2) in xy order, could be non-integer.
         raise NotImplementedError()
 
 
@@ -116,15 +120,31 @@ class CameraModel:
         )
         self.intrinsic_mat = self.generate_intrinsic_mat(config.focal_length)
 
-    def project_np_points_from_3d_to_2d(self, np_3d_points):
-        camera_2d_points, _ = cv.projectPoints(
-            np_3d_points,
-            self.rotation_vec,
-            self.translation_vec,
-            self.intrinsic_mat,
-            np.zeros(5),
+        rotation_mat, _ = cv.Rodrigues(self.rotation_vec)
+        # (3, 4)
+        self.projection_mat = np.matmul(
+            self.intrinsic_mat.astype(np.float64),
+            np.hstack((rotation_mat, self.translation_vec.reshape(-1, 1))),
         )
-        return camera_2d_points.reshape(-1, 2)
+        # For projecting 2d points back to the z=0 plane.
+        self.plane_homography_mat_inv = np.linalg.inv(self.projection_mat[:, [0, 1, 3]])
+
+    def project_np_points_from_3d_to_2d(self, np_3d_points):
+        # Pinhole model without distortion, the same as cv.projectPoints but way faster for
+        # large number of points.
+        np_3d_points = np.hstack((np_3d_points, np.ones((np_3d_points.shape[0], 1))))
+        camera_2d_points = np.matmul(self.projection_mat, np_3d_points.transpose())
+        with np.errstate(divide='ignore', invalid='ignore'):
+            camera_2d_points = camera_2d_points[:2] / camera_2d_points[2]
+        return camera_2d_points.transpose()
+
+    def project_np_points_from_2d_to_plane(self, np_2d_points):
+        # The intersection of camera ray and the z=0 plane.
+        np_2d_points = np.hstack((np_2d_points, np.ones((np_2d_points.shape[0], 1))))
+        np_plane_points = np.matmul(self.plane_homography_mat_inv, np_2d_points.transpose())
+        with np.errstate(divide='ignore', invalid='ignore'):
+            np_plane_points = np_plane_points[:2] / np_plane_points[2]
+        return np_plane_points.transpose()
 
 
 class CameraPointProjector(PointProjector):
@@ -141,6 +161,67 @@ class CameraPointProjector(PointProjector):
     def project_point(self, src_point: VPoint):
         return self.project_points(VPointList.from_point(src_point))[0]
 
+    def project_np_2d_points(self, np_src_points: npt.NDArray):
+        np_3d_points = self.point_2d_to_3d_strategy.generate_np_3d_points_from_np_2d_points(
+            np_src_points
+        )
+        return self.camera_model.project_np_points_from_3d_to_2d(np_3d_points)
+
+    def unproject_np_2d_points(
+        self,
+        np_dst_points: npt.NDArray,
+        num_iterations: int = 10,
+        step: float = 0.5,
+        tolerance: float = 0.05,
+    ):
+        '''
+        Solve the src points of dst points by intersecting the camera rays with the surface.
+        Initialized by the intersection with the z=0 plane, then refined by Newton's method
+        with the Jacobian estimated by forward difference.
+        Returns the src points and the residuals (in dst pixels, inf if diverged).
+        '''
+        np_dst_points = np_dst_points.astype(np.float64)
+        np_src_points = self.camera_model.project_np_points_from_2d_to_plane(np_dst_points)
+
+        residuals = np.full(np_dst_points.shape[0], np.inf)
+        # Only iterate the points not yet converged.
+        indices = np.arange(np_dst_points.shape[0])
+
+        for iteration in range(num_iterations + 1):
+            cur_src_points = np_src_points[indices]
+            cur_dst_points = np_dst_points[indices]
+
+            cur_deltas = self.project_np_2d_points(cur_src_points) - cur_dst_points
+            cur_residuals = np.abs(cur_deltas).max(axis=1)
+            residuals[indices] = cur_residuals
+
+            # NOTE: NaN residual (diverged) is dropped as well.
+            with np.errstate(invalid='ignore'):
+                not_converged_mask = cur_residuals > tolerance
+            indices = indices[not_converged_mask]
+            if iteration == num_iterations or indices.shape[0] == 0:
+                break
+
+            cur_src_points = cur_src_points[not_converged_mask]
+            cur_dst_points = cur_dst_points[not_converged_mask]
+            cur_deltas = cur_deltas[not_converged_mask]
+
+            # Jacobian.
+            cur_deltas_x = self.project_np_2d_points(cur_src_points + (step, 0.0)) - cur_dst_points
+            cur_deltas_y = self.project_np_2d_points(cur_src_points + (0.0, step)) - cur_dst_points
+            jac_00, jac_10 = ((cur_deltas_x - cur_deltas) / step).transpose()
+            jac_01, jac_11 = ((cur_deltas_y - cur_deltas) / step).transpose()
+
+            # Solve the 2x2 linear system.
+            delta_u, delta_v = cur_deltas.transpose()
+            with np.errstate(divide='ignore', invalid='ignore'):
+                det = jac_00 * jac_11 - jac_01 * jac_10
+                np_src_points[indices, 0] -= (jac_11 * delta_u - jac_01 * delta_v) / det
+                np_src_points[indices, 1] -= (jac_00 * delta_v - jac_10 * delta_u) / det
+
+        residuals[~np.isfinite(residuals)] = np.inf
+        return np_src_points, residuals
+
 
 class CameraOperationState(StateImageGridBased):
 
@@ -206,6 +287,8 @@ class CameraOperationState(StateImageGridBased):
         grid_size,
         point_2d_to_3d_strategy,
         camera_model_config,
+        enable_dense_map=False,
+        uniform_cell_max_delta=None,
     ):
         src_image_grid = create_src_image_grid(height, width, grid_size)
 
@@ -221,7 +304,49 @@ class CameraOperationState(StateImageGridBased):
             camera_model_config,
         )
 
-        super().__init__(src_image_grid, point_projector)
+        super().__init__(
+            src_image_grid,
+            point_projector,
+            enable_dense_map=enable_dense_map,
+            uniform_cell_max_delta=uniform_cell_max_delta,
+        )
+
+    def inverse_np_points(self, np_points):
+        if not self.enable_dense_map:
+            return super().inverse_np_points(np_points)
+
+        # Consistent with the dense map.
+        np_dst_points = np_points / (self.rescale_ratio_x, self.rescale_ratio_y) \
+            + (self.shift_amount_x, self.shift_amount_y)
+        np_src_points, residuals = self.point_projector.unproject_np_2d_points(np_dst_points)
+
+        # Not converged, fallback to the grid cells.
+        with np.errstate(invalid='ignore'):
+            fallback_mask = ~(residuals <= 0.5)
+        if fallback_mask.any():
+            np_src_points[fallback_mask] = super().inverse_np_points(np_points[fallback_mask])
+        return np_src_points
+
+    def generate_dense_map(self, dst_ys, dst_xs):
+        if not self.enable_dense_map:
+            return super().generate_dense_map(dst_ys, dst_xs)
+
+        dst_xs, dst_ys = np.meshgrid(
+            dst_xs / self.rescale_ratio_x + self.shift_amount_x,
+            dst_ys / self.rescale_ratio_y + self.shift_amount_y,
+        )
+        np_dst_points = np.stack((dst_xs.ravel(), dst_ys.ravel()), axis=1)
+
+        np_src_points, residuals = self.point_projector.unproject_np_2d_points(np_dst_points)
+
+        return VImageDenseMap.from_np_src_points(
+            np_src_points,
+            # Not converged.
+            residuals > 0.5,
+            shape=dst_xs.shape,
+            src_height=self.src_image_grid.image_height,
+            src_width=self.src_image_grid.image_width,
+        )
 
 
 @attr.define
@@ -233,6 +358,10 @@ class CameraCubicCurveConfig:
     curve_scale: float
     camera_model_config: CameraModelConfig
     grid_size: int
+    # Render by solving the src of each dst pixel, instead of blending the grid cells.
+    enable_dense_map: bool = False
+    # Skip resampling the uniform grid cells, e.g. the background of sparse documents.
+    uniform_cell_max_delta: Optional[int] = None
 
 
 class CameraCubicCurvePoint2dTo3dStrategy(Point2dTo3dStrategy):
@@ -278,9 +407,7 @@ class CameraCubicCurvePoint2dTo3dStrategy(Point2dTo3dStrategy):
 
         self.curve_scale = curve_scale
 
-    def generate_np_3d_points(self, points: VPointList) -> npt.NDArray:
-        np_2d_points = points.to_np_array().astype(np.float32)
-
+    def generate_np_3d_points_from_np_2d_points(self, np_2d_points: npt.NDArray) -> npt.NDArray:
         # Project based on theta.
         plane_projected_points = np.matmul(self.rotation_mat, np_2d_points.transpose())
         plane_projected_xs = plane_projected_points[0]
@@ -320,6 +447,8 @@ class CameraCubicCurveState(CameraOperationState):
                 config.curve_scale,
             ),
             config.camera_model_config,
+            enable_dense_map=config.enable_dense_map,
+            uniform_cell_max_delta=config.uniform_cell_max_delta,
         )
 
 
@@ -361,9 +490,7 @@ class CameraPlaneLinePoint2dTo3dStrategy(Point2dTo3dStrategy):
         # Deformation vector.
         self.perturb_vec = np.array(perturb_vec, dtype=np.float32)
 
-    def generate_np_3d_points(self, points: VPointList) -> npt.NDArray:
-        np_2d_points = points.to_np_array().astype(np.float32)
-
+    def generate_np_3d_points_from_np_2d_points(self, np_2d_points: npt.NDArray) -> npt.NDArray:
         # Calculate weights.
         distances = np.abs((np_2d_points * self.line_params_a_b).sum(axis=1) + self.line_param_c)
         norm_distances = distances / self.distance_max
@@ -386,6 +513,10 @@ class CameraPlaneLineFoldConfig:
     fold_alpha: float
     camera_model_config: CameraModelConfig
     grid_size: int
+    # Render by solving the src of each dst pixel, instead of blending the grid cells.
+    enable_dense_map: bool = False
+    # Skip resampling the uniform grid cells, e.g. the background of sparse documents.
+    uniform_cell_max_delta: Optional[int] = None
 
 
 class CameraPlaneLineFoldState(CameraOperationState):
@@ -411,6 +542,8 @@ class CameraPlaneLineFoldState(CameraOperationState):
                 weights_func=self.weights_func,
             ),
             config.camera_model_config,
+            enable_dense_map=config.enable_dense_map,
+            uniform_cell_max_delta=config.uniform_cell_max_delta,
         )
 
 
@@ -429,6 +562,10 @@ class CameraPlaneLineCurveConfig:
     curve_alpha: float
     camera_model_config: CameraModelConfig
     grid_size: int
+    # Render by solving the src of each dst pixel, instead of blending the grid cells.
+    enable_dense_map: bool = False
+    # Skip resampling the uniform grid cells, e.g. the background of sparse documents.
+    uniform_cell_max_delta: Optional[int] = None
 
 
 class CameraPlaneLineCurveState(CameraOperationState):
@@ -454,6 +591,8 @@ class CameraPlaneLineCurveState(CameraOperationState):
                 weights_func=self.weights_func,
             ),
             config.camera_model_config,
+            enable_dense_map=config.enable_dense_map,
+            uniform_cell_max_delta=config.uniform_cell_max_delta,
         )
 
 
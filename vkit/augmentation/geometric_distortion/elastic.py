@@ -0,0 +1,152 @@
+from typing import Any, Optional, Tuple
+
+import attr
+import numpy as np
+import cv2 as cv
+
+from vkit.label.type import VPoint
+from .grid_rendering.interface import PointProjector
+from .grid_rendering.grid_creator import create_src_image_grid
+from .interface import GeometricDistortionImageGridBased, StateImageGridBased
+
+
+@attr.define
+class ElasticConfig:
+    # The max displacement, in pixels.
+    alpha: float
+    # The smoothness of the displacement field, in pixels.
+    sigma: float
+    grid_size: int
+    # Skip resampling the uniform grid cells, e.g. the background of sparse documents.
+    uniform_cell_max_delta: Optional[int] = None
+    rnd_state: Any = None
+
+
+class ElasticPointProjector(PointProjector):
+
+    def __init__(self, grid_size: int, np_field_x: np.ndarray, np_field_y: np.ndarray):
+        # The displacement field sampled at (y * grid_size, x * grid_size).
+        self.grid_size = grid_size
+        self.np_field_x = np_field_x
+        self.np_field_y = np_field_y
+
+    def project_np_points(self, np_points: np.ndarray):
+        # np_points: (*, 2) in xy order.
+        num_rows, num_cols = self.np_field_x.shape
+        np_field_xs = np_points[:, 0] / self.grid_size
+        np_field_ys = np_points[:, 1] / self.grid_size
+
+        # Bilinear interpolation.
+        x0 = np.clip(np.floor(np_field_xs).astype(np.int32), 0, num_cols - 2)
+        y0 = np.clip(np.floor(np_field_ys).astype(np.int32), 0, num_rows - 2)
+        ratio_x = np_field_xs - x0
+        ratio_y = np_field_ys - y0
+
+        displacements = []
+        for np_field in (self.np_field_x, self.np_field_y):
+            row0 = np_field[y0, x0] * (1 - ratio_x) + np_field[y0, x0 + 1] * ratio_x
+            row1 = np_field[y0 + 1, x0] * (1 - ratio_x) + np_field[y0 + 1, x0 + 1] * ratio_x
+            displacements.append(row0 * (1 - ratio_y) + row1 * ratio_y)
+
+        return np_points + np.stack(displacements, axis=-1)
+
+    def project_point(self, src_point):
+        return self.project_points([src_point])[0]
+
+    def project_points(self, src_points):
+        np_dst_points = self.project_np_points(
+            np.asarray([point.to_xy_pair() for point in src_points], dtype=np.float64)
+        )
+        return [VPoint(y=dst_y, x=dst_x) for dst_x, dst_y in np_dst_points]
+
+
+class ElasticState(StateImageGridBased):
+
+    @staticmethod
+    def generate_np_field(
+        num_rows: int,
+        num_cols: int,
+        grid_size: int,
+        sigma: float,
+        rnd: np.random.RandomState,
+    ):
+        # White noise smoothed on the coarse lattice, hence the cost depends on grid_size instead
+        # of the image size. The sigma is converted to the lattice unit.
+        np_field = rnd.uniform(-1.0, 1.0, (num_rows, num_cols)).astype(np.float32)
+        lattice_sigma = sigma / grid_size
+        if lattice_sigma > 0:
+            np_field = cv.GaussianBlur(
+                np_field,
+                (0, 0),
+                sigmaX=lattice_sigma,
+                borderType=cv.BORDER_REFLECT,
+            )
+
+        # Normalize to [-1, 1], instead of scaling by a magic alpha that depends on sigma.
+        max_abs = np.abs(np_field).max()
+        if max_abs > 0:
+            np_field /= max_abs
+        return np_field
+
+    def __init__(self, config: ElasticConfig, shape: Tuple[int, int], rnd: np.random.RandomState):
+        height, width = shape
+
+        # Cover [0, height - 1] x [0, width - 1].
+        num_rows = (height - 1 + config.grid_size - 1) // config.grid_size + 1
+        num_cols = (width - 1 + config.grid_size - 1) // config.grid_size + 1
+        num_rows = max(num_rows, 2)
+        num_cols = max(num_cols, 2)
+
+        np_field_x, np_field_y = [
+            config.alpha * self.generate_np_field(
+                num_rows,
+                num_cols,
+                config.grid_size,
+                config.sigma,
+                rnd,
+            ) for _ in range(2)
+        ]
+
+        super().__init__(
+            src_image_grid=create_src_image_grid(height, width, config.grid_size),
+            point_projector=ElasticPointProjector(config.grid_size, np_field_x, np_field_y),
+            uniform_cell_max_delta=config.uniform_cell_max_delta,
+        )
+
+
+elastic = GeometricDistortionImageGridBased(
+    config_cls=ElasticConfig,
+    state_cls=ElasticState,
+)
+
+
+def debug():
+    from vkit.opt import get_data_folder
+    folder = get_data_folder(__file__)
+
+    from vkit.image.type import VImage
+    from vkit.label.type import VPointList, VPolygon
+    from .grid_rendering.visualization import visualize_image_grid
+
+    image = VImage.from_file(f'{folder}/Lenna.png')
+    src_polygon = VPolygon(
+        VPointList([
+            VPoint(y=100, x=100),
+            VPoint(y=100, x=300),
+            VPoint(y=300, x=300),
+            VPoint(y=300, x=100),
+        ])
+    )
+
+    rnd = np.random.RandomState(13370)
+    for idx in range(5):
+        result = elastic.distort(
+            ElasticConfig(alpha=8, sigma=40, grid_size=10),
+            image,
+            polygon=src_polygon,
+            get_state=True,
+            rnd=rnd,
+        )
+        result.image.to_file(f'{folder}/elastic-{idx}.png')
+        dst_image_grid = result.state.dst_image_grid
+        visualize_image_grid(dst_image_grid).to_file(f'{folder}/elastic-grid-{idx}.png')
@@ -0,0 +1,116 @@
+import numpy as np
+import numpy.typing as npt
+import cv2 as cv
+
+from vkit.image.type import VImage
+from vkit.label.type import VImageScoreMap, VImageMask
+from .type import VImageGrid, VImageDenseMap
+
+
+def remap_src_to_dst_mat(src_mat, dense_map: VImageDenseMap, cv_remap_interpolation: int):
+    # NOTE: dst pixel mapped to -1 (invalid) is filled with zero.
+    return cv.remap(
+        src_mat,
+        dense_map.map_x,
+        dense_map.map_y,
+        cv_remap_interpolation,
+        borderMode=cv.BORDER_CONSTANT,
+        borderValue=0,
+    )
+
+
+def blend_src_to_dst_image_by_dense_map(src_image: VImage, dense_map: VImageDenseMap):
+    mat = remap_src_to_dst_mat(src_image.mat, dense_map, cv.INTER_LINEAR)
+    return VImage(mat=mat, kind=src_image.kind)
+
+
+def blend_src_to_dst_image_score_map_by_dense_map(
+    src_image_score_map: VImageScoreMap,
+    dense_map: VImageDenseMap,
+):
+    mat = remap_src_to_dst_mat(src_image_score_map.mat, dense_map, cv.INTER_LINEAR)
+    return VImageScoreMap(mat=mat)
+
+
+def blend_src_to_dst_image_mask_by_dense_map(
+    src_image_mask: VImageMask,
+    dense_map: VImageDenseMap,
+):
+    mat = remap_src_to_dst_mat(src_image_mask.mat, dense_map, cv.INTER_NEAREST)
+    return VImageMask(mat=mat)
+
+
+def generate_dense_map_from_image_grids(
+    src_image_grid: VImageGrid,
+    dst_image_grid: VImageGrid,
+    dst_ys: npt.NDArray,
+    dst_xs: npt.NDArray,
+):
+    # dst_ys & dst_xs should be evenly spaced, the dense map is (len(dst_ys), len(dst_xs)).
+    height = dst_ys.shape[0]
+    width = dst_xs.shape[0]
+    step_y = (dst_ys[-1] - dst_ys[0]) / (height - 1) if height > 1 else 1.0
+    step_x = (dst_xs[-1] - dst_xs[0]) / (width - 1) if width > 1 else 1.0
+
+    map_x = np.full((height, width), -1, dtype=np.float32)
+    map_y = np.full((height, width), -1, dtype=np.float32)
+
+    src_height = src_image_grid.image_height
+    src_width = src_image_grid.image_width
+
+    # (num_rows - 1, num_cols - 1, 4, 2), the dst cells in the coordinate of dense map.
+    src_np_cells = src_image_grid.to_np_cells()
+    map_np_cells = (dst_image_grid.to_np_cells() - (dst_xs[0], dst_ys[0])) / (step_x, step_y)
+
+    # Only the cells intersecting with the dense map.
+    map_np_cells_min = np.floor(map_np_cells.min(axis=2)).astype(np.int64)
+    map_np_cells_max = np.ceil(map_np_cells.max(axis=2)).astype(np.int64)
+    np_visible_mask = ((map_np_cells_max[:, :, 0] >= 0)
+                       & (map_np_cells_min[:, :, 0] < width)
+                       & (map_np_cells_max[:, :, 1] >= 0)
+                       & (map_np_cells_min[:, :, 1] < height))
+
+    # NOTE: the same order as blend_src_to_dst_image, the latter cell overwrites the former.
+    for polygon_row, polygon_col in np.argwhere(np_visible_mask):
+        src_polygon_points = src_np_cells[polygon_row, polygon_col]
+        map_polygon_points = map_np_cells[polygon_row, polygon_col].astype(np.float32)
+
+        trans_mat = cv.getPerspectiveTransform(
+            map_polygon_points,
+            src_polygon_points,
+            cv.DECOMP_SVD,
+        )
+
+        # Rasterize the clipped polygon.
+        left, up = np.maximum(map_np_cells_min[polygon_row, polygon_col], 0)
+        right, down = np.minimum(
+            map_np_cells_max[polygon_row, polygon_col],
+            (width - 1, height - 1),
+        )
+        mask = np.zeros((down + 1 - up, right + 1 - left), dtype=np.uint8)
+        # Fixed-point coordinates for the sub-pixel precision.
+        shift = 4
+        cv.fillPoly(
+            mask,
+            [np.round((map_polygon_points - (left, up)) * (1 << shift)).astype(np.int32)],
+            1,
+            shift=shift,
+        )
+        ys, xs = mask.nonzero()
+        ys += up
+        xs += left
+
+        # (3, *)
+        src_points = np.matmul(trans_mat, np.vstack((xs, ys, np.ones_like(ys))))
+        denominator = src_points[2, :]
+        non_zero_mask = (denominator != 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            src_points = src_points[:2, :] / denominator
+
+        ys = ys[non_zero_mask]
+        xs = xs[non_zero_mask]
+        # Clip to avoid out-of-bound, as in blend_polygon_from_src_to_dst_mat.
+        map_x[ys, xs] = np.clip(src_points[0, non_zero_mask], 0, src_width - 1)
+        map_y[ys, xs] = np.clip(src_points[1, non_zero_mask], 0, src_height - 1)
+
+    return VImageDenseMap(map_x=map_x, map_y=map_y)
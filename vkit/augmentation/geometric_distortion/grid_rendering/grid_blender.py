@@ -1,3 +1,5 @@
+from typing import Optional, Sequence
+
 import numpy as np
 import cv2 as cv
 
@@ -68,6 +70,16 @@ def blend_polygon_from_src_to_dst_mat(
     dst_mat,
     dst_polygon: VPolygon,
 ):
+    blend_polygon_from_src_to_dst_mats([src_mat], src_polygon, [dst_mat], dst_polygon)
+
+
+def blend_polygon_from_src_to_dst_mats(
+    src_mats: Sequence[np.ndarray],
+    src_polygon: VPolygon,
+    dst_mats: Sequence[np.ndarray],
+    dst_polygon: VPolygon,
+):
+    # The coordinates are calculated once and shared by all the mats (of the same shape).
     src_polygon_points = src_polygon.to_np_array()
     dst_polygon_points = dst_polygon.to_np_array()
 
@@ -113,8 +125,8 @@ def blend_polygon_from_src_to_dst_mat(
     src_x = src_all_points[:, 0]
 
     # Clip to avoid out-of-bound.
-    src_height = src_mat.shape[0]
-    src_width = src_mat.shape[1]
+    src_height = src_mats[0].shape[0]
+    src_width = src_mats[0].shape[1]
     src_y = np.clip(src_y, 0, src_height - 1)
     src_x = np.clip(src_x, 0, src_width - 1)
 
@@ -125,64 +137,221 @@ def blend_polygon_from_src_to_dst_mat(
     src_y_ceil = np.ceil(src_y).astype(np.int32)
     src_x_ceil = np.ceil(src_x).astype(np.int32)
 
-    src_ratio_y = src_y - src_y_floor
-    src_ratio_x = src_x - src_x_floor
-
-    if src_mat.ndim == 3:
-        num_channels = src_mat.shape[2]
-        src_ratio_y = np.tile(np.expand_dims(src_ratio_y, axis=-1), (1, 1, num_channels))
-        src_ratio_x = np.tile(np.expand_dims(src_ratio_x, axis=-1), (1, 1, num_channels))
-
-    dst_mat[dst_y, dst_x] = bilinear_interpolation(
-        x=src_ratio_x,
-        y=src_ratio_y,
-        # Four images.
-        v11=src_mat[src_y_floor, src_x_floor],
-        v12=src_mat[src_y_ceil, src_x_floor],
-        v21=src_mat[src_y_floor, src_x_ceil],
-        v22=src_mat[src_y_ceil, src_x_ceil],
+    src_ratio_y_2d = src_y - src_y_floor
+    src_ratio_x_2d = src_x - src_x_floor
+
+    for src_mat, dst_mat in zip(src_mats, dst_mats):
+        src_ratio_y = src_ratio_y_2d
+        src_ratio_x = src_ratio_x_2d
+        if src_mat.ndim == 3:
+            num_channels = src_mat.shape[2]
+            src_ratio_y = np.tile(np.expand_dims(src_ratio_y, axis=-1), (1, 1, num_channels))
+            src_ratio_x = np.tile(np.expand_dims(src_ratio_x, axis=-1), (1, 1, num_channels))
+
+        dst_mat[dst_y, dst_x] = bilinear_interpolation(
+            x=src_ratio_x,
+            y=src_ratio_y,
+            # Four images.
+            v11=src_mat[src_y_floor, src_x_floor],
+            v12=src_mat[src_y_ceil, src_x_floor],
+            v21=src_mat[src_y_floor, src_x_ceil],
+            v22=src_mat[src_y_ceil, src_x_ceil],
+        )
+
+
+def get_np_src_grid_ys_xs(src_image_grid: VImageGrid):
+    # Only support the grid created by create_src_image_grid.
+    assert src_image_grid.grid_size
+    ys = np.asarray([points[0].y for points in src_image_grid.points_2d], dtype=np.int64)
+    xs = np.asarray([point.x for point in src_image_grid.points_2d[0]], dtype=np.int64)
+    return ys, xs
+
+
+def reduce_mat_by_src_grid_cells(ufunc, mat, ys, xs):
+    # Reduce blocks [ys[i], ys[i + 1]) x [xs[j], xs[j + 1]), the last block is closed.
+    return ufunc.reduceat(ufunc.reduceat(mat, ys[:-1], axis=0), xs[:-1], axis=1)
+
+
+def estimate_background_value(src_mat):
+    # The most frequent value of each channel, sampled sparsely. src_mat should be uint8.
+    np_samples = src_mat[::4, ::4]
+    if np_samples.ndim == 2:
+        return np.bincount(np_samples.ravel(), minlength=256).argmax()
+    np_samples = np_samples.reshape(-1, np_samples.shape[2])
+    return np.asarray(
+        [np.bincount(np_channel, minlength=256).argmax() for np_channel in np_samples.T],
+        dtype=np.uint8,
     )
 
 
-def blend_src_to_dst_image(src_image, src_image_grid, dst_image_grid):
-    dst_image = create_image_from_image_grid(dst_image_grid, src_image.kind)
+def generate_src_content_mask(src_mat, uniform_cell_max_delta: int):
+    # The pixel differs from the background by more than uniform_cell_max_delta in any channel is
+    # treated as content. Only uint8 is supported, returns None otherwise.
+    if src_mat.dtype != np.uint8:
+        return None
+
+    background_mat = np.empty_like(src_mat)
+    background_mat[:] = estimate_background_value(src_mat)
+    delta_mat = cv.absdiff(src_mat, background_mat)
+    if delta_mat.ndim == 3:
+        delta_mat = delta_mat.max(axis=2)
+    return VImageMask(mat=(delta_mat > uniform_cell_max_delta).astype(np.uint8))
 
+
+def generate_np_uniform_cells_mask_and_values(
+    src_mat,
+    src_image_grid: VImageGrid,
+    uniform_cell_max_delta: int,
+    src_content_mask: Optional[VImageMask] = None,
+):
+    ys, xs = get_np_src_grid_ys_xs(src_image_grid)
+
+    # Bilinear interpolation in cell (i, j) reads [ys[i], ys[i + 1]] x [xs[j], xs[j + 1]], plus
+    # 1-pixel margin since the rasterized dst polygon could be mapped slightly outside of the cell.
+    # Hence extend each block [ys[i], ys[i + 1]) to [ys[i] - 1, ys[i + 1] + 1] before reducing.
+    kernel = np.ones((4, 4), dtype=np.uint8)
+    src_max_mat = cv.dilate(src_mat, kernel, anchor=(1, 1))
+    src_min_mat = cv.erode(src_mat, kernel, anchor=(1, 1))
+
+    # (num_rows - 1, num_cols - 1[, num_channels])
+    np_cells_delta = (
+        reduce_mat_by_src_grid_cells(np.maximum, src_max_mat, ys, xs).astype(np.float32)
+        - reduce_mat_by_src_grid_cells(np.minimum, src_min_mat, ys, xs)
+    )
+    if np_cells_delta.ndim == 3:
+        np_cells_delta = np_cells_delta.max(axis=2)
+    np_uniform_cells_mask = (np_cells_delta <= uniform_cell_max_delta)
+
+    if src_content_mask is not None:
+        assert src_content_mask.shape == src_mat.shape[:2]
+        src_content_mat = cv.dilate(src_content_mask.mat, kernel, anchor=(1, 1))
+        np_cells_content = reduce_mat_by_src_grid_cells(np.maximum, src_content_mat, ys, xs)
+        np_uniform_cells_mask |= (np_cells_content == 0)
+
+    # Fill with the mean.
+    np_cells_sum = reduce_mat_by_src_grid_cells(np.add, src_mat.astype(np.float32), ys, xs)
+    heights = np.diff(np.append(ys[:-1], src_mat.shape[0]))
+    widths = np.diff(np.append(xs[:-1], src_mat.shape[1]))
+    np_cells_area = np.outer(heights, widths)
+    if np_cells_sum.ndim == 3:
+        np_cells_area = np.expand_dims(np_cells_area, axis=-1)
+    np_uniform_cells_values = np_cells_sum / np_cells_area
+    if src_mat.dtype == np.uint8:
+        np_uniform_cells_values = np.round(np_uniform_cells_values)
+
+    return np_uniform_cells_mask, np_uniform_cells_values
+
+
+def blend_src_to_dst_mat(
+    src_mat,
+    src_image_grid: VImageGrid,
+    dst_mat,
+    dst_image_grid: VImageGrid,
+    uniform_cell_max_delta: Optional[int] = None,
+    src_content_mask: Optional[VImageMask] = None,
+):
+    np_uniform_cells_mask = None
+    np_uniform_cells_values = None
+    if uniform_cell_max_delta is not None:
+        np_uniform_cells_mask, np_uniform_cells_values = \
+            generate_np_uniform_cells_mask_and_values(
+                src_mat,
+                src_image_grid,
+                uniform_cell_max_delta,
+                src_content_mask,
+            )
+
+    for polygon_row_col, src_polygon, dst_polygon in src_image_grid.zip_polygons(dst_image_grid):
+        if np_uniform_cells_mask is not None and np_uniform_cells_mask[polygon_row_col]:
+            assert np_uniform_cells_values is not None
+            value = np_uniform_cells_values[polygon_row_col]
+            value = tuple(value.tolist()) if value.ndim > 0 else float(value)
+            # Fill constant instead of resampling.
+            cv.fillPoly(dst_mat, [dst_polygon.to_np_array()], value)
+
+        else:
+            blend_polygon_from_src_to_dst_mat(
+                src_mat,
+                src_polygon,
+                dst_mat,
+                dst_polygon,
+            )
+
+
+def blend_src_to_dst_mats(
+    src_mats: Sequence[np.ndarray],
+    src_image_grid: VImageGrid,
+    dst_image_grid: VImageGrid,
+):
+    # Blend multiple mats (could be in different dtypes) in a single pass of the cells.
+    dst_mats = [
+        np.zeros(
+            (dst_image_grid.image_height, dst_image_grid.image_width) + src_mat.shape[2:],
+            dtype=src_mat.dtype,
+        ) for src_mat in src_mats
+    ]
     for _, src_polygon, dst_polygon in src_image_grid.zip_polygons(dst_image_grid):
-        blend_polygon_from_src_to_dst_mat(
-            src_image.mat,
+        blend_polygon_from_src_to_dst_mats(
+            src_mats,
             src_polygon,
-            dst_image.mat,
+            dst_mats,
             dst_polygon,
         )
+    return dst_mats
 
+
+def blend_src_to_dst_image(
+    src_image,
+    src_image_grid,
+    dst_image_grid,
+    uniform_cell_max_delta: Optional[int] = None,
+    src_content_mask: Optional[VImageMask] = None,
+):
+    dst_image = create_image_from_image_grid(dst_image_grid, src_image.kind)
+    blend_src_to_dst_mat(
+        src_image.mat,
+        src_image_grid,
+        dst_image.mat,
+        dst_image_grid,
+        uniform_cell_max_delta=uniform_cell_max_delta,
+        src_content_mask=src_content_mask,
+    )
     return dst_image
 
 
-def blend_src_to_dst_image_score_map(src_image_score_map, src_image_grid, dst_image_grid):
+def blend_src_to_dst_image_score_map(
+    src_image_score_map,
+    src_image_grid,
+    dst_image_grid,
+    skip_uniform_cells: bool = False,
+):
     dst_image_score_map = create_image_score_map_from_image_grid(dst_image_grid)
-
-    for _, src_polygon, dst_polygon in src_image_grid.zip_polygons(dst_image_grid):
-        blend_polygon_from_src_to_dst_mat(
-            src_image_score_map.mat,
-            src_polygon,
-            dst_image_score_map.mat,
-            dst_polygon,
-        )
-
+    blend_src_to_dst_mat(
+        src_image_score_map.mat,
+        src_image_grid,
+        dst_image_score_map.mat,
+        dst_image_grid,
+        # Exact.
+        uniform_cell_max_delta=0 if skip_uniform_cells else None,
+    )
     return dst_image_score_map
 
 
-def blend_src_to_dst_image_mask(src_image_mask, src_image_grid, dst_image_grid):
+def blend_src_to_dst_image_mask(
+    src_image_mask,
+    src_image_grid,
+    dst_image_grid,
+    skip_uniform_cells: bool = False,
+):
     dst_image_mask = create_image_mask_from_image_grid(dst_image_grid)
-
-    for _, src_polygon, dst_polygon in src_image_grid.zip_polygons(dst_image_grid):
-        blend_polygon_from_src_to_dst_mat(
-            src_image_mask.mat,
-            src_polygon,
-            dst_image_mask.mat,
-            dst_polygon,
-        )
-
+    blend_src_to_dst_mat(
+        src_image_mask.mat,
+        src_image_grid,
+        dst_image_mask.mat,
+        dst_image_grid,
+        # Exact.
+        uniform_cell_max_delta=0 if skip_uniform_cells else None,
+    )
     return dst_image_mask
 
 
@@ -1,7 +1,10 @@
-from typing import MutableSequence, Optional
+from typing import MutableSequence, Optional, Tuple
 from itertools import chain
 
 import attr
+import numpy as np
+import numpy.typing as npt
+import cv2 as cv
 
 from vkit.image.type import VImage
 from vkit.label.type import VPoint, VPolygon, VPointList
@@ -73,6 +76,23 @@ class VImageGrid:
             other_polygon = other.generate_polygon(polygon_row, polygon_col)
             yield (polygon_row, polygon_col), self_polygon, other_polygon
 
+    def to_np_cells(self):
+        # (num_rows, num_cols, 2) in xy order.
+        np_points = np.asarray(
+            [[point.to_xy_pair() for point in points] for points in self.points_2d],
+            dtype=np.float32,
+        )
+        # (num_rows - 1, num_cols - 1, 4, 2), clockwise as in generate_polygon.
+        return np.stack(
+            (
+                np_points[:-1, :-1],
+                np_points[:-1, 1:],
+                np_points[1:, 1:],
+                np_points[1:, :-1],
+            ),
+            axis=2,
+        )
+
     def generate_border_polygon(self):
         # Clockwise.
         points = VPointList()
@@ -96,3 +116,128 @@ class VImageGrid:
                 new_points.append(point.to_rescaled_point(image, rescaled_height, rescaled_width))
             new_points_2d.append(new_points)
         return VImageGrid(points_2d=new_points_2d)
+
+
+@attr.define
+class VImageDenseMap:
+    # The (float) src coordinate of each dst pixel, -1 if the dst pixel has no corresponding src.
+    map_x: npt.NDArray
+    map_y: npt.NDArray
+
+    def __attrs_post_init__(self):
+        assert self.map_x.shape == self.map_y.shape
+        assert self.map_x.dtype == self.map_y.dtype == np.float32
+
+    @property
+    def height(self):
+        return self.map_x.shape[0]
+
+    @property
+    def width(self):
+        return self.map_x.shape[1]
+
+    @property
+    def shape(self):
+        return self.height, self.width
+
+    @staticmethod
+    def from_np_src_points(
+        np_src_points: npt.NDArray,
+        invalid_mask: npt.NDArray,
+        shape: Tuple[int, int],
+        src_height: int,
+        src_width: int,
+        tolerance: float = 0.5,
+    ):
+        # np_src_points: (*, 2) in xy order, invalid_mask: (*).
+        map_x = np_src_points[:, 0].astype(np.float32)
+        map_y = np_src_points[:, 1].astype(np.float32)
+
+        # Out-of-bound within the tolerance is caused by numerical error.
+        invalid_mask = (
+            invalid_mask
+            | ~np.isfinite(map_x)
+            | ~np.isfinite(map_y)
+            | (map_x < -tolerance)
+            | (map_x > src_width - 1 + tolerance)
+            | (map_y < -tolerance)
+            | (map_y > src_height - 1 + tolerance)
+        )
+        with np.errstate(invalid='ignore'):
+            np.clip(map_x, 0, src_width - 1, out=map_x)
+            np.clip(map_y, 0, src_height - 1, out=map_y)
+        map_x[invalid_mask] = -1
+        map_y[invalid_mask] = -1
+
+        return VImageDenseMap(map_x=map_x.reshape(shape), map_y=map_y.reshape(shape))
+
+
+@attr.define
+class VImageGridCellIndex:
+    # Cell id (row-major, -1 if not covered) of each dst pixel.
+    cell_id_mat: npt.NDArray
+    # (num_cells, 3, 3), the perspective transformation from dst cell to src cell.
+    dst_to_src_trans_mats: npt.NDArray
+    # (num_cells, 2) in xy order, for locating the points not covered by any cell.
+    dst_cell_centers: npt.NDArray
+
+    @staticmethod
+    def from_image_grids(src_image_grid: VImageGrid, dst_image_grid: VImageGrid):
+        assert src_image_grid.compatible_with(dst_image_grid)
+
+        src_np_cells = src_image_grid.to_np_cells().reshape(-1, 4, 2)
+        dst_np_cells = dst_image_grid.to_np_cells().reshape(-1, 4, 2)
+
+        cell_id_mat = np.full(
+            (dst_image_grid.image_height, dst_image_grid.image_width),
+            -1,
+            dtype=np.int32,
+        )
+        dst_to_src_trans_mats = np.zeros((len(dst_np_cells), 3, 3), dtype=np.float64)
+
+        # NOTE: the same order as blend_src_to_dst_image, the latter cell overwrites the former.
+        for cell_id, (src_np_cell, dst_np_cell) in enumerate(zip(src_np_cells, dst_np_cells)):
+            dst_to_src_trans_mats[cell_id] = cv.getPerspectiveTransform(
+                dst_np_cell,
+                src_np_cell,
+                cv.DECOMP_SVD,
+            )
+            cv.fillPoly(cell_id_mat, [dst_np_cell.astype(np.int32)], cell_id)
+
+        return VImageGridCellIndex(
+            cell_id_mat=cell_id_mat,
+            dst_to_src_trans_mats=dst_to_src_trans_mats,
+            dst_cell_centers=dst_np_cells.mean(axis=1),
+        )
+
+    def map_np_points(self, np_points: npt.NDArray):
+        # np_points: (*, 2) in xy order, dst -> src.
+        np_points = np.asarray(np_points, dtype=np.float64).reshape(-1, 2)
+        if len(np_points) == 0:
+            return np_points
+
+        height, width = self.cell_id_mat.shape
+        xs = np.clip(np.round(np_points[:, 0]).astype(np.int64), 0, width - 1)
+        ys = np.clip(np.round(np_points[:, 1]).astype(np.int64), 0, height - 1)
+        cell_ids = self.cell_id_mat[ys, xs]
+
+        # Fallback to the nearest cell, in batches to bound the memory of distances.
+        missing_indices = np.nonzero(cell_ids < 0)[0]
+        batch_size = 1024
+        for begin in range(0, len(missing_indices), batch_size):
+            batch_indices = missing_indices[begin:begin + batch_size]
+            distances = np.linalg.norm(
+                np_points[batch_indices, None, :] - self.dst_cell_centers[None, :, :],
+                axis=-1,
+            )
+            cell_ids[batch_indices] = np.argmin(distances, axis=1)
+
+        # (*, 3)
+        np_homo_points = np.hstack((np_points, np.ones((len(np_points), 1))))
+        np_src_homo_points = np.einsum(
+            'nij,nj->ni',
+            self.dst_to_src_trans_mats[cell_ids],
+            np_homo_points,
+        )
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np_src_homo_points[:, :2] / np_src_homo_points[:, 2:]
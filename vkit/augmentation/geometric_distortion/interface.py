@@ -4,6 +4,7 @@ from typing import (
     Dict,
     Generic,
     Iterable,
+    List,
     Type,
     TypeVar,
     Union,
@@ -12,6 +13,10 @@ from typing import (
     Optional,
 )
 
+import copy
+import inspect
+import math
+
 import attr
 import numpy as np
 import cv2 as cv
@@ -21,6 +26,7 @@ from vkit.label.type import (
     VPoint,
     VPointList,
     VPolygon,
+    VBox,
     VImageMask,
     VImageScoreMap,
 )
@@ -29,12 +35,20 @@ from vkit.augmentation.opt import (
     handle_config_and_rnd,
 )
 
-from .grid_rendering.type import VImageGrid
+from .grid_rendering.type import VImageGrid, VImageDenseMap, VImageGridCellIndex
 from .grid_rendering.grid_creator import create_dst_image_grid_and_shift_amounts_and_rescale_ratios
 from .grid_rendering.grid_blender import (
     blend_src_to_dst_image,
     blend_src_to_dst_image_score_map,
     blend_src_to_dst_image_mask,
+    blend_src_to_dst_mats,
+    generate_src_content_mask,
+)
+from .grid_rendering.dense_map_blender import (
+    blend_src_to_dst_image_by_dense_map,
+    blend_src_to_dst_image_score_map_by_dense_map,
+    blend_src_to_dst_image_mask_by_dense_map,
+    generate_dense_map_from_image_grids,
 )
 
 T_STATE = TypeVar('T_STATE')
@@ -55,6 +69,161 @@ class GeometricDistortionResult:
     state: Optional[Any] = None
 
 
+@attr.define
+class StateValidationConfig:
+    # Ratio of the dst image area to the src image area.
+    max_area_ratio: float = 4.0
+    # For grid-based state, ratio of the dst cell area to the src cell area.
+    min_cell_area_ratio: float = 0.05
+    # For grid-based state, ratio of the dst cell side length to the src cell side length.
+    min_cell_side_ratio: float = 0.1
+    # For grid-based state, accept the folded cells (orientation changed) if set.
+    allow_folded_cells: bool = False
+
+
+def get_mat_num_channels(mat: np.ndarray):
+    return mat.shape[2] if mat.ndim == 3 else 1
+
+
+def stack_mats_as_planes(mats: Sequence[np.ndarray]):
+    # Stack 2D or 3D mats of the same dtype to a single multi-channel mat.
+    return cv.merge(list(mats))
+
+
+def split_planes_as_mats(planes: np.ndarray, mats: Sequence[np.ndarray]):
+    # Inverse of stack_mats_as_planes, mats provide the layout.
+    splitted_planes = cv.split(planes)
+
+    new_mats = []
+    begin = 0
+    for mat in mats:
+        num_channels = get_mat_num_channels(mat)
+        if mat.ndim == 2:
+            new_mats.append(splitted_planes[begin])
+        else:
+            new_mats.append(cv.merge(splitted_planes[begin:begin + num_channels]))
+        begin += num_channels
+    return new_mats
+
+
+def distort_mats_by_stacking_planes(
+    mats: Sequence[np.ndarray],
+    func_distort_mats: Callable[[List[np.ndarray]], List[np.ndarray]],
+    max_num_channels: int = 4,
+):
+    # Mats of the same dtype are stacked (up to max_num_channels, since OpenCV has the optimized
+    # routines for 1-4 channels) and distorted in one pass. func_distort_mats is called once with
+    # all the stacked mats, so that the coordinates could be shared across the stacks.
+    groups: List[List[int]] = []
+    for idx, mat in enumerate(mats):
+        for group in groups:
+            if mats[group[0]].dtype == mat.dtype and sum(
+                get_mat_num_channels(mats[group_idx]) for group_idx in group
+            ) + get_mat_num_channels(mat) <= max_num_channels:
+                group.append(idx)
+                break
+        else:
+            groups.append([idx])
+
+    stacked_mats = []
+    for group in groups:
+        if len(group) == 1:
+            stacked_mats.append(mats[group[0]])
+        else:
+            stacked_mats.append(stack_mats_as_planes([mats[idx] for idx in group]))
+
+    new_stacked_mats = func_distort_mats(stacked_mats)
+    assert len(new_stacked_mats) == len(stacked_mats)
+
+    new_mats: List[Optional[np.ndarray]] = [None] * len(mats)
+    for group, new_stacked_mat in zip(groups, new_stacked_mats):
+        if len(group) == 1:
+            new_mats[group[0]] = new_stacked_mat
+        else:
+            for idx, new_mat in zip(
+                group,
+                split_planes_as_mats(new_stacked_mat, [mats[idx] for idx in group]),
+            ):
+                new_mats[idx] = new_mat
+
+    return new_mats
+
+
+def get_output_window_box_and_shape(
+    dst_height: int,
+    dst_width: int,
+    output_box: Optional[VBox] = None,
+    output_shape: Optional[Tuple[int, int]] = None,
+):
+    if output_box is None:
+        output_box = VBox(up=0, down=dst_height - 1, left=0, right=dst_width - 1)
+    if output_shape is None:
+        output_shape = output_box.shape
+    return output_box, output_shape
+
+
+def convert_point_to_output_window(
+    point: VPoint,
+    output_box: Optional[VBox],
+    output_shape: Optional[Tuple[int, int]],
+):
+    if output_box is None:
+        return point
+
+    assert output_shape
+    output_height, output_width = output_shape
+    # Pixel centers aligned, as cv.resize.
+    return VPoint(
+        y=(point.y - output_box.up + 0.5) * output_height / output_box.height - 0.5,
+        x=(point.x - output_box.left + 0.5) * output_width / output_box.width - 0.5,
+    )
+
+
+def generate_output_window_dst_coordinates(begin: int, length: int, output_length: int):
+    # The dst coordinates sampled by the output pixels, pixel centers aligned as cv.resize.
+    return begin + (np.arange(output_length) + 0.5) * length / output_length - 0.5
+
+
+def prefilter_mat_for_output_window(mat: np.ndarray, ratio_y: float, ratio_x: float):
+    # ratio: the number of src pixels per output pixel. Sampling with ratio > 1 aliases, hence
+    # blurred beforehand. sigma = sqrt(ratio^2 - 1) / 2 vanishes at ratio = 1 and is close to the
+    # kernel of cv.pyrDown at ratio = 2.
+    if ratio_y <= 1 and ratio_x <= 1:
+        return mat
+
+    ksizes = []
+    sigmas = []
+    for ratio in (ratio_x, ratio_y):
+        sigma = math.sqrt(max(0.0, ratio**2 - 1)) / 2
+        ksizes.append(2 * math.ceil(3 * sigma) + 1)
+        sigmas.append(sigma)
+    return cv.GaussianBlur(mat, tuple(ksizes), sigmaX=sigmas[0], sigmaY=sigmas[1])
+
+
+def generate_dst_point_by_image_grids(
+    src_image_grid: VImageGrid,
+    dst_image_grid: VImageGrid,
+    point: VPoint,
+):
+    assert src_image_grid.grid_size
+    polygon_row = point.y // src_image_grid.grid_size
+    polygon_col = point.x // src_image_grid.grid_size
+
+    src_polygon = src_image_grid.generate_polygon(polygon_row, polygon_col)
+    dst_polygon = dst_image_grid.generate_polygon(polygon_row, polygon_col)
+
+    trans_mat = cv.getPerspectiveTransform(
+        src_polygon.to_np_array().astype(np.float32),
+        dst_polygon.to_np_array().astype(np.float32),
+        cv.DECOMP_SVD,
+    )
+    dst_tx, dst_ty, dst_t = np.matmul(trans_mat, (point.x, point.y, 1.0))
+    return VPoint(
+        y=dst_ty / dst_t,
+        x=dst_tx / dst_t,
+    )
+
+
 class GeometricDistortion(Generic[T_CONFIG, T_STATE, T_CALL_FUNC_X_RETURN]):
 
     def __init__(
@@ -69,6 +238,10 @@ class GeometricDistortion(Generic[T_CONFIG, T_STATE, T_CALL_FUNC_X_RETURN]):
         func_points: Optional[Callable[..., VPointList]],
         func_polygon: Optional[Callable[..., VPolygon]],
         func_polygons: Optional[Callable[..., Sequence[VPolygon]]],
+        func_validate_state: Optional[Callable[..., bool]] = None,
+        func_apply_output_window: Optional[Callable[..., T_STATE]] = None,
+        func_multi_targets: Optional[Callable[..., GeometricDistortionResult]] = None,
+        func_inverse_points: Optional[Callable[..., VPointList]] = None,
     ):
         self.config_cls = config_cls
         self.state_cls = state_cls
@@ -83,6 +256,11 @@ class GeometricDistortion(Generic[T_CONFIG, T_STATE, T_CALL_FUNC_X_RETURN]):
         self.func_polygon = func_polygon
         self.func_polygons = func_polygons
 
+        self.func_validate_state = func_validate_state
+        self.func_apply_output_window = func_apply_output_window
+        self.func_multi_targets = func_multi_targets
+        self.func_inverse_points = func_inverse_points
+
     def generate_config_and_state_and_image_x_and_shape(
         self,
         config_or_config_generator: Union[T_CONFIG,
@@ -90,6 +268,7 @@ class GeometricDistortion(Generic[T_CONFIG, T_STATE, T_CALL_FUNC_X_RETURN]):
                                                    T_CONFIG]],
         image_x_or_shape: Union[VImage, VImageMask, VImageScoreMap, Tuple[int, int]],
         rnd: Optional[np.random.RandomState] = None,
+        state: Optional[T_STATE] = None,
     ):
         if isinstance(image_x_or_shape, (list, tuple)):
             assert len(image_x_or_shape) == 2
@@ -106,9 +285,10 @@ class GeometricDistortion(Generic[T_CONFIG, T_STATE, T_CALL_FUNC_X_RETURN]):
             rnd,
         )
 
-        state: Optional[T_STATE] = None
+        if not self.state_cls:
+            state = None
 
-        if self.state_cls:
+        elif not state:
             kwargs = {
                 'config': config,
                 'shape': shape,
@@ -116,8 +296,6 @@ class GeometricDistortion(Generic[T_CONFIG, T_STATE, T_CALL_FUNC_X_RETURN]):
             if rnd:
                 kwargs['rnd'] = rnd
             state = self.state_cls(**kwargs)
-        else:
-            state = None
 
         return config, state, image_x, shape
 
@@ -128,11 +306,13 @@ class GeometricDistortion(Generic[T_CONFIG, T_STATE, T_CALL_FUNC_X_RETURN]):
                                                    T_CONFIG]],
         image_x_or_shape: Union[VImage, VImageMask, VImageScoreMap, Tuple[int, int]],
         rnd: Optional[np.random.RandomState] = None,
+        state: Optional[T_STATE] = None,
     ):
         config, state, _, _ = self.generate_config_and_state_and_image_x_and_shape(
             config_or_config_generator,
             image_x_or_shape,
             rnd,
+            state=state,
         )
         return config, state
 
@@ -166,6 +346,58 @@ class GeometricDistortion(Generic[T_CONFIG, T_STATE, T_CALL_FUNC_X_RETURN]):
         )
         return state
 
+    def validate_state(
+        self,
+        config: T_CONFIG,
+        state: Optional[T_STATE],
+        image_x_or_shape: Union[VImage, VImageMask, VImageScoreMap, Tuple[int, int]],
+        validation_config: Optional[StateValidationConfig] = None,
+    ) -> bool:
+        # Cheap check before rendering, for rejection sampling of the config.
+        if not self.func_validate_state:
+            return True
+
+        if isinstance(image_x_or_shape, (list, tuple)):
+            shape = image_x_or_shape
+        else:
+            shape = image_x_or_shape.shape
+
+        return self.func_validate_state(
+            config=config,
+            state=state,
+            shape=shape,
+            validation_config=validation_config or StateValidationConfig(),
+        )
+
+    def apply_output_window(
+        self,
+        config: T_CONFIG,
+        state: Optional[T_STATE],
+        image_x_or_shape: Union[VImage, VImageMask, VImageScoreMap, Tuple[int, int]],
+        output_box: Optional[VBox] = None,
+        output_shape: Optional[Tuple[int, int]] = None,
+    ) -> T_STATE:
+        '''
+        Returns a new state that renders output_box of the dst image (defaults to the whole dst
+        image) in output_shape (defaults to the shape of output_box) directly, i.e., crop & resize
+        are folded into the distortion.
+        '''
+        if not self.func_apply_output_window:
+            raise RuntimeError('func_apply_output_window is not provided.')
+
+        if isinstance(image_x_or_shape, (list, tuple)):
+            shape = image_x_or_shape
+        else:
+            shape = image_x_or_shape.shape
+
+        return self.func_apply_output_window(
+            config=config,
+            state=state,
+            shape=shape,
+            output_box=output_box,
+            output_shape=output_shape,
+        )
+
     def handle_config_and_state_and_rnd(
         self,
         config_or_config_generator,
@@ -204,10 +436,12 @@ class GeometricDistortion(Generic[T_CONFIG, T_STATE, T_CALL_FUNC_X_RETURN]):
         rnd,
         **extra_kwargs,
     ) -> T_CALL_FUNC_X_RETURN:
+        # NOTE: reuse the state if provided.
         config, state, image_x, shape = self.generate_config_and_state_and_image_x_and_shape(
             config_or_config_generator,
             image_x_or_shape,
             rnd,
+            state=state,
         )
 
         kwargs: Dict[str, Any] = {
@@ -222,7 +456,8 @@ class GeometricDistortion(Generic[T_CONFIG, T_STATE, T_CALL_FUNC_X_RETURN]):
 
         if state:
             kwargs['state'] = state
-        if rnd:
+        # The randomness could be consumed in generating the state only.
+        if rnd and 'rnd' in inspect.signature(func).parameters:
             kwargs['rnd'] = rnd
 
         kwargs.update(extra_kwargs)
@@ -341,7 +576,7 @@ class GeometricDistortion(Generic[T_CONFIG, T_STATE, T_CALL_FUNC_X_RETURN]):
                 image_x_name='shape',
                 image_x_or_shape=image_x_or_shape,
                 rnd=rnd,
-                points=[point],
+                points=VPointList([point]),
             )
             return new_points[0]
 
@@ -377,6 +612,7 @@ class GeometricDistortion(Generic[T_CONFIG, T_STATE, T_CALL_FUNC_X_RETURN]):
                 config_or_config_generator=config_or_config_generator,
                 image_x_or_shape=image_x_or_shape,
                 rnd=rnd,
+                state=state,
             )
 
             new_points = VPointList()
@@ -443,6 +679,7 @@ class GeometricDistortion(Generic[T_CONFIG, T_STATE, T_CALL_FUNC_X_RETURN]):
                 config_or_config_generator=config_or_config_generator,
                 image_x_or_shape=image_x_or_shape,
                 rnd=rnd,
+                state=state,
             )
 
             new_points = VPointList()
@@ -488,6 +725,7 @@ class GeometricDistortion(Generic[T_CONFIG, T_STATE, T_CALL_FUNC_X_RETURN]):
                 config_or_config_generator=config_or_config_generator,
                 image_x_or_shape=image_x_or_shape,
                 rnd=rnd,
+                state=state,
             )
 
             new_polygons = []
@@ -503,6 +741,58 @@ class GeometricDistortion(Generic[T_CONFIG, T_STATE, T_CALL_FUNC_X_RETURN]):
 
             return new_polygons
 
+    def inverse_distort_points(
+        self,
+        config_or_config_generator: Union[T_CONFIG,
+                                          Callable[[Tuple[int, int], np.random.RandomState],
+                                                   T_CONFIG]],
+        image_x_or_shape: Union[VImage, VImageMask, VImageScoreMap, Tuple[int, int]],
+        points: Union[VPointList, Iterable[VPoint]],
+        state: Optional[T_STATE] = None,
+        rnd: Optional[np.random.RandomState] = None,
+    ):
+        '''
+        Maps the points in the dst image back to the src image. image_x_or_shape is the src.
+        '''
+        if not self.func_inverse_points:
+            raise RuntimeError('func_inverse_points is not provided.')
+
+        return self.call_func_x(
+            func=self.func_inverse_points,
+            config_or_config_generator=config_or_config_generator,
+            state=state,
+            image_x_name='shape',
+            image_x_or_shape=image_x_or_shape,
+            rnd=rnd,
+            points=VPointList(points),
+        )
+
+    def inverse_distort_polygons(
+        self,
+        config_or_config_generator: Union[T_CONFIG,
+                                          Callable[[Tuple[int, int], np.random.RandomState],
+                                                   T_CONFIG]],
+        image_x_or_shape: Union[VImage, VImageMask, VImageScoreMap, Tuple[int, int]],
+        polygons: Iterable[VPolygon],
+        state: Optional[T_STATE] = None,
+        rnd: Optional[np.random.RandomState] = None,
+    ):
+        # All the points are mapped in one call.
+        points_ranges = []
+        points = VPointList()
+        for polygon in polygons:
+            points_ranges.append((len(points), len(points) + len(polygon.points)))
+            points.extend(polygon.points)
+
+        new_points = self.inverse_distort_points(
+            config_or_config_generator,
+            image_x_or_shape,
+            points,
+            state=state,
+            rnd=rnd,
+        )
+        return [VPolygon(points=VPointList(new_points[begin:end])) for begin, end in points_ranges]
+
     def distort(
         self,
         config_or_config_generator: Union[T_CONFIG,
@@ -518,35 +808,110 @@ class GeometricDistortion(Generic[T_CONFIG, T_STATE, T_CALL_FUNC_X_RETURN]):
         get_active_image_mask: bool = False,
         get_config: bool = False,
         get_state: bool = False,
+        state: Optional[T_STATE] = None,
+        output_box: Optional[VBox] = None,
+        output_shape: Optional[Tuple[int, int]] = None,
+        image_mask_output_stride: int = 1,
+        image_score_map_output_stride: int = 1,
+        src_content_mask: Optional[VImageMask] = None,
         rnd: Optional[np.random.RandomState] = None,
     ):
         config, state = self.generate_config_and_state(
             config_or_config_generator,
             image,
             rnd,
+            state=state,
         )
-        result = GeometricDistortionResult(
-            image=self.distort_image(
+        if src_content_mask is not None:
+            # For skipping the uniform cells, see StateImageGridBased.
+            if not isinstance(state, StateImageGridBased):
+                raise RuntimeError('src_content_mask is only supported by the grid based state.')
+            state = state.to_src_content_mask_state(src_content_mask)
+        base_state = state
+        if output_box or output_shape:
+            state = self.apply_output_window(
                 config,
+                state,
                 image,
-                state=state,
-                rnd=rnd,
+                output_box=output_box,
+                output_shape=output_shape,
             )
-        )
-        if image_mask:
-            result.image_mask = self.distort_image_mask(
-                config,
-                image_mask,
+        if self.func_multi_targets:
+            # Distort the targets sharing the state in a single pass. The targets left as None
+            # in the result are handled separately.
+            result = self.func_multi_targets(
+                config=config,
                 state=state,
-                rnd=rnd,
+                image=image,
+                image_mask=image_mask if image_mask_output_stride == 1 else None,
+                image_score_map=(image_score_map if image_score_map_output_stride == 1 else None),
+                get_active_image_mask=get_active_image_mask,
             )
-        if image_score_map:
-            result.image_score_map = self.distort_image_score_map(
-                config,
-                image_score_map,
-                state=state,
-                rnd=rnd,
+        else:
+            result = GeometricDistortionResult(
+                image=self.distort_image(
+                    config,
+                    image,
+                    state=state,
+                    rnd=rnd,
+                )
             )
+
+        # The label targets could be rendered in 1/stride resolution directly if the output window
+        # is supported. Otherwise, rendered in full resolution and then downscaled.
+        strided_states: Dict[int, Optional[T_STATE]] = {1: state}
+
+        def get_strided_output_shape(stride: int):
+            output_height, output_width = result.image.shape
+            return math.ceil(output_height / stride), math.ceil(output_width / stride)
+
+        def render_strided(stride: int):
+            return stride == 1 or self.func_apply_output_window is not None
+
+        def get_strided_state(stride: int):
+            if stride not in strided_states:
+                assert stride > 1
+                strided_states[stride] = self.apply_output_window(
+                    config,
+                    base_state,
+                    image,
+                    output_box=output_box,
+                    output_shape=get_strided_output_shape(stride),
+                )
+            return strided_states[stride]
+
+        if image_mask and result.image_mask is None:
+            if render_strided(image_mask_output_stride):
+                result.image_mask = self.distort_image_mask(
+                    config,
+                    image_mask,
+                    state=get_strided_state(image_mask_output_stride),
+                    rnd=rnd,
+                )
+            else:
+                result.image_mask = self.distort_image_mask(
+                    config,
+                    image_mask,
+                    state=state,
+                    rnd=rnd,
+                ).to_rescaled_image_mask(*get_strided_output_shape(image_mask_output_stride))
+        if image_score_map and result.image_score_map is None:
+            if render_strided(image_score_map_output_stride):
+                result.image_score_map = self.distort_image_score_map(
+                    config,
+                    image_score_map,
+                    state=get_strided_state(image_score_map_output_stride),
+                    rnd=rnd,
+                )
+            else:
+                result.image_score_map = self.distort_image_score_map(
+                    config,
+                    image_score_map,
+                    state=state,
+                    rnd=rnd,
+                ).to_rescaled_image_score_map(
+                    *get_strided_output_shape(image_score_map_output_stride)
+                )
         if point:
             result.point = self.distort_point(
                 config,
@@ -579,7 +944,7 @@ class GeometricDistortion(Generic[T_CONFIG, T_STATE, T_CALL_FUNC_X_RETURN]):
                 state=state,
                 rnd=rnd,
             )
-        if get_active_image_mask:
+        if get_active_image_mask and result.active_image_mask is None:
             result.active_image_mask = self.get_active_image_mask(
                 config,
                 image,
@@ -593,9 +958,20 @@ class GeometricDistortion(Generic[T_CONFIG, T_STATE, T_CALL_FUNC_X_RETURN]):
         return result
 
 
+def cross_np_2d_vectors(lhs, rhs):
+    return lhs[..., 0] * rhs[..., 1] - lhs[..., 1] * rhs[..., 0]
+
+
 class StateImageGridBased:
 
-    def __init__(self, src_image_grid: VImageGrid, point_projector):
+    def __init__(
+        self,
+        src_image_grid: VImageGrid,
+        point_projector,
+        enable_dense_map: bool = False,
+        uniform_cell_max_delta: Optional[int] = None,
+        src_content_mask: Optional[VImageMask] = None,
+    ):
         self.src_image_grid = src_image_grid
         self.point_projector = point_projector
 
@@ -609,34 +985,282 @@ class StateImageGridBased:
             rescale_as_src=False,
         )
 
+        # If enabled, render by the dst -> src mapping of each dst pixel instead of blending
+        # cell by cell. The grid is still used to decide the shape of dst image.
+        self.enable_dense_map = enable_dense_map
+        self._cache_dense_map: Optional[VImageDenseMap] = None
+
+        # Optional, for sparse documents. If set, the cell with max - min <= uniform_cell_max_delta
+        # in src, or without any content, is filled with the mean value instead of bilinear
+        # resampling. If src_content_mask is not provided, it is derived from the src image by
+        # comparing with the most frequent (background) value. Uniform cells in mask and score
+        # map are filled as well (exact).
+        self.uniform_cell_max_delta = uniform_cell_max_delta
+        self.src_content_mask = src_content_mask
+
+        # Set by to_output_window_state.
+        self.output_box: Optional[VBox] = None
+        self.output_shape: Optional[Tuple[int, int]] = None
+
+        self._cache_cell_index: Optional[VImageGridCellIndex] = None
+
     def shift_and_rescale_point(self, point: VPoint):
         return VPoint(
             y=(point.y - self.shift_amount_y) * self.rescale_ratio_y,
             x=(point.x - self.shift_amount_x) * self.rescale_ratio_x,
         )
 
+    @property
+    def use_dense_map(self):
+        return self.enable_dense_map or self.output_box is not None
+
+    def generate_dense_map(self, dst_ys: np.ndarray, dst_xs: np.ndarray) -> VImageDenseMap:
+        # Generate the dense map of dst pixels (dst_ys x dst_xs). Interpolated by the grid cells
+        # by default, could be overridden if the exact mapping is available.
+        return generate_dense_map_from_image_grids(
+            self.src_image_grid,
+            self.dst_image_grid,
+            dst_ys,
+            dst_xs,
+        )
+
+    def to_output_window_state(
+        self,
+        output_box: Optional[VBox] = None,
+        output_shape: Optional[Tuple[int, int]] = None,
+    ):
+        state = copy.copy(self)
+        state.output_box, state.output_shape = get_output_window_box_and_shape(
+            self.dst_image_grid.image_height,
+            self.dst_image_grid.image_width,
+            output_box,
+            output_shape,
+        )
+        state._cache_dense_map = None
+        return state
+
+    def to_src_content_mask_state(self, src_content_mask: VImageMask):
+        state = copy.copy(self)
+        state.src_content_mask = src_content_mask
+        return state
+
+    def to_output_window_point(self, point: VPoint):
+        return convert_point_to_output_window(point, self.output_box, self.output_shape)
+
+    def from_output_window_np_points(self, np_points: np.ndarray):
+        # np_points: (*, 2) in xy order.
+        if self.output_box is None:
+            return np_points
+
+        assert self.output_shape
+        output_height, output_width = self.output_shape
+        return (np_points + 0.5) * (
+            self.output_box.width / output_width,
+            self.output_box.height / output_height,
+        ) + (self.output_box.left - 0.5, self.output_box.up - 0.5)
+
+    @property
+    def output_window_ratios(self):
+        # The number of src pixels per output pixel, roughly.
+        if self.output_box is None:
+            return None
+
+        assert self.output_shape
+        output_height, output_width = self.output_shape
+        return (
+            self.output_box.height / output_height / self.rescale_ratio_y,
+            self.output_box.width / output_width / self.rescale_ratio_x,
+        )
+
+    def prefilter_src_mat(self, mat: np.ndarray):
+        # Anti-aliasing for the output window with large reduction.
+        output_window_ratios = self.output_window_ratios
+        if output_window_ratios is None:
+            return mat
+        return prefilter_mat_for_output_window(mat, *output_window_ratios)
+
+    @property
+    def cell_index(self):
+        # For mapping dst points back to src.
+        if self._cache_cell_index is None:
+            self._cache_cell_index = VImageGridCellIndex.from_image_grids(
+                self.src_image_grid,
+                self.dst_image_grid,
+            )
+        return self._cache_cell_index
+
+    def inverse_np_points(self, np_points: np.ndarray):
+        # np_points: (*, 2) in xy order, dst (before the output window) -> src. Interpolated by
+        # the grid cells by default, could be overridden if the exact mapping is available.
+        return self.cell_index.map_np_points(np_points)
+
+    def validate(self, validation_config: StateValidationConfig):
+        src_height = self.src_image_grid.image_height
+        src_width = self.src_image_grid.image_width
+        dst_height = self.dst_image_grid.image_height
+        dst_width = self.dst_image_grid.image_width
+        if dst_height * dst_width > validation_config.max_area_ratio * src_height * src_width:
+            return False
+
+        # (num_rows - 1, num_cols - 1, 4, 2), clockwise.
+        src_np_cells = self.src_image_grid.to_np_cells()
+        dst_np_cells = self.dst_image_grid.to_np_cells()
+
+        # (*, 4, 2), edge vectors.
+        src_np_edges = np.roll(src_np_cells, -1, axis=2) - src_np_cells
+        dst_np_edges = np.roll(dst_np_cells, -1, axis=2) - dst_np_cells
+
+        # The last row/col of the src grid could be 1-pixel wide, and the rounding of the dst
+        # points dominates the shape of such cells. Hence skip.
+        src_np_lengths = np.linalg.norm(src_np_edges, axis=3)
+        dst_np_lengths = np.linalg.norm(dst_np_edges, axis=3)
+        np_mask = src_np_lengths.min(axis=2) >= 2
+
+        # Cross products of the adjacent edges, flipped sign means folded.
+        src_np_crosses = cross_np_2d_vectors(src_np_edges, np.roll(src_np_edges, -1, axis=2))
+        dst_np_crosses = cross_np_2d_vectors(dst_np_edges, np.roll(dst_np_edges, -1, axis=2))
+        if not validation_config.allow_folded_cells:
+            if (src_np_crosses * dst_np_crosses < 0)[np_mask].any():
+                return False
+
+        # Shoelace formula.
+        src_np_areas = np.abs(
+            cross_np_2d_vectors(src_np_cells, np.roll(src_np_cells, -1, axis=2)).sum(axis=2)
+        ) / 2
+        dst_np_areas = np.abs(
+            cross_np_2d_vectors(dst_np_cells, np.roll(dst_np_cells, -1, axis=2)).sum(axis=2)
+        ) / 2
+        if (dst_np_areas < validation_config.min_cell_area_ratio * src_np_areas)[np_mask].any():
+            return False
+
+        if (dst_np_lengths < validation_config.min_cell_side_ratio * src_np_lengths)[np_mask].any():
+            return False
+
+        return True
+
+    @property
+    def dense_map(self):
+        if self._cache_dense_map is None:
+            output_box, output_shape = get_output_window_box_and_shape(
+                self.dst_image_grid.image_height,
+                self.dst_image_grid.image_width,
+                self.output_box,
+                self.output_shape,
+            )
+            output_height, output_width = output_shape
+            self._cache_dense_map = self.generate_dense_map(
+                generate_output_window_dst_coordinates(
+                    output_box.up,
+                    output_box.height,
+                    output_height,
+                ),
+                generate_output_window_dst_coordinates(
+                    output_box.left,
+                    output_box.width,
+                    output_width,
+                ),
+            )
+        return self._cache_dense_map
+
 
 def geometric_distortion_image_grid_based_image(config, state, image):
+    if state.use_dense_map:
+        image = attr.evolve(image, mat=state.prefilter_src_mat(image.mat))
+        return blend_src_to_dst_image_by_dense_map(image, state.dense_map)
+
+    src_content_mask = state.src_content_mask
+    if state.uniform_cell_max_delta is not None and src_content_mask is None:
+        src_content_mask = generate_src_content_mask(image.mat, state.uniform_cell_max_delta)
+
     return blend_src_to_dst_image(
         image,
         state.src_image_grid,
         state.dst_image_grid,
+        uniform_cell_max_delta=state.uniform_cell_max_delta,
+        src_content_mask=src_content_mask,
     )
 
 
 def geometric_distortion_image_grid_based_image_score_map(config, state, image_score_map):
+    if state.use_dense_map:
+        image_score_map = VImageScoreMap(mat=state.prefilter_src_mat(image_score_map.mat))
+        return blend_src_to_dst_image_score_map_by_dense_map(image_score_map, state.dense_map)
+
     return blend_src_to_dst_image_score_map(
         image_score_map,
         state.src_image_grid,
         state.dst_image_grid,
+        skip_uniform_cells=state.uniform_cell_max_delta is not None,
     )
 
 
 def geometric_distortion_image_grid_based_image_mask(config, state, image_mask):
-    return blend_src_to_dst_image_mask(image_mask, state.src_image_grid, state.dst_image_grid)
+    if state.use_dense_map:
+        return blend_src_to_dst_image_mask_by_dense_map(image_mask, state.dense_map)
+
+    return blend_src_to_dst_image_mask(
+        image_mask,
+        state.src_image_grid,
+        state.dst_image_grid,
+        skip_uniform_cells=state.uniform_cell_max_delta is not None,
+    )
+
+
+def geometric_distortion_image_grid_based_validate_state(config, state, shape, validation_config):
+    return state.validate(validation_config)
+
+
+def geometric_distortion_image_grid_based_apply_output_window(
+    config,
+    state,
+    shape,
+    output_box,
+    output_shape,
+):
+    return state.to_output_window_state(output_box, output_shape)
+
+
+def geometric_distortion_image_grid_based_multi_targets(
+    config,
+    state: StateImageGridBased,
+    image: VImage,
+    image_mask: Optional[VImageMask],
+    image_score_map: Optional[VImageScoreMap],
+    get_active_image_mask: bool,
+):
+    if state.use_dense_map or state.uniform_cell_max_delta is not None:
+        # The targets are rendered with different settings, handled separately.
+        return GeometricDistortionResult(
+            image=geometric_distortion_image_grid_based_image(config, state, image)
+        )
+
+    mats = [image.mat]
+    if image_mask:
+        mats.append(image_mask.mat)
+    if image_score_map:
+        mats.append(image_score_map.mat)
+
+    new_mats = distort_mats_by_stacking_planes(
+        mats,
+        lambda stacked_mats: blend_src_to_dst_mats(
+            stacked_mats,
+            state.src_image_grid,
+            state.dst_image_grid,
+        ),
+    )
+
+    result = GeometricDistortionResult(image=VImage(mat=new_mats.pop(0), kind=image.kind))
+    if image_mask:
+        result.image_mask = VImageMask(mat=new_mats.pop(0))
+    if image_score_map:
+        result.image_score_map = VImageScoreMap(mat=new_mats.pop(0))
+    return result
 
 
 def geometric_distortion_image_grid_based_active_image_mask(config, state, image):
+    if state.use_dense_map:
+        return VImageMask(mat=(state.dense_map.map_x >= 0).astype(np.uint8))
+
     border_polygon = state.dst_image_grid.generate_border_polygon()
     return VImageMask.from_shape_and_polygons(
         state.dst_image_grid.image_height,
@@ -651,26 +1275,30 @@ def geometric_distortion_image_grid_based_point(
     shape,
     point: VPoint,
 ):
-    src_image_grid = state.src_image_grid
-    dst_image_grid = state.dst_image_grid
+    if state.enable_dense_map:
+        # Exact mapping.
+        dst_point = state.shift_and_rescale_point(state.point_projector.project_point(point))
+        return state.to_output_window_point(dst_point)
 
-    assert src_image_grid.grid_size
-    polygon_row = point.y // src_image_grid.grid_size
-    polygon_col = point.x // src_image_grid.grid_size
+    dst_point = generate_dst_point_by_image_grids(
+        state.src_image_grid,
+        state.dst_image_grid,
+        point,
+    )
+    return state.to_output_window_point(dst_point)
 
-    src_polygon = src_image_grid.generate_polygon(polygon_row, polygon_col)
-    dst_polygon = dst_image_grid.generate_polygon(polygon_row, polygon_col)
 
-    trans_mat = cv.getPerspectiveTransform(
-        src_polygon.to_np_array().astype(np.float32),
-        dst_polygon.to_np_array().astype(np.float32),
-        cv.DECOMP_SVD,
-    )
-    dst_tx, dst_ty, dst_t = np.matmul(trans_mat, (point.x, point.y, 1.0))
-    return VPoint(
-        y=dst_ty / dst_t,
-        x=dst_tx / dst_t,
-    )
+def geometric_distortion_image_grid_based_inverse_points(
+    config,
+    state: StateImageGridBased,
+    shape,
+    points: VPointList,
+):
+    if not points:
+        return VPointList()
+
+    np_points = state.from_output_window_np_points(points.to_np_array().astype(np.float64))
+    return VPointList.from_np_array(state.inverse_np_points(np_points))
 
 
 class GeometricDistortionImageGridBased(
@@ -692,6 +1320,14 @@ class GeometricDistortionImageGridBased(
         func_points: Optional[Callable[..., VPointList]] = None,
         func_polygon: Optional[Callable[..., VPolygon]] = None,
         func_polygons: Optional[Callable[..., Sequence[VPolygon]]] = None,
+        func_validate_state: Optional[Callable[..., bool]
+                                      ] = geometric_distortion_image_grid_based_validate_state,
+        func_apply_output_window: Optional[Callable[
+            ..., T_STATE]] = geometric_distortion_image_grid_based_apply_output_window,
+        func_multi_targets: Optional[Callable[..., GeometricDistortionResult]
+                                     ] = geometric_distortion_image_grid_based_multi_targets,
+        func_inverse_points: Optional[Callable[..., VPointList]
+                                      ] = geometric_distortion_image_grid_based_inverse_points,
     ):
         assert issubclass(state_cls, StateImageGridBased)
         super().__init__(
@@ -705,6 +1341,10 @@ class GeometricDistortionImageGridBased(
             func_points=func_points,
             func_polygon=func_polygon,
             func_polygons=func_polygons,
+            func_validate_state=func_validate_state,
+            func_apply_output_window=func_apply_output_window,
+            func_multi_targets=func_multi_targets,
+            func_inverse_points=func_inverse_points,
         )
 
 
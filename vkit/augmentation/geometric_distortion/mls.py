@@ -1,4 +1,4 @@
-from typing import Sequence, Tuple
+from typing import Optional, Sequence, Tuple
 
 import numpy as np
 import attr
@@ -16,6 +16,8 @@ class SimilarityMlsConfig:
     dst_handle_points: Sequence[VPoint]
     grid_size: int
     rescale_as_src: bool = False
+    # Skip resampling the uniform grid cells, e.g. the background of sparse documents.
+    uniform_cell_max_delta: Optional[int] = None
 
 
 class SimilarityMlsPointProjector(PointProjector):
@@ -134,6 +136,7 @@ class SimilarityMlsState(StateImageGridBased):
                 config.src_handle_points,
                 config.dst_handle_points,
             ),
+            uniform_cell_max_delta=config.uniform_cell_max_delta,
         )
 
         self.dst_handle_points = list(map(self.shift_and_rescale_point, config.dst_handle_points))
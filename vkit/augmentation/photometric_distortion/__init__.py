@@ -1,4 +1,4 @@
-from .interface import PhotometricDistortion
+from .interface import PhotometricDistortion, PhotometricPipeline
 
 from .color import (
     MeanShiftConfig,
@@ -11,6 +11,8 @@ from .color import (
     hue_shift,
     SaturationShiftConfig,
     saturation_shift,
+    ColorJitterConfig,
+    color_jitter,
 )
 from .noise import (
     GaussionNoiseConfig,
@@ -21,4 +23,16 @@ from .noise import (
     impulse_noise,
     SpeckleNoiseConfig,
     speckle_noise,
+    BlotchNoiseConfig,
+    blotch_noise,
 )
+from .noise_bank import NoiseBank
+from .blur import (
+    GaussianBlurConfig,
+    gaussian_blur,
+    DefocusBlurConfig,
+    defocus_blur,
+    MotionBlurConfig,
+    motion_blur,
+)
+from .illumination import IlluminationConfig, illumination
@@ -0,0 +1,185 @@
+import math
+
+import attr
+import numpy as np
+import cv2 as cv
+
+from vkit.image.type import VImage
+from .interface import PhotometricDistortion
+
+
+def filter_mat(mat, kernel):
+    # NOTE: cv.filter2D switches to the DFT based correlation for kernel >= 11x11, which is
+    # faster than the explicit full-frame FFT convolution, hence used for the large
+    # non-separable kernel as well.
+    return cv.filter2D(mat, -1, kernel, borderType=cv.BORDER_REFLECT_101)
+
+
+def get_gaussian_kernel_size(sigma: float):
+    # Same as cv.GaussianBlur for uint8.
+    return int(round(sigma * 3 * 2 + 1)) | 1
+
+
+def get_box_cascade_sizes(sigma: float, num_boxes: int = 3):
+    # Box sizes that approximate Gaussian by applying box filters successively.
+    # "Fast Almost-Gaussian Filtering", Peter Kovesi.
+    ideal_size = math.sqrt(12 * sigma**2 / num_boxes + 1)
+    lower_size = int(math.floor(ideal_size))
+    if lower_size % 2 == 0:
+        lower_size -= 1
+    upper_size = lower_size + 2
+
+    numerator = 12 * sigma**2 - num_boxes * (lower_size**2 + 4 * lower_size + 3)
+    num_lower_boxes = round(numerator / (-4 * lower_size - 4))
+    num_lower_boxes = min(num_boxes, max(0, num_lower_boxes))
+    return [lower_size] * num_lower_boxes + [upper_size] * (num_boxes - num_lower_boxes)
+
+
+@attr.define
+class GaussianBlurConfig:
+    sigma: float
+
+
+# The 3-pass box cascade is faster than the separable kernel of this size (sigma = 4). For the
+# smaller sigma, the box sizes are too coarse to approximate the Gaussian (e.g. the error could
+# reach 6 at sigma = 2), while the separable kernel is about as fast.
+_GAUSSIAN_BLUR_BOX_CASCADE_MIN_KERNEL_SIZE = 25
+
+
+def gaussian_blur_image(config, image):
+    assert config.sigma > 0
+
+    if get_gaussian_kernel_size(config.sigma) < _GAUSSIAN_BLUR_BOX_CASCADE_MIN_KERNEL_SIZE:
+        # Separable.
+        mat = cv.GaussianBlur(
+            image.mat,
+            (0, 0),
+            sigmaX=config.sigma,
+            borderType=cv.BORDER_REFLECT_101,
+        )
+    else:
+        # Box cascade, the cost is independent of sigma.
+        mat = image.mat
+        for box_size in get_box_cascade_sizes(config.sigma):
+            mat = cv.blur(mat, (box_size, box_size), borderType=cv.BORDER_REFLECT_101)
+
+    return attr.evolve(image, mat=mat)
+
+
+gaussian_blur = PhotometricDistortion(GaussianBlurConfig, gaussian_blur_image)
+
+
+@attr.define
+class DefocusBlurConfig:
+    radius: int
+
+
+def generate_disk_kernel(radius: int):
+    size = 2 * radius + 1
+    kernel = np.zeros((size, size), dtype=np.uint8)
+    cv.circle(kernel, (radius, radius), radius, 255, -1, cv.LINE_AA)
+    kernel = kernel.astype(np.float32)
+    kernel /= kernel.sum()
+    return kernel
+
+
+def defocus_blur_image(config, image):
+    assert config.radius > 0
+    # Not separable.
+    mat = filter_mat(image.mat, generate_disk_kernel(config.radius))
+    return attr.evolve(image, mat=mat)
+
+
+defocus_blur = PhotometricDistortion(DefocusBlurConfig, defocus_blur_image)
+
+
+@attr.define
+class MotionBlurConfig:
+    # The length of the motion, in pixels.
+    length: int
+    # In degrees, counterclockwise, 0 for horizontal.
+    angle: float = 0.0
+
+
+def generate_line_kernel(length: int, angle: float):
+    # The segment of the length centered at the kernel center, densely sampled and splatted
+    # bilinearly. Hence the kernel is centered and symmetric, and reduces to a 1D box (with
+    # fractional ends) if the angle is 0 or 90.
+    radius = length / 2
+    size = 2 * math.ceil(radius) + 1
+    center = size // 2
+    theta = math.radians(angle)
+
+    num_samples = 8 * length + 1
+    offsets = np.linspace(-radius, radius, num_samples)
+    weights = np.ones(num_samples)
+    # Trapezoidal rule.
+    weights[0] = weights[-1] = 0.5
+
+    xs = center + offsets * math.cos(theta)
+    ys = center - offsets * math.sin(theta)
+    xs_floor = np.floor(xs).astype(np.int32)
+    ys_floor = np.floor(ys).astype(np.int32)
+    xs_frac = xs - xs_floor
+    ys_frac = ys - ys_floor
+
+    # One more row and column for the splatting, which are always zero.
+    kernel = np.zeros((size + 1, size + 1), dtype=np.float64)
+    np.add.at(kernel, (ys_floor, xs_floor), weights * (1 - xs_frac) * (1 - ys_frac))
+    np.add.at(kernel, (ys_floor, xs_floor + 1), weights * xs_frac * (1 - ys_frac))
+    np.add.at(kernel, (ys_floor + 1, xs_floor), weights * (1 - xs_frac) * ys_frac)
+    np.add.at(kernel, (ys_floor + 1, xs_floor + 1), weights * xs_frac * ys_frac)
+
+    kernel = kernel[:size, :size].astype(np.float32)
+    kernel /= kernel.sum()
+    return kernel
+
+
+def box_blur_1d(mat, ksize):
+    # cv.blur anchors the box of even length at length // 2, i.e., shifted by half a pixel.
+    # Hence average the boxes of the two middle anchors, to be centered as the line kernel.
+    ksize_x, ksize_y = ksize
+    assert ksize_x == 1 or ksize_y == 1
+    mat_blurred = cv.blur(mat, ksize, borderType=cv.BORDER_REFLECT_101)
+    if ksize_x % 2 == 1 and ksize_y % 2 == 1:
+        return mat_blurred
+
+    anchor = (ksize_x // 2 - (1 - ksize_x % 2), ksize_y // 2 - (1 - ksize_y % 2))
+    mat_shifted_blurred = cv.blur(mat, ksize, anchor=anchor, borderType=cv.BORDER_REFLECT_101)
+    return cv.addWeighted(mat_blurred, 0.5, mat_shifted_blurred, 0.5, 0)
+
+
+def motion_blur_image(config, image):
+    assert config.length > 0
+
+    angle = config.angle % 180
+    if angle == 0:
+        # 1D box, the cost is independent of the length.
+        mat = box_blur_1d(image.mat, (config.length, 1))
+    elif angle == 90:
+        mat = box_blur_1d(image.mat, (1, config.length))
+    else:
+        mat = filter_mat(image.mat, generate_line_kernel(config.length, angle))
+
+    return attr.evolve(image, mat=mat)
+
+
+motion_blur = PhotometricDistortion(MotionBlurConfig, motion_blur_image)
+
+
+def debug():
+    from vkit.opt import get_data_folder
+    folder = get_data_folder(__file__)
+
+    image = VImage.from_file(f'{folder}/Lenna.png')
+
+    for sigma in (1.5, 8.0):
+        config = GaussianBlurConfig(sigma=sigma)
+        gaussian_blur.distort_image(config, image).to_file(f'{folder}/gaussian_blur_{sigma}.png')
+
+    config = DefocusBlurConfig(radius=10)
+    defocus_blur.distort_image(config, image).to_file(f'{folder}/defocus_blur.png')
+
+    for angle in (0, 30, 90):
+        config = MotionBlurConfig(length=25, angle=angle)
+        motion_blur.distort_image(config, image).to_file(f'{folder}/motion_blur_{angle}.png')
@@ -1,10 +1,19 @@
 from typing import Any
+import functools
 
 import attr
 import numpy as np
+import cv2 as cv
 
 from vkit.image.type import VImage, VImageKind
-from .opt import extract_mat_from_image, clip_mat_back_to_uint8
+from .opt import (
+    clip_mat_back_to_uint8,
+    get_mat_num_channels,
+    generate_identity_lut,
+    apply_lut_to_mat,
+    to_batch_values,
+    distort_batch_mat_per_sample,
+)
 from .interface import PhotometricDistortion
 
 
@@ -13,14 +22,41 @@ class MeanShiftConfig:
     delta: int
 
 
-def mean_shift_image(config, image):
+def mean_shift_mat(config, mat):
     # Change mean.
-    mat = extract_mat_from_image(image, np.int16) + config.delta
-    mat = clip_mat_back_to_uint8(mat)
+    mat += config.delta
+
+
+@functools.lru_cache(maxsize=1024)
+def _generate_mean_shift_lut(delta: int, num_channels: int):
+    lut = generate_identity_lut(num_channels).astype(np.int16)
+    mean_shift_mat(MeanShiftConfig(delta=delta), lut)
+    lut = clip_mat_back_to_uint8(lut)
+    # Shared by cache.
+    lut.setflags(write=False)
+    return lut
+
+
+def mean_shift_lut(config, mat):
+    return _generate_mean_shift_lut(config.delta, get_mat_num_channels(mat))
+
+
+def mean_shift_batch_mat(configs, mat, rnds):
+    mat += to_batch_values([config.delta for config in configs], mat)
+
+
+def mean_shift_image(config, image):
+    mat = apply_lut_to_mat(image.mat, mean_shift_lut(config, image.mat))
     return attr.evolve(image, mat=mat)
 
 
-mean_shift = PhotometricDistortion(MeanShiftConfig, mean_shift_image)
+mean_shift = PhotometricDistortion(
+    MeanShiftConfig,
+    mean_shift_image,
+    mean_shift_mat,
+    mean_shift_lut,
+    func_batch_mat=mean_shift_batch_mat,
+)
 
 
 @attr.define
@@ -28,25 +64,67 @@ class StdShiftConfig:
     scale: float
 
 
-def std_shift_image(config, image):
+def _calculate_std_shift_mean(mat):
+    # NOTE: accumulate in float32 even if mat is uint8, to be consistent with the float32 buffer.
+    if mat.ndim == 2:
+        return np.mean(mat, dtype=np.float32)
+    elif mat.ndim == 3:
+        return np.mean(mat.reshape(-1, mat.shape[-1]), axis=0, dtype=np.float32)
+    else:
+        raise NotImplementedError()
+
+
+def _std_shift_mat_with_mean(config, mat, mean):
+    mat *= config.scale
+    mat -= mean * (config.scale - 1)
+
+
+def std_shift_mat(config, mat):
     # Change std while preserve mean.
     assert config.scale > 0
-    mat = extract_mat_from_image(image, np.float32)
+    _std_shift_mat_with_mean(config, mat, _calculate_std_shift_mean(mat))
 
-    if mat.ndim == 2:
-        mean = np.mean(mat)
-    elif mat.ndim == 3:
-        mean = np.mean(mat.reshape(-1, mat.shape[-1]), axis=0)
+
+def std_shift_lut(config, mat):
+    # Depends on the mean of mat, hence not cached.
+    assert config.scale > 0
+    lut = generate_identity_lut(get_mat_num_channels(mat)).astype(np.float32)
+    _std_shift_mat_with_mean(config, lut, _calculate_std_shift_mean(mat))
+    return clip_mat_back_to_uint8(lut)
+
+
+def std_shift_batch_mat(configs, mat, rnds):
+    scales = to_batch_values([config.scale for config in configs], mat)
+    assert (scales > 0).all()
+
+    num_samples = mat.shape[0]
+    if mat.ndim == 3:
+        means = np.mean(mat.reshape(num_samples, -1), axis=1)
+        means = means.reshape(num_samples, 1, 1)
+    elif mat.ndim == 4:
+        num_channels = mat.shape[-1]
+        means = np.mean(mat.reshape(num_samples, -1, num_channels), axis=1)
+        means = means.reshape(num_samples, 1, 1, num_channels)
     else:
         raise NotImplementedError()
 
-    mat = mat * config.scale - mean * (config.scale - 1)
+    mat *= scales
+    mat -= means * (scales - 1)
+
 
-    mat = clip_mat_back_to_uint8(mat)
+def std_shift_image(config, image):
+    mat = apply_lut_to_mat(image.mat, std_shift_lut(config, image.mat))
     return attr.evolve(image, mat=mat)
 
 
-std_shift = PhotometricDistortion(StdShiftConfig, std_shift_image)
+std_shift = PhotometricDistortion(
+    StdShiftConfig,
+    std_shift_image,
+    std_shift_mat,
+    std_shift_lut,
+    func_lut_requires_mat=True,
+    func_batch_mat=std_shift_batch_mat,
+)
 
 
 @attr.define
@@ -54,13 +132,93 @@ class ChannelPermutateConfig:
     rnd_state: Any = None
 
 
+def channel_permutate_mat(config, mat, rnd):
+    indices = rnd.permutation(mat.shape[2])
+    mat[:] = mat[:, :, indices]
+
+
+def channel_permutate_batch_mat(configs, mat, rnds):
+    indices = np.stack([rnd.permutation(mat.shape[3]) for rnd in rnds])
+    # Group the samples by permutation, since the number of distinct permutations is small.
+    unique_indices, inverse = np.unique(indices, axis=0, return_inverse=True)
+    for group_idx, group_indices in enumerate(unique_indices):
+        samples = np.flatnonzero(inverse == group_idx)
+        mat[samples] = mat[samples][:, :, :, group_indices]
+
+
 def channel_permutate_image(config, image, rnd):
     indices = rnd.permutation(image.num_channels)
     mat = image.mat[:, :, indices]
     return attr.evolve(image, mat=mat)
 
 
-channel_permutate = PhotometricDistortion(ChannelPermutateConfig, channel_permutate_image)
+channel_permutate = PhotometricDistortion(
+    ChannelPermutateConfig,
+    channel_permutate_image,
+    channel_permutate_mat,
+    func_batch_mat=channel_permutate_batch_mat,
+)
+
+# YIQ (NTSC), for approximating the HSV jitter by a linear transform in RGB.
+_RGB_TO_YIQ = np.asarray(
+    [
+        [0.299, 0.587, 0.114],
+        [0.596, -0.274, -0.322],
+        [0.211, -0.523, 0.312],
+    ],
+    dtype=np.float64,
+)
+_YIQ_TO_RGB = np.linalg.inv(_RGB_TO_YIQ)
+
+# The reference pixel for calibrating the saturation delta, relative to the max channel.
+_CHROMA_SCALE_REFERENCE_SATURATION = 0.6
+_CHROMA_SCALE_REFERENCE_LUMA = 0.64
+
+
+def calculate_chroma_scale(saturation_delta: int):
+    # Scaling the chroma by k around the luma y, the HSV saturation s of a pixel becomes
+    # k * s / (y + k * (1 - y)) (relative to the max channel). Solve k for s + delta at the
+    # reference pixel, hence the effect is close to the HSV additive delta in average.
+    saturation = _CHROMA_SCALE_REFERENCE_SATURATION
+    luma = _CHROMA_SCALE_REFERENCE_LUMA
+    target_saturation = min(1.0, saturation + saturation_delta / 255)
+    if target_saturation <= 0:
+        # Grayscale.
+        return 0.0
+    return target_saturation * luma / (saturation - target_saturation * (1 - luma))
+
+
+@functools.lru_cache(maxsize=1024)
+def generate_rgb_color_jitter_matrix(hue_delta: int, saturation_delta: int, value_scale: float):
+    # Hue: rotate the chroma (IQ), the delta is in the unit of HSV_FULL (256 for 360 degrees).
+    # Saturation: scale the chroma, calibrated to the HSV delta, see calculate_chroma_scale.
+    # Value: scale all channels.
+    theta = -hue_delta / 256 * 2 * np.pi
+    chroma_scale = calculate_chroma_scale(saturation_delta)
+    cos_theta = np.cos(theta) * chroma_scale
+    sin_theta = np.sin(theta) * chroma_scale
+    yiq_trans_mat = np.asarray(
+        [
+            [1.0, 0.0, 0.0],
+            [0.0, cos_theta, -sin_theta],
+            [0.0, sin_theta, cos_theta],
+        ],
+        dtype=np.float64,
+    )
+    trans_mat = value_scale * (_YIQ_TO_RGB @ yiq_trans_mat @ _RGB_TO_YIQ)
+    trans_mat.setflags(write=False)
+    return trans_mat
+
+
+def transform_rgb_mat(mat, trans_mat):
+    # One pass with saturation.
+    return cv.transform(mat, trans_mat)
+
+
+def transform_rgb_mat_inplace(mat, trans_mat):
+    # For the float32 buffer, the values are valid uint8 hence the conversion is exact.
+    # Transform as uint8 to be consistent with transform_rgb_mat.
+    mat[:] = transform_rgb_mat(mat.astype(np.uint8), trans_mat)
 
 
 @attr.define
@@ -68,35 +226,197 @@ class HueShiftConfig:
     delta: int
 
 
-def hue_shift_image(config, image):
-    assert image.kind == VImageKind.HSV
-    mat = extract_mat_from_image(image, np.int16)
+def hue_shift_mat(config, mat, kind=VImageKind.HSV):
+    if kind == VImageKind.RGB:
+        transform_rgb_mat_inplace(mat, generate_rgb_color_jitter_matrix(config.delta, 0, 1.0))
+        return
 
-    # Cyclic.
+    # HSV. Cyclic.
+    assert kind == VImageKind.HSV
     mat[:, :, 0] += config.delta
-    mat = mat % 256  # type: ignore
-    mat = mat.astype(np.uint8)
+    np.mod(mat[:, :, 0], 256, out=mat[:, :, 0])
+
 
+def hue_shift_batch_mat(configs, mat, rnds, kind=VImageKind.HSV):
+    if kind != VImageKind.HSV:
+        distort_batch_mat_per_sample(hue_shift_mat, configs, mat, rnds, kind)
+        return
+
+    deltas = to_batch_values([config.delta for config in configs], mat[:, :, :, 0])
+    mat[:, :, :, 0] += deltas
+    np.mod(mat[:, :, :, 0], 256, out=mat[:, :, :, 0])
+
+
+@functools.lru_cache(maxsize=1024)
+def _generate_hue_shift_lut(delta: int):
+    lut = generate_identity_lut(3).astype(np.int16)
+    hue_shift_mat(HueShiftConfig(delta=delta), lut[None])
+    lut = lut.astype(np.uint8)
+    lut.setflags(write=False)
+    return lut
+
+
+def hue_shift_lut(config, mat, kind=VImageKind.HSV):
+    if kind != VImageKind.HSV:
+        return None
+    assert get_mat_num_channels(mat) == 3
+    return _generate_hue_shift_lut(config.delta)
+
+
+def hue_shift_image(config, image):
+    if image.kind == VImageKind.RGB:
+        trans_mat = generate_rgb_color_jitter_matrix(config.delta, 0, 1.0)
+        mat = transform_rgb_mat(image.mat, trans_mat)
+    else:
+        assert image.kind == VImageKind.HSV
+        mat = apply_lut_to_mat(image.mat, hue_shift_lut(config, image.mat))
     return attr.evolve(image, mat=mat)
 
 
-hue_shift = PhotometricDistortion(HueShiftConfig, hue_shift_image)
+hue_shift = PhotometricDistortion(
+    HueShiftConfig,
+    hue_shift_image,
+    hue_shift_mat,
+    hue_shift_lut,
+    func_batch_mat=hue_shift_batch_mat,
+)
 
 
 @attr.define
 class SaturationShiftConfig:
+    # Added to the HSV saturation. For the RGB image, approximated by scaling the chroma, close to
+    # the HSV path in average for |delta| <= 100, weaker beyond since the RGB channels are clipped.
     delta: int
 
 
-def saturation_shift_image(config, image):
-    assert image.kind == VImageKind.HSV
-    mat = extract_mat_from_image(image, np.int16)
+def saturation_shift_mat(config, mat, kind=VImageKind.HSV):
+    if kind == VImageKind.RGB:
+        transform_rgb_mat_inplace(mat, generate_rgb_color_jitter_matrix(0, config.delta, 1.0))
+        return
+
+    # HSV.
+    assert kind == VImageKind.HSV
     mat[:, :, 1] += config.delta
-    mat = clip_mat_back_to_uint8(mat)
+
+
+def saturation_shift_batch_mat(configs, mat, rnds, kind=VImageKind.HSV):
+    if kind != VImageKind.HSV:
+        distort_batch_mat_per_sample(saturation_shift_mat, configs, mat, rnds, kind)
+        return
+
+    deltas = to_batch_values([config.delta for config in configs], mat[:, :, :, 1])
+    mat[:, :, :, 1] += deltas
+
+
+@functools.lru_cache(maxsize=1024)
+def _generate_saturation_shift_lut(delta: int):
+    lut = generate_identity_lut(3).astype(np.int16)
+    saturation_shift_mat(SaturationShiftConfig(delta=delta), lut[None])
+    lut = clip_mat_back_to_uint8(lut)
+    lut.setflags(write=False)
+    return lut
+
+
+def saturation_shift_lut(config, mat, kind=VImageKind.HSV):
+    if kind != VImageKind.HSV:
+        return None
+    assert get_mat_num_channels(mat) == 3
+    return _generate_saturation_shift_lut(config.delta)
+
+
+def saturation_shift_image(config, image):
+    if image.kind == VImageKind.RGB:
+        trans_mat = generate_rgb_color_jitter_matrix(0, config.delta, 1.0)
+        mat = transform_rgb_mat(image.mat, trans_mat)
+    else:
+        assert image.kind == VImageKind.HSV
+        mat = apply_lut_to_mat(image.mat, saturation_shift_lut(config, image.mat))
     return attr.evolve(image, mat=mat)
 
 
-saturation_shift = PhotometricDistortion(SaturationShiftConfig, saturation_shift_image)
+saturation_shift = PhotometricDistortion(
+    SaturationShiftConfig,
+    saturation_shift_image,
+    saturation_shift_mat,
+    saturation_shift_lut,
+    func_batch_mat=saturation_shift_batch_mat,
+)
+
+
+@attr.define
+class ColorJitterConfig:
+    # Same units as HueShiftConfig and SaturationShiftConfig.
+    hue_delta: int = 0
+    saturation_delta: int = 0
+    value_scale: float = 1.0
+
+
+def color_jitter_mat(config, mat, kind=VImageKind.RGB):
+    if kind == VImageKind.RGB:
+        trans_mat = generate_rgb_color_jitter_matrix(
+            config.hue_delta,
+            config.saturation_delta,
+            config.value_scale,
+        )
+        transform_rgb_mat_inplace(mat, trans_mat)
+        return
+
+    # HSV, each channel is jittered independently.
+    assert kind == VImageKind.HSV
+    mat[:, :, 0] += config.hue_delta
+    np.mod(mat[:, :, 0], 256, out=mat[:, :, 0])
+    mat[:, :, 1] += config.saturation_delta
+    mat[:, :, 2] *= config.value_scale
+
+
+@functools.lru_cache(maxsize=1024)
+def _generate_color_jitter_lut(hue_delta: int, saturation_delta: int, value_scale: float):
+    lut = generate_identity_lut(3).astype(np.float32)
+    color_jitter_mat(
+        ColorJitterConfig(
+            hue_delta=hue_delta,
+            saturation_delta=saturation_delta,
+            value_scale=value_scale,
+        ),
+        lut[None],
+        VImageKind.HSV,
+    )
+    lut = clip_mat_back_to_uint8(lut)
+    lut.setflags(write=False)
+    return lut
+
+
+def color_jitter_lut(config, mat, kind=VImageKind.RGB):
+    if kind != VImageKind.HSV:
+        return None
+    assert get_mat_num_channels(mat) == 3
+    return _generate_color_jitter_lut(
+        config.hue_delta,
+        config.saturation_delta,
+        config.value_scale,
+    )
+
+
+def color_jitter_image(config, image):
+    if image.kind == VImageKind.RGB:
+        trans_mat = generate_rgb_color_jitter_matrix(
+            config.hue_delta,
+            config.saturation_delta,
+            config.value_scale,
+        )
+        mat = transform_rgb_mat(image.mat, trans_mat)
+    else:
+        assert image.kind == VImageKind.HSV
+        mat = apply_lut_to_mat(image.mat, color_jitter_lut(config, image.mat, image.kind))
+    return attr.evolve(image, mat=mat)
+
+
+color_jitter = PhotometricDistortion(
+    ColorJitterConfig,
+    color_jitter_image,
+    color_jitter_mat,
+    color_jitter_lut,
+)
 
 
 def debug():
@@ -136,3 +456,7 @@ def debug():
 
     config = SaturationShiftConfig(delta=-100)
     saturation_shift.distort_image(config, image_hsv).to_file(f'{folder}/saturation_m_100.png')
+
+    config = ColorJitterConfig(hue_delta=100, saturation_delta=50, value_scale=1.2)
+    color_jitter.distort_image(config, image).to_file(f'{folder}/color_jitter_rgb.png')
+    color_jitter.distort_image(config, image_hsv).to_file(f'{folder}/color_jitter_hsv.png')
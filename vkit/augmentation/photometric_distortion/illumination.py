@@ -0,0 +1,148 @@
+from typing import Any, Tuple
+
+import attr
+import numpy as np
+import cv2 as cv
+
+from vkit.image.type import VImage
+from .interface import PhotometricDistortion
+
+
+@attr.define
+class IlluminationConfig:
+    # Uneven lighting, the gain of a random quadratic surface is in
+    # [1 - polynomial_strength, 1 + polynomial_strength].
+    polynomial_strength: float = 0.0
+    # The gain at the farthest corner is 1 - vignette_strength.
+    vignette_strength: float = 0.0
+    # Random soft shadow polygons, the gain inside a shadow is 1 - shadow_strength.
+    num_shadows: int = 0
+    shadow_strength: float = 0.5
+    # The width of the shadow edge, relative to the short side.
+    shadow_softness: float = 0.05
+    # The long side of the coarse grid, hence the cost of field generation is independent of the
+    # image resolution.
+    field_resolution: int = 64
+    rnd_state: Any = None
+
+
+def get_field_shape(config: IlluminationConfig, shape: Tuple[int, int]):
+    height, width = shape
+    scale = config.field_resolution / max(height, width)
+    field_height = max(2, round(height * scale))
+    field_width = max(2, round(width * scale))
+    return field_height, field_width
+
+
+def generate_polynomial_field(config: IlluminationConfig, field_shape, rnd: np.random.RandomState):
+    field_height, field_width = field_shape
+    ys, xs = np.meshgrid(
+        np.linspace(-1.0, 1.0, field_height, dtype=np.float32),
+        np.linspace(-1.0, 1.0, field_width, dtype=np.float32),
+        indexing='ij',
+    )
+    # x, y, x^2, y^2, xy.
+    coefficients = rnd.uniform(-1.0, 1.0, 5)
+    field = (
+        coefficients[0] * xs + coefficients[1] * ys + coefficients[2] * xs**2
+        + coefficients[3] * ys**2 + coefficients[4] * xs * ys
+    ).astype(np.float32)
+
+    max_abs = np.abs(field).max()
+    if max_abs > 0:
+        field /= max_abs
+    return 1 + config.polynomial_strength * field
+
+
+def generate_vignette_field(config: IlluminationConfig, field_shape, rnd: np.random.RandomState):
+    field_height, field_width = field_shape
+    ys, xs = np.meshgrid(
+        np.linspace(-1.0, 1.0, field_height, dtype=np.float32),
+        np.linspace(-1.0, 1.0, field_width, dtype=np.float32),
+        indexing='ij',
+    )
+    center_x, center_y = rnd.uniform(-0.3, 0.3, 2)
+    squared_distances = (xs - center_x)**2 + (ys - center_y)**2
+    squared_distances /= squared_distances.max()
+    return 1 - config.vignette_strength * squared_distances
+
+
+def generate_shadow_field(config: IlluminationConfig, field_shape, rnd: np.random.RandomState):
+    field_height, field_width = field_shape
+    short_side = min(field_height, field_width)
+
+    # Render in higher precision by shift.
+    shift = 4
+    scale = 1 << shift
+    shadow_mask = np.zeros(field_shape, dtype=np.float32)
+    for _ in range(config.num_shadows):
+        center_x = rnd.uniform(0, field_width)
+        center_y = rnd.uniform(0, field_height)
+        num_vertices = rnd.randint(3, 7)
+        thetas = np.sort(rnd.uniform(0, 2 * np.pi, num_vertices))
+        radiuses = rnd.uniform(0.2, 0.8, num_vertices) * short_side
+        np_points = np.stack(
+            [center_x + radiuses * np.cos(thetas), center_y + radiuses * np.sin(thetas)],
+            axis=-1,
+        )
+        cv.fillPoly(
+            shadow_mask,
+            [np.round(np_points * scale).astype(np.int32)],
+            1.0,
+            cv.LINE_AA,
+            shift=shift,
+        )
+
+    sigma = config.shadow_softness * short_side
+    if sigma > 0:
+        shadow_mask = cv.GaussianBlur(shadow_mask, (0, 0), sigmaX=sigma)
+    return 1 - config.shadow_strength * shadow_mask
+
+
+def generate_illumination_field(
+    config: IlluminationConfig,
+    shape: Tuple[int, int],
+    rnd: np.random.RandomState,
+):
+    # The multiplicative field on the coarse grid.
+    field_shape = get_field_shape(config, shape)
+    field = np.ones(field_shape, dtype=np.float32)
+    if config.polynomial_strength > 0:
+        field *= generate_polynomial_field(config, field_shape, rnd)
+    if config.vignette_strength > 0:
+        field *= generate_vignette_field(config, field_shape, rnd)
+    if config.num_shadows > 0:
+        field *= generate_shadow_field(config, field_shape, rnd)
+    return field
+
+
+def illumination_image(config, image, rnd):
+    field = generate_illumination_field(config, image.shape, rnd)
+    if image.mat.ndim == 3:
+        # Upsample the field with channels, cheaper than merging in full resolution.
+        field = cv.merge([field] * image.mat.shape[2])
+    field = cv.resize(field, (image.width, image.height), interpolation=cv.INTER_LINEAR)
+    # Multiply and saturate in one pass.
+    mat = cv.multiply(image.mat, field, dtype=cv.CV_8U)
+    return attr.evolve(image, mat=mat)
+
+
+illumination = PhotometricDistortion(IlluminationConfig, illumination_image)
+
+
+def debug():
+    from vkit.opt import get_data_folder
+    folder = get_data_folder(__file__)
+
+    rnd = np.random.RandomState(13370)
+
+    image = VImage.from_file(f'{folder}/Lenna.png')
+
+    config = IlluminationConfig(polynomial_strength=0.4)
+    illumination.distort_image(config, image, rnd).to_file(f'{folder}/illumination_poly.png')
+
+    config = IlluminationConfig(vignette_strength=0.6)
+    illumination.distort_image(config, image, rnd).to_file(f'{folder}/illumination_vignette.png')
+
+    config = IlluminationConfig(num_shadows=2, shadow_strength=0.5)
+    illumination.distort_image(config, image, rnd).to_file(f'{folder}/illumination_shadow.png')
@@ -1,17 +1,56 @@
-from typing import Callable, Generic, Type, Union, Tuple, Optional
+from typing import Callable, Generic, Type, Union, Tuple, Optional, Sequence, Any
+import attr
 import numpy as np
-from vkit.image.type import VImage
+from vkit.image.type import VImage, VImageKind
+from vkit.label.type import VBox, VImageMask
 from vkit.augmentation.opt import (
     T_CONFIG,
     handle_config_and_rnd,
 )
+from .opt import (
+    apply_lut_to_mat,
+    compose_luts,
+    call_func_with_kind,
+    distort_batch_mat_per_sample,
+    generate_boxes_from_image_mask,
+)
 
 
 class PhotometricDistortion(Generic[T_CONFIG]):
 
-    def __init__(self, config_cls: Type[T_CONFIG], func: Callable[..., VImage]):
+    def __init__(
+        self,
+        config_cls: Type[T_CONFIG],
+        func: Callable[..., VImage],
+        func_mat: Optional[Callable[..., None]] = None,
+        func_lut: Optional[Callable[..., np.ndarray]] = None,
+        func_lut_requires_mat: bool = False,
+        func_batch_mat: Optional[Callable[..., None]] = None,
+        func_create_band_mat_distorter: Optional[Callable[..., Callable[[np.ndarray, int],
+                                                                        None]]] = None,
+    ):
         self.config_cls = config_cls
         self.func = func
+        # Optional, distort the float32 working buffer of PhotometricPipeline in place.
+        # The values should be valid to be clipped and truncated to uint8 afterward.
+        # For func_mat, func_lut and func_batch_mat, the image kind is passed as the kind
+        # parameter, if declared.
+        self.func_mat = func_mat
+        # Optional, for op that maps each uint8 value independently, generate the LUT
+        # (see generate_identity_lut) for the mat, or None if not LUT-able (e.g. depends on the
+        # image kind). Consecutive LUTs are folded by PhotometricPipeline. If
+        # func_lut_requires_mat is False, only the shape of the mat is inspected, hence the pending
+        # LUTs are not applied in advance.
+        self.func_lut = func_lut
+        self.func_lut_requires_mat = func_lut_requires_mat
+        # Optional, distort the float32 batch buffer of distort_images in place, given the
+        # per-sample configs and rnds. If not provided, func_mat is called per sample.
+        self.func_batch_mat = func_batch_mat
+        # Optional, for distort_image_in_bands, given the config, the uint8 mat and rnd, create
+        # a callable that distorts the float32 buffer of the next row band in place, given the
+        # band and its first row. Bands are passed from top to bottom. If not provided, func is
+        # called, which is fine for op that only allocates the output (e.g. LUT based).
+        self.func_create_band_mat_distorter = func_create_band_mat_distorter
 
     def __repr__(self):
         return self.func.__name__
@@ -23,7 +62,19 @@ class PhotometricDistortion(Generic[T_CONFIG]):
                                                    T_CONFIG]],
         image: VImage,
         rnd: Optional[np.random.RandomState] = None,
+        image_mask: Optional[VImageMask] = None,
+        boxes: Optional[Sequence[VBox]] = None,
     ):
+        '''
+        If image_mask or boxes is provided, only the regions are distorted and the rest of the
+        image is kept. Each region is distorted as a crop, hence the cost scales with the region
+        area, and the region statistics (e.g. the mean of std_shift) are local. If only
+        image_mask is provided, the regions are the bounding boxes of the runs of masked rows.
+        Boxes are clipped to the image, and the overlapped area is taken from the last box.
+        '''
+        if image_mask is not None:
+            assert image_mask.shape == image.shape
+
         config, rnd = handle_config_and_rnd(
             self.config_cls,
             config_or_config_generator,
@@ -38,4 +89,238 @@ class PhotometricDistortion(Generic[T_CONFIG]):
         if rnd:
             kwargs['rnd'] = rnd
 
-        return self.func(**kwargs)
+        if image_mask is None and boxes is None:
+            return self.func(**kwargs)
+
+        if boxes is None:
+            assert image_mask
+            boxes = generate_boxes_from_image_mask(image_mask)
+
+        mat = image.mat.copy()
+        for box in boxes:
+            if box.down < 0 or box.up >= image.height or box.right < 0 or box.left >= image.width:
+                # Outside of the image.
+                continue
+            box = box.to_clipped_box(image)
+            kwargs['image'] = box.extract_image(image)
+            region_mat = self.func(**kwargs).mat
+
+            dst_region_mat = mat[box.up:box.down + 1, box.left:box.right + 1]
+            if image_mask is None:
+                dst_region_mat[:] = region_mat
+            else:
+                region_mask = image_mask.mat[box.up:box.down + 1, box.left:box.right + 1] > 0
+                if dst_region_mat.ndim == 3:
+                    region_mask = region_mask[:, :, None]
+                np.copyto(dst_region_mat, region_mat, where=region_mask)
+
+        return attr.evolve(image, mat=mat)
+
+    def distort_image_in_bands(
+        self,
+        config_or_config_generator: Union[T_CONFIG,
+                                          Callable[[Tuple[int, int], np.random.RandomState],
+                                                   T_CONFIG]],
+        image: VImage,
+        rnd: Optional[np.random.RandomState] = None,
+        max_band_num_bytes: int = 2**26,
+    ):
+        '''
+        Same as distort_image, but the image is processed in row bands to bound the temporary
+        memory, e.g. for large scans. The float32 buffer of a band is limited to
+        max_band_num_bytes.
+        '''
+        config, rnd = handle_config_and_rnd(
+            self.config_cls,
+            config_or_config_generator,
+            image.shape,
+            rnd,
+        )
+
+        if not self.func_create_band_mat_distorter:
+            return self.distort_image(config, image, rnd)
+
+        kwargs = {
+            'config': config,
+            'mat': image.mat,
+        }
+        if rnd:
+            kwargs['rnd'] = rnd
+        distort_band_mat = call_func_with_kind(
+            self.func_create_band_mat_distorter,
+            image.kind,
+            **kwargs,
+        )
+
+        height = image.height
+        row_num_bytes = image.mat[0].size * np.dtype(np.float32).itemsize
+        band_height = min(height, max(1, max_band_num_bytes // row_num_bytes))
+        band_buffer = np.empty((band_height, *image.mat.shape[1:]), dtype=np.float32)
+
+        mat = np.empty_like(image.mat)
+        for row_begin in range(0, height, band_height):
+            row_end = min(height, row_begin + band_height)
+            band_mat = band_buffer[:row_end - row_begin]
+            band_mat[:] = image.mat[row_begin:row_end]
+            distort_band_mat(band_mat, row_begin)
+            np.clip(band_mat, 0, 255, out=band_mat)
+            # Truncated as astype.
+            mat[row_begin:row_end] = band_mat
+
+        return attr.evolve(image, mat=mat)
+
+    def distort_images(
+        self,
+        configs_or_config_generators: Sequence[Any],
+        batch_mat: np.ndarray,
+        rnd: Optional[np.random.RandomState] = None,
+        kind: Optional[VImageKind] = None,
+    ):
+        '''
+        Distort a batch of images of the same shape, batch_mat should be a (N, H, W, C) or
+        (N, H, W) uint8 array. If kind is not provided, it is inferred as VImage. Returns a new
+        batch array.
+        '''
+        assert batch_mat.dtype == np.uint8
+        assert len(configs_or_config_generators) == batch_mat.shape[0]
+        shape = batch_mat.shape[1:3]
+        if kind is None:
+            kind = VImage(mat=batch_mat[0]).kind
+
+        configs = []
+        rnds = []
+        for config_or_config_generator in configs_or_config_generators:
+            config, op_rnd = handle_config_and_rnd(
+                self.config_cls,
+                config_or_config_generator,
+                shape,
+                rnd,
+            )
+            configs.append(config)
+            rnds.append(op_rnd)
+
+        if not self.func_mat and not self.func_batch_mat:
+            # Fallback.
+            return np.stack([
+                self.distort_image(config, VImage(mat=mat, kind=kind), op_rnd).mat
+                for config, mat, op_rnd in zip(configs, batch_mat, rnds)
+            ])
+
+        mat = batch_mat.astype(np.float32)
+        if self.func_batch_mat:
+            call_func_with_kind(
+                self.func_batch_mat,
+                kind,
+                configs=configs,
+                mat=mat,
+                rnds=rnds,
+            )
+        else:
+            assert self.func_mat
+            distort_batch_mat_per_sample(self.func_mat, configs, mat, rnds, kind)
+
+        np.clip(mat, 0, 255, out=mat)
+        return mat.astype(np.uint8)
+
+
+class PhotometricPipeline:
+
+    def __init__(self, photometric_distortions: Sequence[PhotometricDistortion]):
+        self.photometric_distortions = photometric_distortions
+
+    def __repr__(self):
+        return ' -> '.join(map(repr, self.photometric_distortions))
+
+    def distort_image(
+        self,
+        configs_or_config_generators: Sequence[Any],
+        image: VImage,
+        rnd: Optional[np.random.RandomState] = None,
+    ):
+        '''
+        Same as calling distort_image of each photometric distortion sequentially, but the image is
+        converted to a float32 working buffer only once, and each op distorts the buffer in place.
+        Consecutive LUT-able ops are folded into a single LUT.
+        '''
+        assert len(configs_or_config_generators) == len(self.photometric_distortions)
+
+        # At most one of mat and lut is pending.
+        kind = image.kind
+        mat_uint8 = image.mat
+        mat = None
+        lut = None
+
+        for photometric_distortion, config_or_config_generator in zip(
+            self.photometric_distortions,
+            configs_or_config_generators,
+        ):
+            config, op_rnd = handle_config_and_rnd(
+                photometric_distortion.config_cls,
+                config_or_config_generator,
+                image.shape,
+                rnd,
+            )
+
+            if photometric_distortion.func_lut:
+                if photometric_distortion.func_lut_requires_mat:
+                    if mat is not None:
+                        # Exact since the buffer is clipped and truncated.
+                        mat_uint8 = mat.astype(np.uint8)
+                        mat = None
+                    if lut is not None:
+                        mat_uint8 = apply_lut_to_mat(mat_uint8, lut)
+                        lut = None
+
+                kwargs = {
+                    'config': config,
+                    'mat': mat_uint8,
+                }
+                if op_rnd:
+                    kwargs['rnd'] = op_rnd
+                op_lut = call_func_with_kind(photometric_distortion.func_lut, kind, **kwargs)
+
+                if op_lut is not None:
+                    if mat is not None:
+                        mat_uint8 = mat.astype(np.uint8)
+                        mat = None
+                    lut = op_lut if lut is None else compose_luts(lut, op_lut)
+                    continue
+
+            if lut is not None:
+                mat_uint8 = apply_lut_to_mat(mat_uint8, lut)
+                lut = None
+
+            if not photometric_distortion.func_mat:
+                # Fallback.
+                if mat is not None:
+                    mat_uint8 = mat.astype(np.uint8)
+                    mat = None
+                image = photometric_distortion.distort_image(
+                    config,
+                    VImage(mat=mat_uint8, kind=kind),
+                    op_rnd,
+                )
+                kind = image.kind
+                mat_uint8 = image.mat
+                continue
+
+            if mat is None:
+                mat = mat_uint8.astype(np.float32)
+
+            kwargs = {
+                'config': config,
+                'mat': mat,
+            }
+            if op_rnd:
+                kwargs['rnd'] = op_rnd
+            call_func_with_kind(photometric_distortion.func_mat, kind, **kwargs)
+
+            # As if the image is converted back to uint8 after each op, without allocation.
+            np.clip(mat, 0, 255, out=mat)
+            np.trunc(mat, out=mat)
+
+        if mat is not None:
+            mat_uint8 = mat.astype(np.uint8)
+        if lut is not None:
+            mat_uint8 = apply_lut_to_mat(mat_uint8, lut)
+        return VImage(mat=mat_uint8, kind=kind)
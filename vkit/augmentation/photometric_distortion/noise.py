@@ -1,41 +1,168 @@
-from typing import Any
+from typing import Any, Optional
 
 import attr
 import numpy as np
 
 from vkit.image.type import VImage
-from .opt import extract_mat_from_image, clip_mat_back_to_uint8
+from .opt import (
+    extract_mat_from_image,
+    clip_mat_back_to_uint8,
+    create_generator_from_rnd,
+    create_generators_from_rnd,
+    get_float32_buffer,
+    to_batch_values,
+    distort_batch_mat_per_sample,
+)
 from .interface import PhotometricDistortion
+from .noise_bank import NoiseBank, generate_blotch_noise
 
 
 @attr.define
 class GaussionNoiseConfig:
     std: float
+    # If set, sample from the precomputed noise textures instead.
+    noise_bank: Optional[NoiseBank] = None
     rnd_state: Any = None
 
 
+def _gaussion_noise_mat_by_generator(config, mat, generator):
+    noise = get_float32_buffer(0, mat.shape)
+    generator.standard_normal(dtype=np.float32, out=noise)
+    noise *= config.std
+    np.round(noise, out=noise)
+    mat += noise
+
+
+def _gaussion_noise_mat_by_unit_noise(config, mat, unit_noise):
+    noise = get_float32_buffer(0, mat.shape)
+    np.copyto(noise, unit_noise)
+    noise *= config.std
+    np.round(noise, out=noise)
+    mat += noise
+
+
+def gaussion_noise_mat(config, mat, rnd):
+    if config.noise_bank:
+        unit_noise = NoiseBank.sample_noise(
+            config.noise_bank.get_normal_textures(),
+            mat.shape,
+            rnd,
+        )
+        _gaussion_noise_mat_by_unit_noise(config, mat, unit_noise)
+        return
+
+    _gaussion_noise_mat_by_generator(config, mat, create_generator_from_rnd(rnd))
+
+
+def gaussion_noise_create_band_mat_distorter(config, mat, rnd):
+    if config.noise_bank:
+        unit_noise = NoiseBank.sample_noise(
+            config.noise_bank.get_normal_textures(),
+            mat.shape,
+            rnd,
+        )
+
+        def distort_band_mat_by_noise_bank(band_mat, row_begin):
+            _gaussion_noise_mat_by_unit_noise(
+                config,
+                band_mat,
+                unit_noise[row_begin:row_begin + band_mat.shape[0]],
+            )
+
+        return distort_band_mat_by_noise_bank
+
+    # The samples are drawn sequentially, hence identical to the full-frame path.
+    generator = create_generator_from_rnd(rnd)
+
+    def distort_band_mat(band_mat, row_begin):
+        _gaussion_noise_mat_by_generator(config, band_mat, generator)
+
+    return distort_band_mat
+
+
+def gaussion_noise_batch_mat(configs, mat, rnds):
+    if any(config.noise_bank for config in configs):
+        distort_batch_mat_per_sample(gaussion_noise_mat, configs, mat, rnds)
+        return
+
+    noise = get_float32_buffer(0, mat.shape)
+    for idx, rnd in enumerate(rnds):
+        generator = create_generator_from_rnd(rnd)
+        generator.standard_normal(dtype=np.float32, out=noise[idx])
+    noise *= to_batch_values([config.std for config in configs], mat)
+    np.round(noise, out=noise)
+    mat += noise
+
+
 def gaussion_noise_image(config, image, rnd):
-    mat = extract_mat_from_image(image, np.int16)
-    noise = np.round(rnd.normal(0, config.std, mat.shape)).astype(np.int16)
-    mat = clip_mat_back_to_uint8(mat + noise)
-    return VImage(mat=mat)
+    mat = extract_mat_from_image(image, np.float32)
+    gaussion_noise_mat(config, mat, rnd)
+    mat = clip_mat_back_to_uint8(mat)
+    return attr.evolve(image, mat=mat)
 
 
-gaussion_noise = PhotometricDistortion(GaussionNoiseConfig, gaussion_noise_image)
+gaussion_noise = PhotometricDistortion(
+    GaussionNoiseConfig,
+    gaussion_noise_image,
+    gaussion_noise_mat,
+    func_batch_mat=gaussion_noise_batch_mat,
+    func_create_band_mat_distorter=gaussion_noise_create_band_mat_distorter,
+)
 
 
 @attr.define
 class PoissonNoiseConfig:
+    # For lambda >= this threshold, approximate Poisson(lambda) by N(lambda, lambda).
+    gaussian_approximation_threshold: float = 20.0
     rnd_state: Any = None
 
 
+def _poisson_noise_mat_by_generators(config, mat, normal_generator, poisson_generator):
+    # Exact sampling for small lambda.
+    small_lambda_mask = mat < config.gaussian_approximation_threshold
+    small_lambdas = mat[small_lambda_mask]
+
+    # lambda + sqrt(lambda) * z, rounded.
+    noise = get_float32_buffer(0, mat.shape)
+    normal_generator.standard_normal(dtype=np.float32, out=noise)
+    std = get_float32_buffer(1, mat.shape)
+    np.sqrt(mat, out=std)
+    noise *= std
+    np.round(noise, out=noise)
+    mat += noise
+
+    if small_lambdas.size > 0:
+        mat[small_lambda_mask] = poisson_generator.poisson(small_lambdas)
+
+
+def poisson_noise_mat(config, mat, rnd):
+    # Separated streams, so that the band path is identical to the full-frame path.
+    normal_generator, poisson_generator = create_generators_from_rnd(rnd, 2)
+    _poisson_noise_mat_by_generators(config, mat, normal_generator, poisson_generator)
+
+
+def poisson_noise_create_band_mat_distorter(config, mat, rnd):
+    normal_generator, poisson_generator = create_generators_from_rnd(rnd, 2)
+
+    def distort_band_mat(band_mat, row_begin):
+        _poisson_noise_mat_by_generators(config, band_mat, normal_generator, poisson_generator)
+
+    return distort_band_mat
+
+
 def poisson_noise_image(config, image, rnd):
-    mat = rnd.poisson(extract_mat_from_image(image, np.float32))
+    mat = extract_mat_from_image(image, np.float32)
+    poisson_noise_mat(config, mat, rnd)
     mat = clip_mat_back_to_uint8(mat)
-    return VImage(mat=mat)
+    return attr.evolve(image, mat=mat)
 
 
-poisson_noise = PhotometricDistortion(PoissonNoiseConfig, poisson_noise_image)
+poisson_noise = PhotometricDistortion(
+    PoissonNoiseConfig,
+    poisson_noise_image,
+    poisson_noise_mat,
+    func_create_band_mat_distorter=poisson_noise_create_band_mat_distorter,
+)
 
 
 @attr.define
@@ -45,42 +172,257 @@ class ImpulseNoiseConfig:
     rnd_state: Any = None
 
 
-def impulse_noise_image(config, image, rnd):
-    # https://www.programmersought.com/article/3363136769/
-    prob_presv = 1 - config.prob_salt - config.prob_pepper
+def _use_dense_impulse_noise(config):
+    # Sampling the corrupted pixels costs more than a dense pass if many pixels are corrupted.
+    return config.prob_salt + config.prob_pepper > 0.05
 
-    mask = rnd.choice(
-        (0, 1, 2),
-        size=image.shape,
-        p=[prob_presv, config.prob_salt, config.prob_pepper],
-    )
 
-    mat = image.mat.copy()
+def _impulse_noise_mat_dense(config, mat, generator):
+    samples = get_float32_buffer(0, mat.shape[:2])
+    generator.random(dtype=np.float32, out=samples)
     # Salt.
-    mat[mask == 1] = 255
+    mat[samples < config.prob_salt] = 255
     # Pepper.
-    mat[mask == 2] = 0
+    mat[(samples >= config.prob_salt) & (samples < config.prob_salt + config.prob_pepper)] = 0
+
+
+def _sample_distinct_indices(num_indices, size, generator):
+    # Generator.choice(replace=False) permutes all the indices if size > num_indices / 50. Instead,
+    # draw with replacement and drop the duplicates, which costs O(size log size). The result is
+    # still uniform since every set of the same size is equally likely to be drawn.
+    indices = np.unique(generator.integers(0, num_indices, size=size + size // 8 + 16))
+    while indices.size < size:
+        indices = np.union1d(
+            indices,
+            generator.integers(0, num_indices, size=size - indices.size + 16),
+        )
+    # Shuffled before truncating, since np.unique sorts.
+    return generator.permutation(indices)[:size]
+
+
+def _sample_impulse_noise_pixels(config, shape, generator):
+    # Each pixel is preserved, salted or peppered independently, hence the numbers of the
+    # corrupted pixels follow the multinomial distribution and the corrupted pixels are
+    # distinct. The cost scales with the number of the corrupted pixels.
+    height, width = shape
+    num_pixels = height * width
+    num_salt, num_pepper, _ = generator.multinomial(
+        num_pixels,
+        [config.prob_salt, config.prob_pepper, 1 - config.prob_salt - config.prob_pepper],
+    )
+    indices = _sample_distinct_indices(num_pixels, num_salt + num_pepper, generator)
+    ys, xs = np.divmod(indices, width)
+    values = np.zeros(ys.shape, dtype=np.uint8)
+    values[:num_salt] = 255
+    return ys, xs, values
 
-    return VImage(mat=mat)
 
+def _broadcast_impulse_noise_values(values, mat):
+    return values.reshape((-1,) + (1,) * (mat.ndim - 2))
 
-impulse_noise = PhotometricDistortion(ImpulseNoiseConfig, impulse_noise_image)
+
+def impulse_noise_mat(config, mat, rnd):
+    # https://www.programmersought.com/article/3363136769/
+    generator = create_generator_from_rnd(rnd)
+    if _use_dense_impulse_noise(config):
+        _impulse_noise_mat_dense(config, mat, generator)
+        return
+
+    ys, xs, values = _sample_impulse_noise_pixels(config, mat.shape[:2], generator)
+    mat[ys, xs] = _broadcast_impulse_noise_values(values, mat)
+
+
+def impulse_noise_create_band_mat_distorter(config, mat, rnd):
+    generator = create_generator_from_rnd(rnd)
+    if _use_dense_impulse_noise(config):
+
+        def distort_band_mat_dense(band_mat, row_begin):
+            _impulse_noise_mat_dense(config, band_mat, generator)
+
+        return distort_band_mat_dense
+
+    ys, xs, values = _sample_impulse_noise_pixels(config, mat.shape[:2], generator)
+    sorted_indices = np.argsort(ys, kind='stable')
+    ys = ys[sorted_indices]
+    xs = xs[sorted_indices]
+    values = values[sorted_indices]
+
+    def distort_band_mat(band_mat, row_begin):
+        begin, end = np.searchsorted(ys, [row_begin, row_begin + band_mat.shape[0]])
+        band_mat[ys[begin:end] - row_begin, xs[begin:end]] = \
+            _broadcast_impulse_noise_values(values[begin:end], band_mat)
+
+    return distort_band_mat
+
+
+def impulse_noise_image(config, image, rnd):
+    mat = image.mat.copy()
+    impulse_noise_mat(config, mat, rnd)
+    return attr.evolve(image, mat=mat)
+
+
+impulse_noise = PhotometricDistortion(
+    ImpulseNoiseConfig,
+    impulse_noise_image,
+    impulse_noise_mat,
+    func_create_band_mat_distorter=impulse_noise_create_band_mat_distorter,
+)
 
 
 @attr.define
 class SpeckleNoiseConfig:
     std: float
+    # If set, sample from the precomputed noise textures instead.
+    noise_bank: Optional[NoiseBank] = None
     rnd_state: Any = None
 
 
+def _speckle_noise_mat_by_generator(config, mat, generator):
+    noise = get_float32_buffer(0, mat.shape)
+    generator.standard_normal(dtype=np.float32, out=noise)
+    noise *= config.std
+    noise *= mat
+    mat += noise
+
+
+def _speckle_noise_mat_by_unit_noise(config, mat, unit_noise):
+    noise = get_float32_buffer(0, mat.shape)
+    np.copyto(noise, unit_noise)
+    noise *= config.std
+    noise *= mat
+    mat += noise
+
+
+def speckle_noise_mat(config, mat, rnd):
+    if config.noise_bank:
+        unit_noise = NoiseBank.sample_noise(
+            config.noise_bank.get_normal_textures(),
+            mat.shape,
+            rnd,
+        )
+        _speckle_noise_mat_by_unit_noise(config, mat, unit_noise)
+        return
+
+    _speckle_noise_mat_by_generator(config, mat, create_generator_from_rnd(rnd))
+
+
+def speckle_noise_create_band_mat_distorter(config, mat, rnd):
+    if config.noise_bank:
+        unit_noise = NoiseBank.sample_noise(
+            config.noise_bank.get_normal_textures(),
+            mat.shape,
+            rnd,
+        )
+
+        def distort_band_mat_by_noise_bank(band_mat, row_begin):
+            _speckle_noise_mat_by_unit_noise(
+                config,
+                band_mat,
+                unit_noise[row_begin:row_begin + band_mat.shape[0]],
+            )
+
+        return distort_band_mat_by_noise_bank
+
+    generator = create_generator_from_rnd(rnd)
+
+    def distort_band_mat(band_mat, row_begin):
+        _speckle_noise_mat_by_generator(config, band_mat, generator)
+
+    return distort_band_mat
+
+
+def speckle_noise_batch_mat(configs, mat, rnds):
+    if any(config.noise_bank for config in configs):
+        distort_batch_mat_per_sample(speckle_noise_mat, configs, mat, rnds)
+        return
+
+    noise = get_float32_buffer(0, mat.shape)
+    for idx, rnd in enumerate(rnds):
+        generator = create_generator_from_rnd(rnd)
+        generator.standard_normal(dtype=np.float32, out=noise[idx])
+    noise *= to_batch_values([config.std for config in configs], mat)
+    noise *= mat
+    mat += noise
+
+
 def speckle_noise_image(config, image, rnd):
     mat = extract_mat_from_image(image, np.float32)
-    noise = rnd.normal(0, config.std, mat.shape)
-    mat = clip_mat_back_to_uint8(mat + mat * noise)
-    return VImage(mat=mat)
+    speckle_noise_mat(config, mat, rnd)
+    mat = clip_mat_back_to_uint8(mat)
+    return attr.evolve(image, mat=mat)
 
 
-speckle_noise = PhotometricDistortion(SpeckleNoiseConfig, speckle_noise_image)
+speckle_noise = PhotometricDistortion(
+    SpeckleNoiseConfig,
+    speckle_noise_image,
+    speckle_noise_mat,
+    func_batch_mat=speckle_noise_batch_mat,
+    func_create_band_mat_distorter=speckle_noise_create_band_mat_distorter,
+)
+
+
+@attr.define
+class BlotchNoiseConfig:
+    # Paper texture like low frequency noise, shared by all channels.
+    std: float
+    # The rough size of a blotch, in pixels.
+    blotch_size: int
+    # If set, sample from the precomputed noise textures instead.
+    noise_bank: Optional[NoiseBank] = None
+    rnd_state: Any = None
+
+
+def _generate_blotch_noise_map(config, shape, rnd):
+    if config.noise_bank:
+        unit_noise = NoiseBank.sample_noise(
+            config.noise_bank.get_blotch_textures(config.blotch_size),
+            shape,
+            rnd,
+        )
+        noise = unit_noise.astype(np.float32)
+        noise *= config.std
+        return noise
+    else:
+        generator = create_generator_from_rnd(rnd)
+        noise = generate_blotch_noise(shape, config.blotch_size, generator)
+        noise *= config.std
+        return noise
+
+
+def _blotch_noise_mat_by_noise_map(mat, noise):
+    if mat.ndim == 3:
+        noise = noise[:, :, None]
+    mat += noise
+
+
+def blotch_noise_mat(config, mat, rnd):
+    _blotch_noise_mat_by_noise_map(mat, _generate_blotch_noise_map(config, mat.shape[:2], rnd))
+
+
+def blotch_noise_create_band_mat_distorter(config, mat, rnd):
+    # NOTE: the single-channel noise map is normalized globally, hence kept in full.
+    noise = _generate_blotch_noise_map(config, mat.shape[:2], rnd)
+
+    def distort_band_mat(band_mat, row_begin):
+        band_noise = noise[row_begin:row_begin + band_mat.shape[0]]
+        _blotch_noise_mat_by_noise_map(band_mat, band_noise)
+
+    return distort_band_mat
+
+
+def blotch_noise_image(config, image, rnd):
+    mat = extract_mat_from_image(image, np.float32)
+    blotch_noise_mat(config, mat, rnd)
+    mat = clip_mat_back_to_uint8(mat)
+    return attr.evolve(image, mat=mat)
+
+
+blotch_noise = PhotometricDistortion(
+    BlotchNoiseConfig,
+    blotch_noise_image,
+    blotch_noise_mat,
+    func_create_band_mat_distorter=blotch_noise_create_band_mat_distorter,
+)
 
 
 def debug():
@@ -102,3 +444,15 @@ def debug():
 
     config = SpeckleNoiseConfig(std=0.25)
     speckle_noise.distort_image(config, image, rnd).to_file(f'{folder}/speckle.png')
+
+    config = BlotchNoiseConfig(std=20, blotch_size=32)
+    blotch_noise.distort_image(config, image, rnd).to_file(f'{folder}/blotch.png')
+
+    noise_bank = NoiseBank()
+    for idx in range(3):
+        config = GaussionNoiseConfig(std=50, noise_bank=noise_bank)
+        result = gaussion_noise.distort_image(config, image, rnd)
+        result.to_file(f'{folder}/gaussion-bank-{idx}.png')
+        config = BlotchNoiseConfig(std=20, blotch_size=32, noise_bank=noise_bank)
+        result = blotch_noise.distort_image(config, image, rnd)
+        result.to_file(f'{folder}/blotch-bank-{idx}.png')
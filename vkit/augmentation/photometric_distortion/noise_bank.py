@@ -0,0 +1,169 @@
+from typing import Callable, List, OrderedDict, Sequence, Tuple, Hashable
+import collections
+import math
+import zlib
+
+import numpy as np
+import cv2 as cv
+
+
+def generate_blotch_noise(
+    shape: Tuple[int, int],
+    blotch_size: int,
+    generator: np.random.Generator,
+):
+    # Low frequency noise with zero mean and unit std, by upsampling the coarse white noise.
+    height, width = shape
+    coarse_height = max(2, math.ceil(height / blotch_size) + 1)
+    coarse_width = max(2, math.ceil(width / blotch_size) + 1)
+    coarse_noise = generator.standard_normal((coarse_height, coarse_width), dtype=np.float32)
+    noise = cv.resize(coarse_noise, (width, height), interpolation=cv.INTER_CUBIC)
+
+    noise -= noise.mean()
+    std = noise.std()
+    if std > 0:
+        noise /= std
+    return noise
+
+
+def generate_tileable_blotch_noise(
+    shape: Tuple[int, int],
+    blotch_size: int,
+    generator: np.random.Generator,
+):
+    # Same as generate_blotch_noise, but periodic, hence tiling the texture leaves no seam.
+    # The coarse noise is wrapped around and upsampled by the integer blotch_size, hence the
+    # returned shape is rounded up to the multiple of blotch_size.
+    height, width = shape
+    coarse_height = max(2, math.ceil(height / blotch_size))
+    coarse_width = max(2, math.ceil(width / blotch_size))
+    coarse_noise = generator.standard_normal((coarse_height, coarse_width), dtype=np.float32)
+
+    # The support of cubic interpolation is 4 cells.
+    pad = 2
+    coarse_noise = np.pad(coarse_noise, pad, mode='wrap')
+    noise = cv.resize(
+        coarse_noise,
+        None,
+        fx=blotch_size,
+        fy=blotch_size,
+        interpolation=cv.INTER_CUBIC,
+    )
+    offset = pad * blotch_size
+    noise = noise[offset:offset + coarse_height * blotch_size,
+                  offset:offset + coarse_width * blotch_size]
+
+    noise -= noise.mean()
+    std = noise.std()
+    if std > 0:
+        noise /= std
+    return noise
+
+
+class NoiseBank:
+    '''
+    Precomputed float16 noise textures with unit std, shared across samples. The textures are
+    periodic. Each sample takes a random window (tiled if the texture is too small) of a random
+    texture with random flipping and 90 degree rotation, hence the per-sample cost is independent
+    of the noise generation. The noise level (e.g. std) is applied per sample, hence the textures
+    are kept per noise type only, and at most max_num_keys types are kept.
+    '''
+
+    def __init__(
+        self,
+        texture_height: int = 1024,
+        texture_width: int = 3072,
+        num_textures: int = 4,
+        seed: int = 0,
+        max_num_keys: int = 8,
+    ):
+        # For multi-channel mat, the channels are interleaved in a texture row, hence the default
+        # texture width covers a 1024x1024 RGB image without wrapping.
+        self.texture_height = texture_height
+        self.texture_width = texture_width
+        self.num_textures = num_textures
+        self.seed = seed
+        self.max_num_keys = max_num_keys
+        # In LRU order.
+        self.key_to_textures: OrderedDict[Hashable, List[np.ndarray]] = collections.OrderedDict()
+
+    def get_textures(
+        self,
+        key: Hashable,
+        func_generate: Callable[[Tuple[int, int], np.random.Generator], np.ndarray],
+    ):
+        textures = self.key_to_textures.get(key)
+        if textures is None:
+            # Stable across processes, unlike hash().
+            generator = np.random.default_rng([self.seed, zlib.crc32(repr(key).encode())])
+            shape = (self.texture_height, self.texture_width)
+            textures = [
+                func_generate(shape, generator).astype(np.float16)
+                for _ in range(self.num_textures)
+            ]
+            self.key_to_textures[key] = textures
+            while len(self.key_to_textures) > self.max_num_keys:
+                self.key_to_textures.popitem(last=False)
+        else:
+            self.key_to_textures.move_to_end(key)
+        return textures
+
+    def get_normal_textures(self):
+
+        def func_generate(shape: Tuple[int, int], generator: np.random.Generator):
+            return generator.standard_normal(shape, dtype=np.float32)
+
+        return self.get_textures(('normal',), func_generate)
+
+    def get_blotch_textures(self, blotch_size: int):
+
+        def func_generate(shape: Tuple[int, int], generator: np.random.Generator):
+            return generate_tileable_blotch_noise(shape, blotch_size, generator)
+
+        return self.get_textures(('blotch', blotch_size), func_generate)
+
+    @staticmethod
+    def sample_noise(
+        textures: Sequence[np.ndarray],
+        shape: Tuple[int, ...],
+        rnd: np.random.RandomState,
+    ):
+        # Returns a float16 view of shape.
+        height, width = shape[:2]
+        num_channels = 1 if len(shape) == 2 else shape[2]
+
+        texture = textures[rnd.randint(len(textures))]
+
+        rotate = rnd.randint(2)
+        if rotate:
+            window_height, window_width = width, height
+        else:
+            window_height, window_width = height, width
+        window_cols = window_width * num_channels
+
+        texture_height, texture_width = texture.shape
+        if texture_height < window_height or texture_width < window_cols:
+            # E.g. the high resolution scans. All the textures are periodic, hence no seam.
+            texture = np.pad(
+                texture,
+                (
+                    (0, max(0, window_height - texture_height)),
+                    (0, max(0, window_cols - texture_width)),
+                ),
+                mode='wrap',
+            )
+            texture_height, texture_width = texture.shape
+
+        y = rnd.randint(texture_height - window_height + 1)
+        x = rnd.randint(texture_width - window_cols + 1)
+        noise = texture[y:y + window_height, x:x + window_cols]
+        if len(shape) == 3:
+            noise = noise.reshape(window_height, window_width, num_channels)
+
+        if rotate:
+            noise = np.rot90(noise)
+        if rnd.randint(2):
+            noise = noise[::-1]
+        if rnd.randint(2):
+            noise = noise[:, ::-1]
+        return noise
@@ -1,7 +1,13 @@
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+import inspect
+import threading
+
 import numpy as np
 import numpy.typing as npt
+import cv2 as cv
 
-from vkit.image.type import VImage
+from vkit.image.type import VImage, VImageKind
+from vkit.label.type import VBox, VImageMask
 
 
 def extract_mat_from_image(image: VImage, dtype) -> npt.NDArray:
@@ -10,3 +16,123 @@ def extract_mat_from_image(image: VImage, dtype) -> npt.NDArray:
 
 def clip_mat_back_to_uint8(mat: npt.NDArray) -> npt.NDArray:
     return np.clip(mat, 0, 255).astype(np.uint8)
+
+
+def get_mat_num_channels(mat: npt.NDArray):
+    # 0 for 2D mat, as VImage.num_channels.
+    return 0 if mat.ndim == 2 else mat.shape[2]
+
+
+def generate_identity_lut(num_channels: int) -> npt.NDArray:
+    # LUT: (256,) for 2D mat, (256, num_channels) otherwise.
+    lut = np.arange(256, dtype=np.uint8)
+    if num_channels > 0:
+        lut = np.tile(lut[:, None], (1, num_channels))
+    return lut
+
+
+def apply_lut_to_mat(mat: npt.NDArray, lut: npt.NDArray) -> npt.NDArray:
+    assert mat.dtype == np.uint8
+    if lut.ndim == 1:
+        assert mat.ndim == 2
+        return cv.LUT(mat, lut)
+
+    assert mat.ndim == 3 and mat.shape[2] == lut.shape[1]
+    # NOTE: cv.LUT expects (1, 256, num_channels) for per-channel LUT.
+    return cv.LUT(mat, lut.reshape(1, 256, -1))
+
+
+def compose_luts(lut0: npt.NDArray, lut1: npt.NDArray) -> npt.NDArray:
+    # Apply lut0 then lut1.
+    return np.take_along_axis(lut1, lut0.astype(np.intp), axis=0)
+
+
+def create_generator_from_rnd(rnd: np.random.RandomState) -> np.random.Generator:
+    # Seeded by rnd, hence still reproducible by config.rnd_state.
+    return np.random.Generator(np.random.PCG64(rnd.randint(0, 2**32, size=4, dtype=np.uint64)))
+
+
+def create_generators_from_rnd(
+    rnd: np.random.RandomState,
+    num_generators: int,
+) -> Sequence[np.random.Generator]:
+    # Independent streams.
+    seed_seq = np.random.SeedSequence(rnd.randint(0, 2**32, size=4, dtype=np.uint64))
+    return [np.random.Generator(np.random.PCG64(child)) for child in seed_seq.spawn(num_generators)]
+
+
+_thread_local = threading.local()
+
+# 32MB per buffer. Larger buffers are allocated per call, since reusing them saves little
+# compared to the work on them, and keeping them would pin the memory in every thread.
+_FLOAT32_BUFFER_MAX_CACHED_SIZE = 2**23
+
+
+def get_float32_buffer(idx: int, shape: Tuple[int, ...]) -> npt.NDArray:
+    # Scratch buffers reused across calls in the same thread, the content is undefined.
+    # Caller should not hold the buffer after returning.
+    size = int(np.prod(shape))
+    if size > _FLOAT32_BUFFER_MAX_CACHED_SIZE:
+        return np.empty(shape, dtype=np.float32)
+
+    if not hasattr(_thread_local, 'float32_buffers'):
+        _thread_local.float32_buffers = {}
+    buffers = _thread_local.float32_buffers
+
+    buffer = buffers.get(idx)
+    # Drop the buffer much larger than needed, hence the cache is bounded by the recent usage.
+    if buffer is None or buffer.size < size or buffer.size > 2 * size:
+        buffer = np.empty(size, dtype=np.float32)
+        buffers[idx] = buffer
+    return buffer[:size].reshape(shape)
+
+
+def release_float32_buffers():
+    # Release the scratch buffers of the current thread.
+    if hasattr(_thread_local, 'float32_buffers'):
+        _thread_local.float32_buffers.clear()
+
+
+def to_batch_values(values: Sequence[float], mat: npt.NDArray) -> npt.NDArray:
+    # Per-sample values broadcast along the batch axis of mat.
+    return np.asarray(values, dtype=np.float32).reshape((-1,) + (1,) * (mat.ndim - 1))
+
+
+def call_func_with_kind(func: Callable[..., Any], kind: Optional[VImageKind], **kwargs: Any):
+    # kind is passed only if func depends on it.
+    if 'kind' in inspect.signature(func).parameters:
+        kwargs['kind'] = kind
+    return func(**kwargs)
+
+
+def distort_batch_mat_per_sample(
+    func_mat: Callable[..., None],
+    configs: Sequence[Any],
+    mat: npt.NDArray,
+    rnds: Sequence[Optional[np.random.RandomState]],
+    kind: Optional[VImageKind] = None,
+):
+    for idx, (config, rnd) in enumerate(zip(configs, rnds)):
+        kwargs = {
+            'config': config,
+            'mat': mat[idx],
+        }
+        if rnd:
+            kwargs['rnd'] = rnd
+        call_func_with_kind(func_mat, kind, **kwargs)
+
+
+def generate_boxes_from_image_mask(image_mask: VImageMask) -> List[VBox]:
+    # One box for each run of consecutive rows that contain masked pixels, e.g., a text line.
+    boxes: List[VBox] = []
+    rows = np.flatnonzero(image_mask.mat.any(axis=1))
+    if rows.size == 0:
+        return boxes
+
+    split_positions = np.flatnonzero(np.diff(rows) > 1) + 1
+    for run_rows in np.split(rows, split_positions):
+        up = int(run_rows[0])
+        down = int(run_rows[-1])
+        cols = np.flatnonzero(image_mask.mat[up:down + 1].any(axis=0))
+        boxes.append(VBox(up=up, down=down, left=int(cols[0]), right=int(cols[-1])))
+    return boxes
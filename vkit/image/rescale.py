@@ -0,0 +1,42 @@
+from typing import Optional
+
+import numpy as np
+import cv2 as cv
+
+
+def rescale_mat(
+    mat: np.ndarray,
+    height: int,
+    width: int,
+    cv_resize_interpolation: Optional[int] = None,
+    cv_upscale_interpolation: int = cv.INTER_LINEAR,
+):
+    # Shared by the image, mask and score map.
+    # If cv_resize_interpolation is given, use it as is. Otherwise, for downscaling, halve the mat
+    # by INTER_AREA (2x2 average) until the remaining ratio < 2, then INTER_AREA. This is
+    # anti-aliased and faster than INTER_AREA alone for the big reductions. Note that pyrDown is
+    # not used here since it centers the output pixel i at 2 * i instead of 2 * i + 0.5, i.e.,
+    # shifted by half a pixel per level. For upscaling, use cv_upscale_interpolation.
+    if cv_resize_interpolation is not None:
+        return cv.resize(mat, (width, height), interpolation=cv_resize_interpolation)
+
+    mat_height, mat_width = mat.shape[:2]
+    if height == mat_height and width == mat_width:
+        return mat.copy()
+
+    if height <= mat_height and width <= mat_width:
+        # Halving a 1-pixel side returns 1 pixel, hence the min check.
+        while (mat.shape[0] >= 2 * height and mat.shape[1] >= 2 * width and min(mat.shape[:2]) > 1):
+            mat = cv.resize(
+                mat,
+                ((mat.shape[1] + 1) // 2, (mat.shape[0] + 1) // 2),
+                interpolation=cv.INTER_AREA,
+            )
+        return cv.resize(mat, (width, height), interpolation=cv.INTER_AREA)
+
+    elif height >= mat_height and width >= mat_width:
+        return cv.resize(mat, (width, height), interpolation=cv_upscale_interpolation)
+
+    else:
+        # Downscale one side and upscale the other.
+        return cv.resize(mat, (width, height), interpolation=cv.INTER_AREA)
@@ -1,13 +1,16 @@
 from enum import Enum, auto
-from typing import Dict, Sequence
+from typing import Dict, Optional, Sequence
+import json
+import math
 
 import attr
 import numpy as np
 import numpy.typing as npt
-from PIL import Image, ImageOps
+from PIL import Image
 import cv2 as cv
 
 from vkit.type import PathType
+from .rescale import rescale_mat
 
 
 class VImageKind(Enum):
@@ -160,10 +163,123 @@ def _to_non_gcn(image_kind: VImageKind):
     return _V_IMAGE_KIND_GCN_TO_NON_GCN[image_kind]
 
 
+class VImageDecodeBackend(Enum):
+    PIL = auto()
+    # Faster for JPEG, limited to the 8-bit grayscale, RGB and RGBA images.
+    OPENCV = auto()
+
+
+_EXIF_ORIENTATION_TAG = 0x0112
+
+_PIL_MODE_TO_CV_IMREAD_FLAGS = {
+    'L': (
+        cv.IMREAD_GRAYSCALE, {
+            2: cv.IMREAD_REDUCED_GRAYSCALE_2,
+            4: cv.IMREAD_REDUCED_GRAYSCALE_4,
+            8: cv.IMREAD_REDUCED_GRAYSCALE_8,
+        }
+    ),
+    'RGB': (
+        cv.IMREAD_COLOR, {
+            2: cv.IMREAD_REDUCED_COLOR_2,
+            4: cv.IMREAD_REDUCED_COLOR_4,
+            8: cv.IMREAD_REDUCED_COLOR_8,
+        }
+    ),
+    'RGBA': (cv.IMREAD_UNCHANGED, {}),
+}
+
+
+def _decode_mat_by_opencv(path: PathType, pil_img: Image.Image, draft_size):
+    # Returns None if not supported.
+    if pil_img.mode not in _PIL_MODE_TO_CV_IMREAD_FLAGS:
+        return None
+    cv_imread_flags, reduced_factor_to_cv_imread_flags = _PIL_MODE_TO_CV_IMREAD_FLAGS[pil_img.mode]
+
+    if draft_size and pil_img.format == 'JPEG':
+        # Pick the factor the same way as PIL draft.
+        width, height = pil_img.size
+        draft_width, draft_height = draft_size
+        max_factor = min(width // draft_width, height // draft_height)
+        for factor in (8, 4, 2):
+            if max_factor >= factor and factor in reduced_factor_to_cv_imread_flags:
+                cv_imread_flags = reduced_factor_to_cv_imread_flags[factor]
+                break
+
+    # The EXIF orientation is handled by the caller.
+    mat = cv.imread(str(path), cv_imread_flags | cv.IMREAD_IGNORE_ORIENTATION)
+    if mat is None:
+        return None
+
+    if mat.ndim == 3:
+        if mat.shape[2] == 3:
+            mat = cv.cvtColor(mat, cv.COLOR_BGR2RGB)
+        elif mat.shape[2] == 4:
+            mat = cv.cvtColor(mat, cv.COLOR_BGRA2RGBA)
+        else:
+            return None
+    if mat.dtype != np.uint8:
+        return None
+    return mat
+
+
+def _transpose_mat_by_exif_orientation(mat: np.ndarray, exif_orientation: int):
+    # Same as ImageOps.exif_transpose.
+    if exif_orientation == 2:
+        return cv.flip(mat, 1)
+    elif exif_orientation == 3:
+        return cv.rotate(mat, cv.ROTATE_180)
+    elif exif_orientation == 4:
+        return cv.flip(mat, 0)
+    elif exif_orientation == 5:
+        return np.ascontiguousarray(np.swapaxes(mat, 0, 1))
+    elif exif_orientation == 6:
+        return cv.rotate(mat, cv.ROTATE_90_CLOCKWISE)
+    elif exif_orientation == 7:
+        return np.ascontiguousarray(np.swapaxes(mat, 0, 1)[::-1, ::-1])
+    elif exif_orientation == 8:
+        return cv.rotate(mat, cv.ROTATE_90_COUNTERCLOCKWISE)
+    else:
+        return mat
+
+
+# The raw container:
+# magic (8 bytes) | header size (uint32, little endian) | header (json) | padding | mat.
+_RAW_FILE_MAGIC = b'VKITRAW\x00'
+_RAW_FILE_HEADER_SIZE_NUM_BYTES = 4
+# The mat offset is aligned for SIMD loads.
+_RAW_FILE_MAT_ALIGNMENT = 64
+
+
+def _to_readonly_mat(mat: np.ndarray):
+    # A view, hence the owner of mat is not affected.
+    mat = mat.view()
+    mat.flags.writeable = False
+    return mat
+
+
+def _v_image_on_setattr_invalidate_conversion_cache(image: 'VImage', _, value):
+    if image._kind_to_converted_image is not None:
+        image._kind_to_converted_image.clear()
+        if isinstance(value, np.ndarray):
+            value = _to_readonly_mat(value)
+    return value
+
+
 @attr.define
 class VImage:
-    mat: npt.NDArray
-    kind: VImageKind = VImageKind.NONE
+    mat: npt.NDArray = attr.ib(on_setattr=_v_image_on_setattr_invalidate_conversion_cache)
+    kind: VImageKind = attr.ib(
+        default=VImageKind.NONE,
+        on_setattr=_v_image_on_setattr_invalidate_conversion_cache,
+    )
+    # None if the conversion cache is disabled.
+    _kind_to_converted_image: Optional[Dict[VImageKind, 'VImage']] = attr.ib(
+        default=None,
+        init=False,
+        repr=False,
+        eq=False,
+    )
 
     def __attrs_post_init__(self):
         if self.kind != VImageKind.NONE:
@@ -256,11 +372,60 @@ class VImage:
 
         return VImage(mat=mat, kind=kind)
 
+    def enable_conversion_cache(self):
+        # Cache the images converted to other kinds. The mat becomes read-only so that the cache
+        # cannot be stale, and the cached images are read-only as well. Assigning mat or kind
+        # invalidates the cache.
+        if self._kind_to_converted_image is None:
+            self.mat = _to_readonly_mat(self.mat)
+            self._kind_to_converted_image = {}
+        return self
+
+    def disable_conversion_cache(self):
+        # The mat becomes writable again, unless the underlying memory is read-only (e.g. the mat
+        # is read-only before enabling the cache), in which case clone() is needed.
+        if self._kind_to_converted_image is not None:
+            self._kind_to_converted_image = None
+            try:
+                self.mat.flags.writeable = True
+            except ValueError:
+                pass
+        return self
+
     @staticmethod
     def convert_image_kind(
         image: 'VImage',
         new_kind: VImageKind,
         kind_to_cv_color_codes: Dict[VImageKind, Sequence[int]],
+        copy: bool = True,
+    ):
+        # If copy is False, the same kind conversion returns a read-only view instead of a clone,
+        # and the cached conversion is returned without copying.
+        if image._kind_to_converted_image is None:
+            return VImage._convert_image_kind(image, new_kind, kind_to_cv_color_codes, copy)
+
+        converted_image = image._kind_to_converted_image.get(new_kind)
+        if converted_image is None:
+            converted_image = VImage._convert_image_kind(
+                image,
+                new_kind,
+                kind_to_cv_color_codes,
+                copy=False,
+            )
+            converted_image.mat.flags.writeable = False
+            image._kind_to_converted_image[new_kind] = converted_image
+        if copy:
+            return converted_image.clone()
+        else:
+            # The mat is shared but not the instance.
+            return attr.evolve(converted_image)
+
+    @staticmethod
+    def _convert_image_kind(
+        image: 'VImage',
+        new_kind: VImageKind,
+        kind_to_cv_color_codes: Dict[VImageKind, Sequence[int]],
+        copy: bool,
     ):
         assert new_kind not in kind_to_cv_color_codes
 
@@ -270,7 +435,12 @@ class VImage:
             skip_clone = True
 
         if image.kind == new_kind:
-            return image if skip_clone else image.clone()
+            if skip_clone:
+                return image
+            elif copy:
+                return image.clone()
+            else:
+                return VImage(mat=_to_readonly_mat(image.mat), kind=image.kind)
 
         if image.kind in kind_to_cv_color_codes:
             new_mat = image.mat
@@ -280,7 +450,7 @@ class VImage:
         else:
             raise NotImplementedError(f'{image.kind} -> {new_kind} not supported.')
 
-    def to_grayscale_image(self):
+    def to_grayscale_image(self, copy: bool = True):
         return self.convert_image_kind(
             self,
             VImageKind.GRAYSCALE,
@@ -289,9 +459,10 @@ class VImage:
                 VImageKind.RGBA: [cv.COLOR_RGBA2GRAY],
                 VImageKind.HSV: [cv.COLOR_HSV2RGB_FULL, cv.COLOR_RGB2GRAY],
             },
+            copy,
         )
 
-    def to_rgb_image(self):
+    def to_rgb_image(self, copy: bool = True):
         return self.convert_image_kind(
             self,
             VImageKind.RGB,
@@ -300,9 +471,10 @@ class VImage:
                 VImageKind.RGBA: [cv.COLOR_RGBA2RGB],
                 VImageKind.HSV: [cv.COLOR_HSV2RGB_FULL],
             },
+            copy,
         )
 
-    def to_rgba_image(self):
+    def to_rgba_image(self, copy: bool = True):
         return self.convert_image_kind(
             self,
             VImageKind.RGBA,
@@ -311,9 +483,10 @@ class VImage:
                 VImageKind.RGB: [cv.COLOR_RGB2RGBA],
                 VImageKind.HSV: [cv.COLOR_HSV2RGB_FULL, cv.COLOR_RGB2RGBA],
             },
+            copy,
         )
 
-    def to_hsv_image(self):
+    def to_hsv_image(self, copy: bool = True):
         return self.convert_image_kind(
             self,
             VImageKind.HSV,
@@ -322,35 +495,115 @@ class VImage:
                 VImageKind.RGBA: [cv.COLOR_RGBA2RGB, cv.COLOR_RGB2HSV_FULL],
                 VImageKind.GRAYSCALE: [cv.COLOR_GRAY2RGB, cv.COLOR_RGB2HSV_FULL],
             },
+            copy,
         )
 
     def to_rescaled_image(
         self,
         height: int,
         width: int,
-        cv_resize_interpolation: int = cv.INTER_CUBIC,
+        cv_resize_interpolation: Optional[int] = None,
     ):
-        mat = cv.resize(self.mat, (width, height), cv_resize_interpolation)
+        # Defaults to pyrDown + INTER_AREA for downscaling and INTER_CUBIC for upscaling.
+        mat = rescale_mat(
+            self.mat,
+            height,
+            width,
+            cv_resize_interpolation=cv_resize_interpolation,
+            cv_upscale_interpolation=cv.INTER_CUBIC,
+        )
         return attr.evolve(self, mat=mat)
 
     @staticmethod
-    def from_file(path: PathType, disable_exif_orientation: bool = False):
+    def from_file(
+        path: PathType,
+        disable_exif_orientation: bool = False,
+        max_long_side: Optional[int] = None,
+        backend: VImageDecodeBackend = VImageDecodeBackend.PIL,
+    ):
+        # Only the header is parsed here.
         pil_img = Image.open(path)  # type: ignore
-        pil_img.load()
 
+        # https://exiftool.org/TagNames/EXIF.html
+        exif_orientation = 1
         if not disable_exif_orientation:
-            # https://exiftool.org/TagNames/EXIF.html
-            # https://github.com/python-pillow/Pillow/blob/main/src/PIL/ImageOps.py#L571
-            # Avoid unnecessary copy.
-            if pil_img.getexif().get(0x0112):
-                pil_img = ImageOps.exif_transpose(pil_img)
+            exif_orientation = pil_img.getexif().get(_EXIF_ORIENTATION_TAG) or 1
+
+        # The size to decode to, before the exact resizing.
+        draft_size = None
+        if max_long_side:
+            width, height = pil_img.size
+            ratio = max_long_side / max(height, width)
+            if ratio < 1:
+                draft_size = (math.ceil(width * ratio), math.ceil(height * ratio))
+
+        mat = None
+        if backend == VImageDecodeBackend.OPENCV:
+            mat = _decode_mat_by_opencv(path, pil_img, draft_size)
+        if mat is None:
+            if draft_size:
+                # JPEG only, DCT-domain downscaling by 1/2, 1/4 or 1/8.
+                pil_img.draft(None, draft_size)
+            pil_img.load()
+            mat = np.asarray(pil_img, dtype=np.uint8)
+
+        if draft_size and max(mat.shape[:2]) > max_long_side:  # type: ignore
+            height, width = mat.shape[:2]
+            ratio = max_long_side / max(height, width)  # type: ignore
+            mat = rescale_mat(mat, max(1, round(height * ratio)), max(1, round(width * ratio)))
+
+        if exif_orientation != 1:
+            # Cheaper than ImageOps.exif_transpose.
+            mat = _transpose_mat_by_exif_orientation(mat, exif_orientation)
+
+        return VImage(mat=mat)
+
+    def to_raw_file(self, path: PathType):
+        mat = np.ascontiguousarray(self.mat)
+        header = json.dumps({
+            'kind': self.kind.name,
+            'shape': list(mat.shape),
+            'dtype': mat.dtype.str,
+        }).encode()
+
+        prefix_size = len(_RAW_FILE_MAGIC) + _RAW_FILE_HEADER_SIZE_NUM_BYTES + len(header)
+        padding_size = -prefix_size % _RAW_FILE_MAT_ALIGNMENT
+
+        with open(path, 'wb') as fout:
+            fout.write(_RAW_FILE_MAGIC)
+            fout.write(len(header).to_bytes(_RAW_FILE_HEADER_SIZE_NUM_BYTES, 'little'))
+            fout.write(header)
+            fout.write(b'\x00' * padding_size)
+            fout.write(mat.data)
+
+    @staticmethod
+    def from_raw_file(path: PathType, mmap: bool = True):
+        with open(path, 'rb') as fin:
+            magic = fin.read(len(_RAW_FILE_MAGIC))
+            if magic != _RAW_FILE_MAGIC:
+                raise RuntimeError(f'{path} is not a raw image file.')
+            header_size = int.from_bytes(fin.read(_RAW_FILE_HEADER_SIZE_NUM_BYTES), 'little')
+            header = json.loads(fin.read(header_size))
+
+            prefix_size = len(_RAW_FILE_MAGIC) + _RAW_FILE_HEADER_SIZE_NUM_BYTES + header_size
+            offset = prefix_size + (-prefix_size % _RAW_FILE_MAT_ALIGNMENT)
+            shape = tuple(header['shape'])
+            dtype = np.dtype(header['dtype'])
+
+            if mmap:
+                # Zero-copy and shared through the page cache. Copy-on-write, hence the in-place
+                # operations don't touch the file.
+                mat = np.memmap(fin, dtype=dtype, mode='c', offset=offset, shape=shape)
+            else:
+                fin.seek(offset)
+                mat = np.fromfile(fin, dtype=dtype, count=math.prod(shape)).reshape(shape)
 
-        return VImage.from_pil_image(pil_img)
+        return VImage(mat=mat, kind=VImageKind[header['kind']])
 
     def to_file(self, path: PathType, disable_to_rgb_image: bool = False):
         image = self
         if not disable_to_rgb_image:
-            image = image.to_rgb_image()
+            image = image.to_rgb_image(copy=False)
 
         pil_img = image.to_pil_image()
         pil_img.save(path)  # type: ignore
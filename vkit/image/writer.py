@@ -0,0 +1,156 @@
+from enum import Enum, auto
+from typing import List, Optional
+from concurrent.futures import Future, ThreadPoolExecutor
+import logging
+import threading
+
+import attr
+import cv2 as cv
+
+from vkit.type import PathType
+from .type import VImage
+
+logger = logging.getLogger(__name__)
+
+
+class ImageEncodeBackend(Enum):
+    PIL = auto()
+    OPENCV = auto()
+
+
+@attr.define
+class ImageWriterConfig:
+    # Encoding releases the GIL for both backends.
+    num_workers: int = 4
+    # The number of images submitted but not yet written. write() blocks only if the workers
+    # fall behind this much, to bound the memory.
+    max_num_pending_images: int = 32
+    backend: ImageEncodeBackend = ImageEncodeBackend.PIL
+    # 0-9, the PIL default is 6, which is several times slower for little size gain.
+    png_compression_level: int = 1
+    # 0-100.
+    jpeg_quality: int = 95
+    disable_to_rgb_image: bool = False
+
+
+def _is_jpeg_path(path: PathType):
+    return str(path).lower().endswith(('.jpg', '.jpeg'))
+
+
+def _is_png_path(path: PathType):
+    return str(path).lower().endswith('.png')
+
+
+def write_image(image: VImage, path: PathType, config: ImageWriterConfig):
+    if not config.disable_to_rgb_image:
+        image = image.to_rgb_image(copy=False)
+
+    if config.backend == ImageEncodeBackend.OPENCV:
+        mat = image.mat
+        if mat.ndim == 3:
+            if mat.shape[2] == 3:
+                mat = cv.cvtColor(mat, cv.COLOR_RGB2BGR)
+            elif mat.shape[2] == 4:
+                mat = cv.cvtColor(mat, cv.COLOR_RGBA2BGRA)
+
+        params = []
+        if _is_png_path(path):
+            params = [cv.IMWRITE_PNG_COMPRESSION, config.png_compression_level]
+        elif _is_jpeg_path(path):
+            params = [cv.IMWRITE_JPEG_QUALITY, config.jpeg_quality]
+
+        ext = '.' + str(path).rsplit('.', 1)[-1]
+        success, buffer = cv.imencode(ext, mat, params)
+        if not success:
+            raise RuntimeError(f'Failed to encode {path}.')
+        with open(path, 'wb') as fout:
+            fout.write(buffer.data)
+
+    else:
+        kwargs = {}
+        if _is_png_path(path):
+            kwargs['compress_level'] = config.png_compression_level
+        elif _is_jpeg_path(path):
+            kwargs['quality'] = config.jpeg_quality
+        image.to_pil_image().save(path, **kwargs)  # type: ignore
+
+
+class ImageWriter:
+    '''
+    Writes images in background threads. The image passed to write() should not be mutated
+    afterward. flush() waits for the pending images and raises the first error if any.
+    '''
+
+    def __init__(self, config: Optional[ImageWriterConfig] = None):
+        self.config = config or ImageWriterConfig()
+        self.executor = ThreadPoolExecutor(max_workers=self.config.num_workers)
+        self.pending_semaphore = threading.BoundedSemaphore(self.config.max_num_pending_images)
+        self.futures_lock = threading.Lock()
+        self.futures: List[Future] = []
+
+    def write(self, image: VImage, path: PathType):
+        self.pending_semaphore.acquire()
+        try:
+            future = self.executor.submit(write_image, image, path, self.config)
+        except Exception:
+            self.pending_semaphore.release()
+            raise
+        future.add_done_callback(lambda _: self.pending_semaphore.release())
+
+        with self.futures_lock:
+            # Drop the finished ones without error.
+            self.futures = [
+                future for future in self.futures
+                if not future.done() or future.exception() is not None
+            ]
+            self.futures.append(future)
+        return future
+
+    def pop_exceptions(self):
+        # Wait for the pending images, returns the errors.
+        with self.futures_lock:
+            futures = self.futures
+            self.futures = []
+
+        exceptions = []
+        for future in futures:
+            exception = future.exception()
+            if exception is not None:
+                exceptions.append(exception)
+        return exceptions
+
+    def flush(self):
+        exceptions = self.pop_exceptions()
+        if exceptions:
+            raise exceptions[0]
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+            return
+
+        # Don't shadow the error raised in the with block.
+        try:
+            for exception in self.pop_exceptions():
+                logger.error('Failed to write image.', exc_info=exception)
+        finally:
+            self.executor.shutdown(wait=True)
+
+
+def debug():
+    from vkit.opt import get_data_folder
+    folder = get_data_folder(__file__)
+
+    image = VImage.from_file(f'{folder}/Lenna.png')
+    with ImageWriter(ImageWriterConfig(backend=ImageEncodeBackend.OPENCV)) as writer:
+        writer.write(image, f'{folder}/Lenna-writer.png')
+        writer.write(image.to_grayscale_image(), f'{folder}/Lenna-writer-gray.jpg')
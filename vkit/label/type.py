@@ -8,6 +8,7 @@ import numpy.typing as npt
 import cv2 as cv
 
 from vkit.image.type import VImage
+from vkit.image.rescale import rescale_mat
 
 
 def point_attr_converter(val):
@@ -325,7 +326,8 @@ class VImageMask:
         width: int,
         cv_resize_interpolation: int = cv.INTER_NEAREST_EXACT,
     ):
-        mat = cv.resize(self.mat, (width, height), cv_resize_interpolation)
+        # Not interpolated by default, since the values are labels.
+        mat = rescale_mat(self.mat, height, width, cv_resize_interpolation=cv_resize_interpolation)
         return VImageMask(mat=mat)
 
     def clone(self):
@@ -382,7 +384,8 @@ class VImageScoreMap:
         return self.height, self.width
 
     def to_rescaled_image_score_map(self, height, width):
-        mat = cv.resize(self.mat, (width, height), cv.INTER_LINEAR)
+        # Defaults to pyrDown + INTER_AREA for downscaling and INTER_LINEAR for upscaling.
+        mat = rescale_mat(self.mat, height, width)
         return VImageScoreMap(mat=mat)
 
     def clone(self):
@@ -15,6 +15,7 @@ from tqdm import tqdm
 
 from vkit.label.vatti_clipping import dilate_polygon
 from vkit.image.type import VImage
+from vkit.image.writer import ImageWriter
 
 from vkit.label.type import (
     VImageMask,
@@ -290,28 +291,36 @@ def vis_scale_samples(input_folder, output_folder, num_samples=10):
     pkl_files = list(in_fd.glob('*.pkl'))
     random.shuffle(pkl_files)
 
-    for pkl_file in pkl_files[:num_samples]:
-        scale_sample: ScaleSample = io.read_joblib(pkl_file)
-        id = pkl_file.stem
+    # Encoding and disk I/O run in the background.
+    with ImageWriter() as writer:
+        for pkl_file in pkl_files[:num_samples]:
+            scale_sample: ScaleSample = io.read_joblib(pkl_file)
+            id = pkl_file.stem
 
-        scale_sample.image.to_file(out_fd / f'{id}.png')
+            writer.write(scale_sample.image, out_fd / f'{id}.png')
 
-        polygons = [text_polygon.polygon for text_polygon in scale_sample.text_polygons]
-        visualize_polygons(
-            scale_sample.image,
-            polygons,
-        ).to_file(out_fd / f'{id}-polygon.png')
+            polygons = [text_polygon.polygon for text_polygon in scale_sample.text_polygons]
+            writer.write(
+                visualize_polygons(scale_sample.image, polygons),
+                out_fd / f'{id}-polygon.png',
+            )
 
-        image_text_scale_map = visualize_scale_image_score_map(
-            scale_sample.text_scale_map,
-            scale_sample.text_mask,
-        )
-        image_text_scale_map.to_file(out_fd / f'{id}-text-scale.png')
+            image_text_scale_map = visualize_scale_image_score_map(
+                scale_sample.text_scale_map,
+                scale_sample.text_mask,
+            )
+            writer.write(image_text_scale_map, out_fd / f'{id}-text-scale.png')
 
-        visualize_image_mask(scale_sample.text_mask).to_file(out_fd / f'{id}-text-mask.png')
+            writer.write(
+                visualize_image_mask(scale_sample.text_mask),
+                out_fd / f'{id}-text-mask.png',
+            )
 
-        blend_image_with_image_mask(
-            image_text_scale_map,
-            scale_sample.text_mask,
-            scale_sample.image,
-        ).to_file(out_fd / f'{id}-combined.png')
+            writer.write(
+                blend_image_with_image_mask(
+                    image_text_scale_map,
+                    scale_sample.text_mask,
+                    scale_sample.image,
+                ),
+                out_fd / f'{id}-combined.png',
+            )